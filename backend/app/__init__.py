@@ -1,8 +1,29 @@
 from flask import Flask
 from flask_cors import CORS
+from werkzeug.middleware.proxy_fix import ProxyFix
 import os
 import importlib
 
+# Blueprints served by each worker role. Running a fleet with a narrower
+# role keeps it from importing stacks it never uses, e.g. document workers
+# never load the face verification code.
+WORKER_ROLES = {
+    'all': ['video_routes', 'document_routes', 'loan_routes', 'application_routes', 'admin_routes'],
+    'documents': ['document_routes', 'admin_routes'],
+    'video': ['video_routes', 'admin_routes'],
+    'loan': ['loan_routes', 'admin_routes'],
+}
+
+def _admission_limits(prefix, default_concurrency):
+    """Read the admission limits of a workload from the environment"""
+    concurrency = int(os.environ.get(f'{prefix}_CONCURRENCY', default_concurrency))
+    return {
+        'concurrency': concurrency,
+        'queue_size': int(os.environ.get(f'{prefix}_QUEUE_SIZE', concurrency * 4)),
+        'tenant_queue_size': int(os.environ.get('ADMISSION_TENANT_QUEUE_SIZE', 4)),
+        'max_wait': float(os.environ.get('ADMISSION_MAX_WAIT_SECONDS', 20)),
+    }
+
 def create_app(test_config=None):
     # Create and configure the app
     app = Flask(__name__, instance_relative_config=True)
@@ -23,9 +44,45 @@ def create_app(test_config=None):
     # Default configuration
     app.config.from_mapping(
         SECRET_KEY=os.environ.get('SECRET_KEY', 'dev_key_change_in_production'),
+        IDENTITY_HMAC_KEY=os.environ.get('IDENTITY_HMAC_KEY', 'dev_identity_key_change_in_production'),
         UPLOAD_FOLDER=os.path.join(app.root_path, '../static/uploads'),
         VIDEO_FOLDER=os.path.join(app.root_path, '../static/videos'),
+        DATABASE=os.path.join(app.instance_path, 'loanly.sqlite'),
+        # Where uploads are kept: 'local' (the folders above) or 's3', so any
+        # node can serve any upload. With 's3' the folders only cache files.
+        STORAGE_BACKEND=os.environ.get('STORAGE_BACKEND', 'local'),
+        S3_BUCKET=os.environ.get('S3_BUCKET', ''),
+        S3_ENDPOINT_URL=os.environ.get('S3_ENDPOINT_URL', ''),  # e.g. MinIO
+        S3_REGION=os.environ.get('S3_REGION', ''),
+        S3_MAX_CONNECTIONS=int(os.environ.get('S3_MAX_CONNECTIONS', 10)),
+        STORAGE_CACHE_SECONDS=int(os.environ.get('STORAGE_CACHE_SECONDS', 24 * 3600)),
         MAX_CONTENT_LENGTH=16 * 1024 * 1024,  # Max 16 MB uploads
+        MAX_VIDEO_UPLOAD_LENGTH=int(os.environ.get('MAX_VIDEO_UPLOAD_LENGTH', 200 * 1024 * 1024)),  # Chunked uploads
+        OCR_MIN_CONFIDENCE=float(os.environ.get('OCR_MIN_CONFIDENCE', 0)),
+        UPLOAD_RETENTION_DAYS=float(os.environ.get('UPLOAD_RETENTION_DAYS', 0)),  # 0 keeps uploads forever
+        IDEMPOTENCY_TTL_SECONDS=int(os.environ.get('IDEMPOTENCY_TTL_SECONDS', 24 * 3600)),
+        IDEMPOTENCY_WAIT_SECONDS=int(os.environ.get('IDEMPOTENCY_WAIT_SECONDS', 120)),
+        # Requests are queued per tenant: the subject of a bearer token signed
+        # with JWT_SECRET_KEY, or the client IP. Behind a load balancer, set
+        # TRUSTED_PROXY_COUNT so the IP is read from X-Forwarded-For.
+        JWT_SECRET_KEY=os.environ.get('JWT_SECRET_KEY', ''),
+        JWT_ALGORITHMS=['HS256'],
+        TRUSTED_PROXY_COUNT=int(os.environ.get('TRUSTED_PROXY_COUNT', 0)),
+        # Concurrent OCR and face runs across all workers, and how many may wait
+        ADMISSION_LIMITS={
+            'ocr': _admission_limits('OCR', os.cpu_count() or 1),
+            'face': _admission_limits('FACE', max(1, (os.cpu_count() or 1) // 2)),
+        },
+        # Request profiling: a sample of requests (or ones sent with the
+        # X-Profile: <PROFILE_TOKEN> header) have their stacks sampled, and
+        # slow ones are kept for /api/admin/profiles
+        PROFILE_TOKEN=os.environ.get('PROFILE_TOKEN', ''),
+        PROFILE_SAMPLE_RATE=float(os.environ.get('PROFILE_SAMPLE_RATE', 0)),
+        PROFILE_SLOW_SECONDS=float(os.environ.get('PROFILE_SLOW_SECONDS', 5)),
+        PROFILE_INTERVAL_MS=float(os.environ.get('PROFILE_INTERVAL_MS', 5)),
+        PROFILE_FOLDER=os.path.join(app.instance_path, 'profiles'),
+        WORKER_ROLE=os.environ.get('WORKER_ROLE', 'all'),
+        PRELOAD_MODELS=os.environ.get('PRELOAD_MODELS', '0') == '1',
     )
     
     if test_config is None:
@@ -35,27 +92,51 @@ def create_app(test_config=None):
         # Load the test config if passed in
         app.config.from_mapping(test_config)
     
-    # Import and register blueprints
-    try:
-        from app.routes import video_routes
-        app.register_blueprint(video_routes.bp)
-    except Exception as e:
-        print(f"Warning: Could not register video routes: {e}")
+    if app.config['TRUSTED_PROXY_COUNT']:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['TRUSTED_PROXY_COUNT'])
     
-    try:
-        from app.routes import document_routes
-        app.register_blueprint(document_routes.bp)
-    except Exception as e:
-        print(f"Warning: Could not register document routes: {e}")
+    from app import db, cli
+    from app.utils import profiling
+    db.init_app(app)
+    cli.init_app(app)
+    profiling.init_app(app)
     
-    try:
-        from app.routes import loan_routes
-        app.register_blueprint(loan_routes.bp)
-    except Exception as e:
-        print(f"Warning: Could not register loan routes: {e}")
+    role = app.config['WORKER_ROLE']
+    if role not in WORKER_ROLES:
+        raise ValueError(f"Unknown WORKER_ROLE '{role}'. Expected one of: {', '.join(WORKER_ROLES)}")
+    
+    # Import and register blueprints for this worker role
+    for module_name in WORKER_ROLES[role]:
+        try:
+            module = importlib.import_module(f'app.routes.{module_name}')
+            app.register_blueprint(module.bp)
+        except Exception as e:
+            print(f"Warning: Could not register {module_name.replace('_', ' ')}: {e}")
+    
+    # Face workers can load the ML stack at startup instead of on the first request
+    if app.config['PRELOAD_MODELS'] and 'video_routes' in WORKER_ROLES[role]:
+        from app.services.face_verification import warm_up_deepface, get_face_recognizer
+        warm_up_deepface()
+        get_face_recognizer()
     
     @app.route('/health')
     def health_check():
-        return {'status': 'healthy'}
+        return {'status': 'healthy', 'role': role}
+    
+    @app.route('/health/admission')
+    def admission_status():
+        from app.db import get_db
+        from app.utils.admission import get_admission_status
+        return get_admission_status(get_db())
+    
+    @app.route('/health/ocr')
+    def ocr_tier_status():
+        from app.db import get_db
+        from app.services.document_processor import get_model_tiers
+        from app.services.ocr_store import get_ocr_tier_stats
+        return {
+            'tiers': [tier['name'] for tier in get_model_tiers()],
+            'stats': get_ocr_tier_stats(get_db())
+        }
     
     return app 
\ No newline at end of file
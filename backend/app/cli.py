@@ -0,0 +1,343 @@
+import os
+import json
+import click
+from concurrent.futures import ProcessPoolExecutor
+
+from flask import current_app
+from flask.cli import with_appcontext
+
+from app.utils.concurrency import bounded_map, ordered_map
+from app.services.blob_store import BLOB_DIR, GC_GRACE_SECONDS, expire_references, collect_garbage
+from app.services.storage import get_storage, UPLOADS
+
+# Uploads from before content-addressed storage are saved as
+# <document_id>_<timestamp>_<original name>
+DOCUMENT_ID_LENGTH = 36
+
+DOCUMENT_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.pdf')
+
+def iter_uploads(db, storage, document_ids=None):
+    """Yield (document_id, path) for every uploaded document, fetching remote ones
+
+    If document_ids is given, other documents are left out before anything is fetched.
+    """
+    upload_folder = storage.folders[UPLOADS]
+    # Blobs stored before the storage backends are recorded by absolute path
+    blob_dir = os.path.join(os.path.abspath(upload_folder), BLOB_DIR)
+    rows = db.execute(
+        'SELECT blob_refs.ref_id, blobs.path FROM blob_refs JOIN blobs ON blobs.hash = blob_refs.hash'
+    ).fetchall()
+    for row in rows:
+        if document_ids is not None and row['ref_id'] not in document_ids:
+            continue
+        if row['path'].startswith(f"{UPLOADS}/") or os.path.abspath(row['path']).startswith(blob_dir):
+            if storage.exists(row['path']):
+                yield row['ref_id'], storage.local_path(row['path'])
+
+    with os.scandir(upload_folder) as entries:
+        for entry in entries:
+            if entry.is_file() and entry.name.lower().endswith(DOCUMENT_EXTENSIONS):
+                if document_ids is None or entry.name[:DOCUMENT_ID_LENGTH] in document_ids:
+                    yield entry.name[:DOCUMENT_ID_LENGTH], entry.path
+
+def _extract_identifiers(task):
+    """Worker: OCR an upload as its document type and return the identifiers found in it"""
+    from app.services.document_processor import run_ocr, extract_document_data, is_document_valid
+    from app.services.pdf_processor import is_pdf_file, extract_pdf_text
+    from app.services.identity_index import get_identifiers
+
+    document_id, path, doc_type = task
+    try:
+        if is_pdf_file(path):
+            text, _ = extract_pdf_text(path)
+            extracted_data = extract_document_data(text, doc_type)
+        else:
+            text, extracted_data = run_ocr(path, doc_type)
+    except Exception as e:
+        print(f"OCR failed for {path}: {e}")
+        return document_id, {}
+
+    # Uploads only index the identifiers of documents that passed validation
+    if not is_document_valid(text, doc_type, extracted_data):
+        return document_id, {}
+    return document_id, get_identifiers(extracted_data)
+
+@click.command('rebuild-identity-index')
+@click.option('--workers', default=os.cpu_count() or 1, show_default=True, help='Number of OCR processes')
+@with_appcontext
+def rebuild_identity_index_command(workers):
+    """Rebuild the duplicate identity index from the stored documents
+
+    Documents are indexed from the fields stored with their OCR. Only
+    uploads from before OCR was stored are OCRed again, as the document
+    type of their application; those of unknown type are skipped.
+    """
+    from app.db import get_db
+    from app.services.identity_index import get_identifiers, index_identifiers
+
+    db = get_db()
+    key = current_app.config['IDENTITY_HMAC_KEY']
+
+    documents = {
+        row['document_id']: (row['application_id'], row['doc_type'])
+        for row in db.execute('SELECT document_id, application_id, doc_type FROM application_documents')
+    }
+
+    db.execute('DELETE FROM identity_index')
+
+    scanned = indexed = 0
+    stored = set()
+    for row in db.execute('SELECT document_id, is_valid, extracted_data FROM document_ocr').fetchall():
+        stored.add(row['document_id'])
+        scanned += 1
+        if row['is_valid'] and row['extracted_data']:
+            identifiers = get_identifiers(json.loads(row['extracted_data']) or {})
+            index_identifiers(db, key, identifiers, row['document_id'],
+                              documents.get(row['document_id'], (None, None))[0])
+            indexed += len(identifiers)
+    db.commit()
+    click.echo(f"Indexed {indexed} identifiers from {scanned} stored documents")
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        uploads = iter_uploads(db, get_storage(), set(documents) - stored)
+        tasks = ((document_id, path, documents[document_id][1]) for document_id, path in uploads)
+        for document_id, identifiers in bounded_map(executor, _extract_identifiers, tasks, workers * 2):
+            scanned += 1
+            index_identifiers(db, key, identifiers, document_id, documents[document_id][0])
+            indexed += len(identifiers)
+
+            # Commit in batches so an interrupted rebuild keeps its progress
+            if scanned % 100 == 0:
+                db.commit()
+                click.echo(f"Scanned {scanned} uploads, indexed {indexed} identifiers")
+
+    db.commit()
+    click.echo(f"Done: scanned {scanned} uploads, indexed {indexed} identifiers")
+
+@click.command('sweep-uploads')
+@click.option('--retention-days', type=float, default=None,
+              help='Drop uploads older than this many days (default: UPLOAD_RETENTION_DAYS, 0 keeps them)')
+@click.option('--grace-seconds', default=GC_GRACE_SECONDS, show_default=True,
+              help='Keep unreferenced files younger than this')
+@with_appcontext
+def sweep_uploads_command(retention_days, grace_seconds):
+    """Apply upload retention and delete files no upload refers to
+
+    Meant to run periodically, e.g. from cron, next to the web workers.
+    """
+    from app.db import get_db
+    from app.services.face_cache import get_face_cache_path
+    from app.services.chunked_upload import expire_uploads
+    from app.services.face_gallery import get_face_gallery, COMPACTION_RATIO
+    from app.services.video_proxy import delete_video_proxy
+    from app.utils.shared_images import sweep_shared_images
+
+    db = get_db()
+    storage = get_storage()
+    abandoned = expire_uploads(db, current_app.config['VIDEO_FOLDER'])
+    if retention_days is None:
+        retention_days = current_app.config['UPLOAD_RETENTION_DAYS']
+
+    expired = []
+    if retention_days > 0:
+        expired = expire_references(db, storage, retention_days)
+
+        # Face crops and proxies of expired videos go with them
+        for ref_id in expired:
+            cache_path = get_face_cache_path(current_app.config['VIDEO_FOLDER'], ref_id)
+            if os.path.exists(cache_path):
+                os.unlink(cache_path)
+            delete_video_proxy(current_app.config['VIDEO_FOLDER'], ref_id)
+
+    # Deleted faces stay in the gallery file until enough of them pile up
+    gallery = get_face_gallery(current_app.config['VIDEO_FOLDER'])
+    gallery.remove(expired)
+    gallery_stats = gallery.stats()
+    compacted = 0
+    if gallery_stats['deleted_rows'] > gallery_stats['rows'] * COMPACTION_RATIO:
+        compacted = gallery.compact()
+
+    deleted, freed = collect_garbage(db, storage, grace_seconds)
+
+    # Local copies of remote files not read for a while
+    trimmed = storage.trim_cache(current_app.config['STORAGE_CACHE_SECONDS'])
+
+    # Images shared with OCR workers that died before giving them back
+    leftover = sweep_shared_images(grace_seconds)
+    click.echo(f"Expired {len(expired)} uploads and {abandoned} unfinished chunked uploads, "
+               f"deleted {deleted} files ({freed} bytes) and {leftover} leftover shared images, "
+               f"compacted {compacted} gallery rows, trimmed {trimmed} cached files")
+
+def _underwrite_chunk(frame):
+    """Worker: underwrite one chunk of an application file"""
+    from app.services.batch_underwriting import underwrite_frame
+
+    return underwrite_frame(frame)
+
+@click.command('underwrite')
+@click.argument('input_path', type=click.Path(exists=True, dir_okay=False))
+@click.argument('output_path', type=click.Path(dir_okay=False))
+@click.option('--chunk-size', default=50000, show_default=True, help='Applications per chunk')
+@click.option('--workers', default=os.cpu_count() or 1, show_default=True, help='Number of scoring processes')
+def underwrite_command(input_path, output_path, chunk_size, workers):
+    """Validate documents and score loans for a CSV/Parquet file of applications
+
+    Rows are read, scored and written in chunks, so memory stays bounded
+    whatever the size of the file. Results keep the order of the input.
+    """
+    from app.services.batch_underwriting import iter_application_chunks, ResultWriter
+
+    writer = ResultWriter(output_path)
+    rows = 0
+    counts = {}
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            chunks = iter_application_chunks(input_path, chunk_size)
+            # Chunks finish out of order; they are taken in input order, with
+            # at most workers * 2 chunks read, running or waiting to be written
+            for result in ordered_map(executor, _underwrite_chunk, chunks, workers * 2):
+                writer.write(result)
+                rows += len(result)
+                for status, count in result['status'].value_counts().items():
+                    counts[status] = counts.get(status, 0) + int(count)
+                click.echo(f"Underwrote {rows} applications")
+    finally:
+        writer.close()
+
+    summary = ', '.join(f"{count} {status}" for status, count in sorted(counts.items()))
+    click.echo(f"Done: {rows} applications ({summary or 'none'}) written to {output_path}")
+
+def _reextract_document(task):
+    """Worker: re-extract a document from its stored OCR, or OCR it again"""
+    from app.services.ocr_store import decode_ocr_record, needs_ocr, reextract_document
+    from app.services.document_processor import process_document
+
+    record, path, reocr_invalid = task
+    record = decode_ocr_record(record)
+
+    try:
+        if not needs_ocr(record):
+            text, is_valid, extracted_data = reextract_document(record)
+            if is_valid or not reocr_invalid:
+                return record['document_id'], (text, is_valid, extracted_data, None)
+
+        # The stored text is outdated, or the attempts run at upload time
+        # were not enough under the current rules
+        if path is None:
+            return record['document_id'], None
+        ocr_record = {}
+        text, is_valid, extracted_data = process_document(path, record['doc_type'], record['min_confidence'], ocr_record)
+        return record['document_id'], (text, is_valid, extracted_data, ocr_record)
+    except Exception as e:
+        print(f"Re-extraction failed for {record['document_id']}: {e}")
+        return record['document_id'], None
+
+@click.command('reextract-documents')
+@click.option('--workers', default=os.cpu_count() or 1, show_default=True, help='Number of extraction processes')
+@click.option('--batch-size', default=500, show_default=True, help='Documents per checkpoint')
+@click.option('--restart', is_flag=True, help='Ignore the checkpoint of an interrupted run')
+@click.option('--reocr-invalid', is_flag=True, help='OCR documents again if they are invalid under the current rules')
+@with_appcontext
+def reextract_documents_command(workers, batch_size, restart, reocr_invalid):
+    """Apply the current extraction and validation rules to all stored documents
+
+    Documents are re-extracted from their stored OCR text; only those
+    OCRed with an older image pipeline are OCRed again. Progress is saved
+    after every batch, and an interrupted run continues where it stopped.
+    """
+    from app.db import get_db
+    from app.services.ocr_store import save_ocr_record, needs_ocr
+    from app.services.identity_index import get_identifiers, index_identifiers
+    from app.services.blob_store import resolve_upload
+    from app.services.storage import get_storage, UPLOADS
+
+    db = get_db()
+    key = current_app.config['IDENTITY_HMAC_KEY']
+    storage = get_storage()
+    checkpoint_name = 'reextract-documents'
+
+    if restart:
+        db.execute('DELETE FROM backfill_checkpoints WHERE name = ?', (checkpoint_name,))
+        db.commit()
+    row = db.execute('SELECT last_document_id FROM backfill_checkpoints WHERE name = ?', (checkpoint_name,)).fetchone()
+    last_document_id = row['last_document_id'] if row else ''
+    if last_document_id:
+        click.echo(f"Resuming after document {last_document_id}")
+
+    processed = changed = reocred = failed = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        while True:
+            batch = [dict(row) for row in db.execute(
+                'SELECT * FROM document_ocr WHERE document_id > ? ORDER BY document_id LIMIT ?',
+                (last_document_id, batch_size)
+            )]
+            if not batch:
+                break
+
+            tasks = []
+            for record in batch:
+                # Only fetch files of documents that may need OCR
+                path = None
+                if needs_ocr(record) or (reocr_invalid and not record['is_valid']):
+                    document_key = resolve_upload(db, storage, UPLOADS, record['document_id'])
+                    if document_key is not None:
+                        path = storage.local_path(document_key)
+                tasks.append((record, path, reocr_invalid))
+
+            records = {record['document_id']: record for record in batch}
+            for document_id, result in executor.map(_reextract_document, tasks, chunksize=max(1, batch_size // (workers * 4))):
+                processed += 1
+                if result is None:
+                    failed += 1
+                    continue
+
+                text, is_valid, extracted_data, ocr_record = result
+                record = records[document_id]
+                if ocr_record is not None:
+                    reocred += 1
+                    save_ocr_record(db, document_id, record['doc_type'], ocr_record, text, is_valid,
+                                    extracted_data, record['min_confidence'])
+                else:
+                    db.execute(
+                        'UPDATE document_ocr SET text = ?, is_valid = ?, extracted_data = ?,'
+                        ' updated_at = CURRENT_TIMESTAMP WHERE document_id = ?',
+                        (text, int(bool(is_valid)), json.dumps(extracted_data), document_id)
+                    )
+
+                if json.dumps(extracted_data) == record['extracted_data'] and bool(is_valid) == bool(record['is_valid']):
+                    continue
+                changed += 1
+
+                # Bring the cross-checks and the identity index in line with the new fields
+                db.execute(
+                    'UPDATE application_documents SET extracted_data = ?, updated_at = CURRENT_TIMESTAMP'
+                    ' WHERE document_id = ?',
+                    (json.dumps(extracted_data), document_id)
+                )
+                application = db.execute(
+                    'SELECT application_id FROM application_documents WHERE document_id = ?', (document_id,)
+                ).fetchone()
+                db.execute('DELETE FROM identity_index WHERE document_id = ?', (document_id,))
+                if is_valid:
+                    index_identifiers(db, key, get_identifiers(extracted_data or {}), document_id,
+                                      application['application_id'] if application else None)
+
+            last_document_id = batch[-1]['document_id']
+            db.execute(
+                'INSERT OR REPLACE INTO backfill_checkpoints (name, last_document_id) VALUES (?, ?)',
+                (checkpoint_name, last_document_id)
+            )
+            db.commit()
+            click.echo(f"Processed {processed} documents: {changed} changed, {reocred} OCRed again, {failed} failed")
+
+    db.execute('DELETE FROM backfill_checkpoints WHERE name = ?', (checkpoint_name,))
+    db.commit()
+    click.echo(f"Done: processed {processed} documents, {changed} changed, {reocred} OCRed again, {failed} failed")
+
+def init_app(app):
+    """Register command line commands with the app"""
+    app.cli.add_command(rebuild_identity_index_command)
+    app.cli.add_command(sweep_uploads_command)
+    app.cli.add_command(underwrite_command)
+    app.cli.add_command(reextract_documents_command)
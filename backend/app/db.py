@@ -0,0 +1,182 @@
+import sqlite3
+import os
+
+from flask import current_app, g
+
+# Tables are created on first connection so a fresh instance folder works
+# without a separate setup step
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS application_documents (
+    application_id TEXT NOT NULL,
+    doc_type TEXT NOT NULL,
+    document_id TEXT NOT NULL,
+    extracted_data TEXT NOT NULL,
+    updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (application_id, doc_type)
+);
+
+CREATE TABLE IF NOT EXISTS consistency_checks (
+    application_id TEXT NOT NULL,
+    check_name TEXT NOT NULL,
+    input_hash TEXT NOT NULL,
+    result TEXT NOT NULL,
+    PRIMARY KEY (application_id, check_name)
+);
+
+CREATE TABLE IF NOT EXISTS application_videos (
+    application_id TEXT NOT NULL,
+    role TEXT NOT NULL,
+    video_id TEXT NOT NULL,
+    updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (application_id, role)
+);
+
+CREATE TABLE IF NOT EXISTS pipeline_results (
+    application_id TEXT NOT NULL,
+    node TEXT NOT NULL,
+    input_hash TEXT NOT NULL,
+    result TEXT NOT NULL,
+    updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (application_id, node)
+);
+
+CREATE TABLE IF NOT EXISTS identity_index (
+    identifier_type TEXT NOT NULL,
+    identifier_hash TEXT NOT NULL,
+    document_id TEXT NOT NULL,
+    application_id TEXT,
+    created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (identifier_type, identifier_hash, document_id)
+);
+
+CREATE TABLE IF NOT EXISTS blobs (
+    hash TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    refcount INTEGER NOT NULL DEFAULT 0,
+    last_referenced_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS blob_refs (
+    ref_id TEXT PRIMARY KEY,
+    hash TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS blob_refs_hash ON blob_refs (hash);
+
+CREATE TABLE IF NOT EXISTS idempotent_requests (
+    scope TEXT NOT NULL,
+    tenant TEXT NOT NULL,
+    idempotency_key TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    status TEXT NOT NULL,
+    status_code INTEGER,
+    headers TEXT,
+    body BLOB,
+    locked_at REAL NOT NULL,
+    expires_at REAL NOT NULL,
+    PRIMARY KEY (scope, tenant, idempotency_key)
+);
+
+CREATE INDEX IF NOT EXISTS idempotent_requests_expires_at ON idempotent_requests (expires_at);
+
+CREATE TABLE IF NOT EXISTS video_uploads (
+    upload_id TEXT PRIMARY KEY,
+    filename TEXT NOT NULL,
+    length INTEGER NOT NULL,
+    received INTEGER NOT NULL DEFAULT 0,
+    baseline_video_id TEXT,
+    status TEXT NOT NULL DEFAULT 'open',
+    result TEXT,
+    locked_at REAL,
+    created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS document_ocr (
+    document_id TEXT PRIMARY KEY,
+    doc_type TEXT NOT NULL,
+    source TEXT NOT NULL,
+    pipeline_version INTEGER NOT NULL,
+    min_confidence REAL NOT NULL DEFAULT 0,
+    attempts BLOB NOT NULL,
+    text TEXT NOT NULL,
+    is_valid INTEGER NOT NULL,
+    extracted_data TEXT,
+    updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS ocr_tier_stats (
+    model TEXT PRIMARY KEY,
+    documents INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    resolved INTEGER NOT NULL DEFAULT 0,
+    unresolved INTEGER NOT NULL DEFAULT 0,
+    total_seconds REAL NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS backfill_checkpoints (
+    name TEXT PRIMARY KEY,
+    last_document_id TEXT NOT NULL,
+    updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS admission_tickets (
+    ticket TEXT PRIMARY KEY,
+    workload TEXT NOT NULL,
+    tenant TEXT NOT NULL,
+    state TEXT NOT NULL,
+    enqueued_at REAL NOT NULL,
+    started_at REAL,
+    heartbeat_at REAL NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS admission_tickets_workload ON admission_tickets (workload, state);
+
+CREATE TABLE IF NOT EXISTS admission_stats (
+    workload TEXT PRIMARY KEY,
+    admitted INTEGER NOT NULL DEFAULT 0,
+    rejected INTEGER NOT NULL DEFAULT 0,
+    completed INTEGER NOT NULL DEFAULT 0,
+    total_wait REAL NOT NULL DEFAULT 0,
+    max_wait REAL NOT NULL DEFAULT 0,
+    total_run REAL NOT NULL DEFAULT 0
+);
+"""
+
+def connect(database_path):
+    """
+    Open a SQLite connection with the schema in place
+
+    Args:
+        database_path (str): Path to the SQLite database file
+
+    Returns:
+        sqlite3.Connection: Connection returning rows as sqlite3.Row
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(database_path)), exist_ok=True)
+
+    db = sqlite3.connect(database_path, timeout=30)
+    db.row_factory = sqlite3.Row
+
+    # WAL lets several workers read while one of them writes
+    db.execute('PRAGMA journal_mode=WAL')
+    db.executescript(SCHEMA)
+    return db
+
+def get_db():
+    """Get the database connection for the current request"""
+    if 'db' not in g:
+        g.db = connect(current_app.config['DATABASE'])
+    return g.db
+
+def close_db(e=None):
+    """Close the database connection at the end of the request"""
+    db = g.pop('db', None)
+    if db is not None:
+        db.close()
+
+def init_app(app):
+    """Register database handling with the app"""
+    app.teardown_appcontext(close_db)
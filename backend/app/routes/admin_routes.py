@@ -0,0 +1,48 @@
+from flask import Blueprint, request, current_app, jsonify, send_from_directory, abort
+import hmac
+import re
+
+from app.utils.profiling import list_profiles, get_profile_folder
+
+bp = Blueprint('admin', __name__, url_prefix='/api/admin')
+
+# Header carrying PROFILE_TOKEN on admin requests
+ADMIN_TOKEN_HEADER = 'X-Admin-Token'
+
+@bp.before_request
+def require_admin_token():
+    """Hide the admin endpoints unless a token is configured and given"""
+    token = current_app.config['PROFILE_TOKEN']
+    if not token:
+        abort(404)
+    if not hmac.compare_digest(request.headers.get(ADMIN_TOKEN_HEADER, ''), token):
+        return jsonify({'error': 'Invalid admin token'}), 403
+
+@bp.route('/profiles', methods=['GET'])
+def get_profiles():
+    """
+    List captured request profiles, newest first
+
+    Optional query parameters 'path' and 'doc_type' filter the list.
+    """
+    profiles = list_profiles(get_profile_folder())
+
+    path = request.args.get('path')
+    if path:
+        profiles = [profile for profile in profiles if profile['path'].startswith(path)]
+    doc_type = request.args.get('doc_type')
+    if doc_type:
+        profiles = [profile for profile in profiles if profile['tags'].get('doc_type') == doc_type]
+
+    return jsonify({'profiles': profiles, 'status': 'success'}), 200
+
+@bp.route('/profiles/<profile_id>', methods=['GET'])
+def download_profile(profile_id):
+    """
+    Download the collapsed stacks of a profile, for flamegraph.pl or speedscope
+    """
+    if not re.fullmatch(r'[0-9_a-f]+', profile_id):
+        return jsonify({'error': 'Profile not found'}), 404
+
+    return send_from_directory(get_profile_folder(), f'{profile_id}.collapsed',
+                               mimetype='text/plain', as_attachment=True)
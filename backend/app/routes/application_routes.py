@@ -0,0 +1,133 @@
+from flask import Blueprint, request, current_app, jsonify, Response, stream_with_context
+import json
+
+from app.services.application_pipeline import (
+    build_application_graph, run_graph, record_application_video, has_application_inputs,
+    BASELINE_VIDEO, VERIFICATION_VIDEO, LOAN_TERMS
+)
+from app.services.blob_store import resolve_upload
+from app.services.loan_engine import MAX_TENURE_MONTHS
+from app.services.storage import get_storage, VIDEOS
+from app.routes.loan_routes import _number
+from app.utils.admission import get_tenant
+from app.db import get_db
+
+bp = Blueprint('application', __name__, url_prefix='/api/applications')
+
+# Range of each loan term, as checked by /api/loan/decision
+TERM_RANGES = {
+    'loan_amount': {'minimum': 1},
+    'monthly_income': {'minimum': 0, 'positive': True},
+    'existing_emis': {'minimum': 0},
+    'credit_score': {'minimum': 300, 'maximum': 900},
+    'tenure_months': {'minimum': 1, 'maximum': MAX_TENURE_MONTHS, 'integer': True},
+    'annual_rate': {'minimum': 0, 'maximum': 100},
+    'employment_years': {'minimum': 0},
+}
+
+def _read_terms(data):
+    """
+    Read the loan terms given to the decision node
+
+    Terms are optional, but those given must be in range.
+
+    Raises:
+        ValueError: If a term is not a number or out of range
+    """
+    terms = {}
+    for field in LOAN_TERMS:
+        value = data.get(field)
+        if value is None or value == '':
+            continue
+        terms[field] = _number(data, field, **TERM_RANGES[field])
+    return terms
+
+@bp.route('/<application_id>/videos', methods=['POST'])
+def link_application_videos(application_id):
+    """
+    Attach videos to an application, for uploads made without its id
+
+    Expects JSON with 'baseline_video_id' and/or 'video_id' (the
+    verification video), e.g. after a chunked upload.
+    """
+    data = request.get_json(silent=True) or {}
+    db = get_db()
+    storage = get_storage()
+
+    videos = [(role, data.get(field)) for role, field in ((BASELINE_VIDEO, 'baseline_video_id'),
+                                                          (VERIFICATION_VIDEO, 'video_id'))
+              if data.get(field)]
+    if not videos:
+        return jsonify({'error': 'Missing baseline_video_id or video_id'}), 400
+
+    for role, video_id in videos:
+        if resolve_upload(db, storage, VIDEOS, video_id) is None:
+            return jsonify({'error': f'Video {video_id} not found'}), 404
+    for role, video_id in videos:
+        record_application_video(db, application_id, role, video_id)
+
+    return jsonify({'application_id': application_id, 'status': 'success'}), 200
+
+@bp.route('/<application_id>/pipeline', methods=['POST'])
+def run_application_pipeline(application_id):
+    """
+    Process an application: extraction of each document, face verification,
+    cross-checks and the loan decision
+
+    Expects optional JSON with the loan terms of /api/loan/decision; the
+    decision is skipped without them. Results are memoized, so after a
+    re-upload only the nodes depending on it run again. OCR and face nodes
+    share the admission limits of their routes; when one isn't admitted the
+    response is 503 with Retry-After. With ?stream=1 the response is NDJSON,
+    one line per node as it finishes, then a summary.
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        terms = _read_terms(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    db = get_db()
+    if not has_application_inputs(db, application_id):
+        return jsonify({'error': 'No documents or videos found for application'}), 404
+
+    nodes = build_application_graph(db, get_storage(), current_app.config['VIDEO_FOLDER'], application_id, terms)
+    events = run_graph(db, application_id, nodes, get_tenant())
+
+    if request.args.get('stream') == '1':
+        def generate():
+            recomputed = []
+            for event in events:
+                if event['status'] == 'done':
+                    recomputed.append(event['node'])
+                yield json.dumps(event) + '\n'
+            yield json.dumps({'node': None, 'status': 'complete', 'recomputed': recomputed}) + '\n'
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+    results = {}
+    recomputed = []
+    retry_after = 0
+    for event in events:
+        results[event['node']] = {'status': event['status'], 'result': event['result']}
+        if event['status'] == 'done':
+            recomputed.append(event['node'])
+        elif event['status'] == 'error':
+            retry_after = max(retry_after, event['result'].get('retry_after', 0))
+
+    if retry_after:
+        # Some nodes were not admitted; what did run is memoized for the retry
+        return jsonify({
+            'application_id': application_id,
+            'nodes': results,
+            'recomputed': recomputed,
+            'error': 'Too many OCR or face verification requests',
+            'status': 'error',
+            'retry_after': retry_after
+        }), 503, {'Retry-After': str(retry_after)}
+
+    return jsonify({
+        'application_id': application_id,
+        'nodes': results,
+        'recomputed': recomputed,
+        'status': 'success'
+    }), 200
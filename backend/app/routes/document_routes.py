@@ -10,10 +10,21 @@ import re
 from app.services.document_processor import process_document, extract_document_data
 from app.utils.validators import validate_aadhaar, validate_pan, validate_document_data
 from app.utils.get_mime_type import get_mime_type
+from app.services.consistency_checker import record_document, check_application_consistency
+from app.services.identity_index import find_duplicates, record_identifiers
+from app.services.blob_store import store_blob, resolve_upload
+from app.services.storage import get_storage, UPLOADS
+from app.services.ocr_store import (
+    save_ocr_record, load_ocr_record, needs_ocr, reextract_document, record_ocr_tiers
+)
+from app.utils.idempotency import idempotent
+from app.utils.admission import admission_controlled
+from app.utils.profiling import add_profile_tags
+from app.db import get_db
 
 bp = Blueprint('document', __name__, url_prefix='/api/document')
 
-ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg'}
+ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'pdf'}
 
 def allowed_file(filename):
     """Check if the file has an allowed extension"""
@@ -21,6 +32,8 @@ def allowed_file(filename):
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 @bp.route('/upload', methods=['POST'])
+@idempotent('document-upload')
+@admission_controlled('ocr')
 def upload_document():
     """
     Upload a document image and process it with OCR
@@ -32,7 +45,7 @@ def upload_document():
     response_headers = {
         'Access-Control-Allow-Origin': '*',
         'Access-Control-Allow-Methods': 'POST, OPTIONS',
-        'Access-Control-Allow-Headers': 'Content-Type'
+        'Access-Control-Allow-Headers': 'Content-Type, Idempotency-Key'
     }
     
     # Handle preflight OPTIONS request
@@ -44,6 +57,12 @@ def upload_document():
     
     file = request.files['document']
     doc_type = request.form['type']
+    application_id = request.form.get('application_id')
+    
+    try:
+        min_confidence = float(request.form.get('min_confidence', current_app.config['OCR_MIN_CONFIDENCE']))
+    except ValueError:
+        return jsonify({'error': 'min_confidence must be a number'}), 400, response_headers
     
     print(f"Processing document type: {doc_type}")
     
@@ -51,33 +70,36 @@ def upload_document():
         return jsonify({'error': 'No selected file'}), 400, response_headers
     
     if not allowed_file(file.filename):
-        return jsonify({'error': 'Invalid file format. Allowed formats: png, jpg, jpeg'}), 400, response_headers
+        return jsonify({'error': 'Invalid file format. Allowed formats: png, jpg, jpeg, pdf'}), 400, response_headers
     
-    # Verify actual file type
-    file_content = file.read()
-    file.seek(0)
-    mime_type = get_mime_type(file_content)
+    # Verify actual file type from its first bytes, without reading it all
+    mime_type = get_mime_type(file.stream.read(12))
+    file.stream.seek(0)
     
-    if not mime_type.startswith('image/'):
-        return jsonify({'error': 'Invalid file type. Must be an image'}), 400, response_headers
-    
-    # Create upload directory if it doesn't exist
-    upload_folder = current_app.config.get('UPLOAD_FOLDER')
-    if not os.path.exists(upload_folder):
-        os.makedirs(upload_folder)
+    if not mime_type.startswith('image/') and mime_type != 'application/pdf':
+        return jsonify({'error': 'Invalid file type. Must be an image or PDF'}), 400, response_headers
     
     # Generate unique filename with timestamp
     timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
     filename = f"{timestamp}_{secure_filename(file.filename)}"
     document_id = str(uuid.uuid4())
     
-    # Save document file
-    file_path = os.path.join(upload_folder, f"{document_id}_{filename}")
-    file.save(file_path)
+    # Save document file; identical content already uploaded is only referenced
+    storage = get_storage()
+    document_key, _ = store_blob(get_db(), storage, UPLOADS, document_id, filename, file.stream)
+    file_path = storage.local_path(document_key)
     
     # Process document with OCR
     try:
-        text, is_valid, extracted_data = process_document(file_path, doc_type)
+        ocr_record = {}
+        text, is_valid, extracted_data = process_document(file_path, doc_type, min_confidence, ocr_record)
+        add_profile_tags(doc_type=doc_type, ocr_source=ocr_record['source'],
+                         ocr_attempts=len(ocr_record['attempts']))
+        
+        # Keep the OCR attempts so rule changes can be applied without OCR
+        db = get_db()
+        save_ocr_record(db, document_id, doc_type, ocr_record, text, is_valid, extracted_data, min_confidence)
+        record_ocr_tiers(db, ocr_record, is_valid)
         
         # Add some debug information
         print(f"Document {doc_type} OCR results:")
@@ -94,11 +116,21 @@ def upload_document():
                 'debug_text': text[:200] + "..." if len(text) > 200 else text  # Include text for debugging
             }), 400, response_headers
         
+        # Keep the extracted fields so documents can be cross-checked
+        if application_id:
+            record_document(db, application_id, doc_type, document_id, extracted_data)
+        
+        # Look for the same Aadhaar/PAN in other applications before indexing this one
+        identity_key = current_app.config['IDENTITY_HMAC_KEY']
+        duplicates = find_duplicates(db, identity_key, extracted_data, application_id)
+        record_identifiers(db, identity_key, extracted_data, document_id, application_id)
+        
         return jsonify({
             'document_id': document_id,
             'status': 'success',
             'text': text,
             'extracted_data': extracted_data,
+            'duplicate_applications': duplicates,
             'message': 'Document processed successfully'
         }), 201, response_headers
     
@@ -139,6 +171,7 @@ def verify_document(doc_type):
     return jsonify(validation_result), 200, response_headers
 
 @bp.route('/documents/<document_id>', methods=['GET', 'OPTIONS'])
+@admission_controlled('ocr')
 def get_document(document_id):
     """
     Get information about a previously uploaded document
@@ -155,21 +188,30 @@ def get_document(document_id):
         return ('', 204, response_headers)
     
     # Find document
-    document_path = None
-    for f in os.listdir(current_app.config['UPLOAD_FOLDER']):
-        if f.startswith(document_id):
-            document_path = os.path.join(current_app.config['UPLOAD_FOLDER'], f)
-            break
+    db = get_db()
+    storage = get_storage()
+    document_key = resolve_upload(db, storage, UPLOADS, document_id)
     
-    if document_path is None:
+    if document_key is None:
         return jsonify({'error': 'Document not found'}), 404, response_headers
     
-    # Get document type from filename (assuming doc type is stored in filename)
-    doc_type = request.args.get('type', 'unknown')
+    # Use the type the document was uploaded as unless another is asked for
+    ocr_record = load_ocr_record(db, document_id)
+    doc_type = request.args.get('type', ocr_record['doc_type'] if ocr_record else 'unknown')
     
-    # Re-process document to get data
+    # Re-extract from the stored OCR text, or re-process the document without it
     try:
-        text, is_valid, extracted_data = process_document(document_path, doc_type)
+        if ocr_record is not None and not needs_ocr(ocr_record):
+            text, is_valid, extracted_data = reextract_document(ocr_record, doc_type)
+            add_profile_tags(doc_type=doc_type, ocr_source='stored', ocr_attempts=0)
+        else:
+            new_record = {}
+            # Only fetched when it has to be OCRed again
+            document_path = storage.local_path(document_key)
+            text, is_valid, extracted_data = process_document(document_path, doc_type, ocr_record=new_record)
+            record_ocr_tiers(db, new_record, is_valid)
+            add_profile_tags(doc_type=doc_type, ocr_source=new_record['source'],
+                             ocr_attempts=len(new_record['attempts']))
         
         return jsonify({
             'document_id': document_id,
@@ -185,6 +227,29 @@ def get_document(document_id):
             'error': str(e)
         }), 500, response_headers
 
+@bp.route('/applications/<application_id>/consistency', methods=['GET', 'OPTIONS'])
+def get_application_consistency(application_id):
+    """
+    Check that the documents uploaded for an application belong to the same person
+    """
+    # Set CORS headers for this route
+    response_headers = {
+        'Access-Control-Allow-Origin': '*',
+        'Access-Control-Allow-Methods': 'GET, OPTIONS',
+        'Access-Control-Allow-Headers': 'Content-Type'
+    }
+    
+    # Handle preflight OPTIONS request
+    if request.method == 'OPTIONS':
+        return ('', 204, response_headers)
+    
+    result = check_application_consistency(get_db(), application_id)
+    
+    if not result['documents']:
+        return jsonify({'error': 'No documents found for application'}), 404, response_headers
+    
+    return jsonify(result), 200, response_headers
+
 @bp.route('/health', methods=['GET', 'OPTIONS'])
 def health_check():
     """
@@ -217,5 +282,6 @@ def health_check():
         'status': 'healthy',
         'ocr_available': tesseract_available,
         'upload_dir_exists': upload_dir_exists,
-        'upload_dir_writable': upload_dir_writable
+        'upload_dir_writable': upload_dir_writable,
+        'storage_backend': current_app.config['STORAGE_BACKEND']
     }), 200, response_headers 
\ No newline at end of file
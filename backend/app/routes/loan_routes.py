@@ -0,0 +1,199 @@
+from flask import Blueprint, request, jsonify
+import math
+import numpy as np
+
+from app.services.loan_engine import (
+    decide, evaluate, emi, amortization_schedule, get_verified_monthly_income,
+    STATUSES, APPROVED, DEFAULT_TENURE_MONTHS, MAX_TENURE_MONTHS
+)
+from app.services.consistency_checker import get_application_documents
+from app.db import get_db
+
+bp = Blueprint('loan', __name__, url_prefix='/api/loan')
+
+# Upper bound on amounts x tenures x rates in one scenarios request
+MAX_SCENARIOS = 100000
+
+def _number(data, field, default=None, minimum=0, maximum=None, integer=False, positive=False):
+    """
+    Read a numeric field from a JSON body
+
+    Raises:
+        ValueError: If the field is missing (without default), out of range,
+                    not a whole number when integer is set, or not above 0
+                    when positive is set
+    """
+    value = data.get(field, default)
+    if value is None or value == '':
+        raise ValueError(f'{field} is required')
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'{field} must be a number')
+    if not math.isfinite(value):
+        raise ValueError(f'{field} must be a number')
+    if value < minimum or (maximum is not None and value > maximum):
+        raise ValueError(f'{field} must be between {minimum} and {maximum}' if maximum is not None
+                         else f'{field} must be at least {minimum}')
+    if integer and not value.is_integer():
+        raise ValueError(f'{field} must be a whole number')
+    if positive and value <= 0:
+        raise ValueError(f'{field} must be more than 0')
+    return value
+
+def _numbers(data, field, minimum=0, maximum=None, integer=False):
+    """Read a non-empty list of numbers from a JSON body"""
+    values = data.get(field)
+    if not isinstance(values, list) or not values:
+        raise ValueError(f'{field} must be a non-empty list of numbers')
+    return np.array([_number({field: value}, field, minimum=minimum, maximum=maximum, integer=integer)
+                     for value in values])
+
+def _get_tax_income(application_id):
+    """Monthly income from the tax papers uploaded for an application, if any"""
+    documents = get_application_documents(get_db(), application_id)
+    for doc_type, extracted_data in documents.items():
+        if 'tax' in doc_type or 'income' in doc_type:
+            income = get_verified_monthly_income(extracted_data)
+            if income is not None:
+                return income
+    return None
+
+@bp.route('/decision', methods=['POST'])
+def loan_decision():
+    """
+    Decide on a loan application
+
+    Expects JSON with 'loan_amount', 'existing_emis', 'credit_score' and
+    'monthly_income', and optionally 'tenure_months', 'annual_rate' (%),
+    'employment_years' and 'application_id'. When the application has tax
+    papers, the income extracted from them is used instead of the declared one.
+    """
+    data = request.get_json(silent=True) or {}
+    application_id = data.get('application_id')
+
+    try:
+        tax_income = _get_tax_income(application_id) if application_id else None
+        monthly_income = tax_income if tax_income is not None else _number(data, 'monthly_income', positive=True)
+        loan_amount = _number(data, 'loan_amount', minimum=1)
+        existing_emis = _number(data, 'existing_emis', default=0)
+        credit_score = _number(data, 'credit_score', minimum=300, maximum=900)
+        tenure_months = _number(data, 'tenure_months', default=DEFAULT_TENURE_MONTHS, minimum=1,
+                                maximum=MAX_TENURE_MONTHS, integer=True)
+        annual_rate = _number(data, 'annual_rate', maximum=100) if data.get('annual_rate') is not None else None
+        employment_years = _number(data, 'employment_years') if data.get('employment_years') is not None else None
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    decision = decide(monthly_income, existing_emis, credit_score, loan_amount,
+                      int(tenure_months), annual_rate, employment_years)
+
+    return jsonify({
+        'decision': decision,
+        'monthly_income': round(monthly_income, 2),
+        'income_source': 'tax_papers' if tax_income is not None else 'declared',
+        'status': 'success'
+    }), 200
+
+@bp.route('/emi', methods=['POST'])
+def loan_emi():
+    """
+    Compute the EMI of a loan, with its amortization schedule if 'schedule' is true
+
+    Expects JSON with 'principal', 'annual_rate' (%) and 'tenure_months'.
+    """
+    data = request.get_json(silent=True) or {}
+
+    try:
+        principal = _number(data, 'principal', minimum=1)
+        annual_rate = _number(data, 'annual_rate', maximum=100)
+        tenure_months = int(_number(data, 'tenure_months', minimum=1, maximum=MAX_TENURE_MONTHS, integer=True))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    schedule = amortization_schedule(principal, annual_rate, tenure_months)
+    total_payment = float(schedule['emi'].sum())
+
+    result = {
+        'emi': round(float(emi(principal, annual_rate, tenure_months)), 2),
+        'total_interest': round(total_payment - principal, 2),
+        'total_payment': round(total_payment, 2),
+        'status': 'success'
+    }
+    if data.get('schedule'):
+        result['schedule'] = [
+            {
+                'month': int(month),
+                'emi': round(float(payment), 2),
+                'interest': round(float(interest), 2),
+                'principal': round(float(paid), 2),
+                'balance': round(float(balance), 2)
+            }
+            for month, payment, interest, paid, balance in zip(
+                schedule['month'], schedule['emi'], schedule['interest'],
+                schedule['principal'], schedule['balance'])
+        ]
+
+    return jsonify(result), 200
+
+@bp.route('/scenarios', methods=['POST'])
+def loan_scenarios():
+    """
+    Score what-if scenarios for one applicant
+
+    Expects JSON with the applicant's 'monthly_income', 'existing_emis' and
+    'credit_score' (or an 'application_id' with tax papers for the income),
+    and lists 'amounts', 'tenures' (months) and optionally 'rates' (%).
+    Every combination is scored; rates default to the applicant's credit band.
+    """
+    data = request.get_json(silent=True) or {}
+    application_id = data.get('application_id')
+
+    try:
+        tax_income = _get_tax_income(application_id) if application_id else None
+        monthly_income = tax_income if tax_income is not None else _number(data, 'monthly_income', positive=True)
+        existing_emis = _number(data, 'existing_emis', default=0)
+        credit_score = _number(data, 'credit_score', minimum=300, maximum=900)
+        amounts = _numbers(data, 'amounts', minimum=1)
+        tenures = _numbers(data, 'tenures', minimum=1, maximum=MAX_TENURE_MONTHS, integer=True)
+        rates = _numbers(data, 'rates', maximum=100) if data.get('rates') is not None else None
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    rate_count = len(rates) if rates is not None else 1
+    if len(amounts) * len(tenures) * rate_count > MAX_SCENARIOS:
+        return jsonify({'error': f'At most {MAX_SCENARIOS} scenarios per request'}), 400
+
+    # Lay the inputs along separate axes so every combination is scored at once
+    result = evaluate(
+        monthly_income, existing_emis, credit_score,
+        amounts[:, None, None], tenures[None, :, None],
+        rates[None, None, :] if rates is not None else None
+    )
+    shape = (len(amounts), len(tenures), rate_count)
+    columns = {key: np.broadcast_to(value, shape).ravel() for key, value in result.items()}
+    grid_amounts = np.broadcast_to(amounts[:, None, None], shape).ravel()
+    grid_tenures = np.broadcast_to(tenures[None, :, None], shape).ravel()
+
+    scenarios = [
+        {
+            'amount': float(amount),
+            'tenure_months': int(tenure),
+            'annual_rate': float(rate),
+            'emi': round(float(payment), 2),
+            'max_eligible_amount': round(float(max_amount), 2),
+            'foir': round(float(foir), 4),
+            'status': str(status)
+        }
+        for amount, tenure, rate, payment, max_amount, foir, status in zip(
+            grid_amounts, grid_tenures, columns['annual_rate'], columns['emi'],
+            columns['max_eligible_amount'], columns['foir'], STATUSES[columns['status']])
+    ]
+
+    return jsonify({
+        'scenarios': scenarios,
+        'approved': int((columns['status'] == APPROVED).sum()),
+        'monthly_income': round(monthly_income, 2),
+        'income_source': 'tax_papers' if tax_income is not None else 'declared',
+        'status': 'success'
+    }), 200
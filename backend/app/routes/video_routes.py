@@ -1,21 +1,120 @@
 from flask import Blueprint, request, current_app, jsonify
 import os
 import uuid
+import tempfile
 import cv2
 import numpy as np
 from werkzeug.utils import secure_filename
 import datetime
+import json
 
-from app.services.face_verification import verify_faces
+from app.services.face_verification import (
+    verify_faces, extract_face_data, compute_face_embeddings, get_face_recognizer, MAX_SAMPLED_FRAMES
+)
+from app.services.face_cache import save_face_cache, load_face_cache
+from app.services.face_gallery import enroll_faces, get_enrolled_embeddings
+from app.services.live_verification import LiveVerificationSession
+from app.services.application_pipeline import record_application_video, BASELINE_VIDEO, VERIFICATION_VIDEO
+from app.services.video_proxy import build_video_proxy, extract_face_data_from_proxy
+from app.services.blob_store import store_blob, store_blob_file, resolve_upload
+from app.services.storage import get_storage, VIDEOS
+from app.services.chunked_upload import (
+    create_upload, get_upload, lock_upload, unlock_upload, append_chunk,
+    analyze_prefix, wait_for_prefix_analysis, complete_upload, get_partial_path,
+    prefix_covers_sample
+)
+from app.utils.idempotency import idempotent
+from app.utils.admission import (
+    admission_controlled, admission_ticket, connect_admission_db, get_tenant, AdmissionRejected
+)
+from app.db import get_db
+
+# flask-sock is optional; without it the live verification socket is not served
+try:
+    from flask_sock import Sock
+    sock = Sock()
+    FLASK_SOCK_AVAILABLE = True
+except Exception as e:
+    print(f"Warning: flask-sock import failed: {e}")
+    print("Live face verification over WebSocket will not be available.")
+    FLASK_SOCK_AVAILABLE = False
 
 bp = Blueprint('video', __name__, url_prefix='/api/video')
 
+# A live session ends with a verdict when no message arrives for this long
+LIVE_IDLE_TIMEOUT_SECONDS = 10
+
+# Faces are sampled from the first frames only, so a video stored on another
+# node is first sampled from a ranged read of this many leading bytes
+STORED_VIDEO_PREFIX_BYTES = int(os.environ.get('STORED_VIDEO_PREFIX_BYTES', 8 * 1024 * 1024))
+
 def allowed_video_file(filename):
     """Check if uploaded file is an allowed video format"""
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in {'mp4', 'webm', 'mov'}
 
+def _video_info(proxy):
+    """Duration, frame rate and frame count of a video from its proxy metadata"""
+    if proxy is None:
+        return None
+    return {key: proxy[key] for key in ('duration', 'fps', 'frame_count', 'width', 'height')}
+
+def _verification_body(result):
+    """Response of a face verification, from the result of verify_faces"""
+    if result['needs_review']:
+        message = 'Faces could not be compared automatically; the video needs manual review'
+    else:
+        message = 'Face verification completed'
+    return dict(result, message=message, status='success')
+
+def _load_baseline_faces(video_folder, baseline_video_id):
+    """Cached face data of a baseline video, else faces from its proxy frames"""
+    baseline_faces = load_face_cache(video_folder, baseline_video_id)
+    if baseline_faces is None:
+        baseline_faces = extract_face_data_from_proxy(video_folder, baseline_video_id)
+    return baseline_faces
+
+def _extract_stored_faces(storage, video_key):
+    """
+    Face data of a stored video, reading only its prefix when it isn't on this node
+    
+    Returns:
+        dict: Face data as returned by extract_face_data
+    """
+    if not storage.is_cached(video_key):
+        fd, prefix_path = tempfile.mkstemp(suffix=os.path.splitext(video_key)[1])
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(storage.read_range(video_key, 0, STORED_VIDEO_PREFIX_BYTES))
+            # A prefix shorter than asked for is the whole video
+            if os.path.getsize(prefix_path) < STORED_VIDEO_PREFIX_BYTES or prefix_covers_sample(prefix_path):
+                face_data = extract_face_data(prefix_path)
+                if face_data is not None and face_data['frames_read'] >= MAX_SAMPLED_FRAMES:
+                    return face_data
+        finally:
+            os.unlink(prefix_path)
+    
+    return extract_face_data(storage.local_path(video_key))
+
+def _load_stored_baseline(storage, video_folder, baseline_video_id, baseline_key):
+    """
+    Inputs of verify_faces for a baseline video
+    
+    Returns:
+        tuple: (local path of the video, only fetched when it has no face
+                crops to compare, or None; face data)
+    """
+    baseline_faces = _load_baseline_faces(video_folder, baseline_video_id)
+    if baseline_faces is None:
+        baseline_faces = _extract_stored_faces(storage, baseline_key)
+    
+    if baseline_faces is not None and len(baseline_faces['crops']) > 0:
+        return None, baseline_faces
+    return storage.local_path(baseline_key), baseline_faces
+
 @bp.route('/upload', methods=['POST'])
+@idempotent('video-upload')
+@admission_controlled('face')
 def upload_video():
     """
     Upload video response from user
@@ -37,29 +136,41 @@ def upload_video():
     filename = f"{timestamp}_{secure_filename(file.filename)}"
     video_id = str(uuid.uuid4())
     
-    # Save video file
-    file_path = os.path.join(current_app.config['VIDEO_FOLDER'], f"{video_id}_{filename}")
-    file.save(file_path)
+    # Save video file; identical content already uploaded is only referenced
+    storage = get_storage()
+    video_key, _ = store_blob(get_db(), storage, VIDEOS, video_id, filename, file.stream)
+    file_path = storage.local_path(video_key)
     
-    # Extract a frame to check if the video is valid
-    cap = cv2.VideoCapture(file_path)
-    success, frame = cap.read()
-    cap.release()
+    # Extract faces from sampled frames, which also checks that the video is valid
+    face_data = extract_face_data(file_path)
     
-    if not success:
+    if face_data is None:
         return jsonify({
             'error': 'Could not read video frame',
             'video_id': video_id,
             'status': 'error'
         }), 400
     
+    # Cache the crops so later verifications skip decoding and detection
+    save_face_cache(current_app.config['VIDEO_FOLDER'], video_id, face_data)
+    enroll_faces(current_app.config['VIDEO_FOLDER'], video_id, face_data)
+    
+    # Keep seekable frame samples, since the recording itself can't be seeked
+    proxy = build_video_proxy(file_path, current_app.config['VIDEO_FOLDER'], video_id)
+    
+    if request.form.get('application_id'):
+        record_application_video(get_db(), request.form['application_id'], BASELINE_VIDEO, video_id)
+    
     return jsonify({
         'message': 'Video uploaded successfully',
         'video_id': video_id,
+        'faces_detected': len(face_data['crops']),
+        'video': _video_info(proxy),
         'status': 'success'
     }), 201
 
 @bp.route('/verify', methods=['POST'])
+@admission_controlled('face')
 def verify_video():
     """
     Verify that the face in the new video matches the baseline video
@@ -73,29 +184,314 @@ def verify_video():
     if file.filename == '' or not allowed_video_file(file.filename):
         return jsonify({'error': 'Invalid file'}), 400
     
+    # Find baseline video before anything is stored
+    db = get_db()
+    storage = get_storage()
+    baseline_key = resolve_upload(db, storage, VIDEOS, baseline_video_id)
+    
+    if baseline_key is None:
+        return jsonify({'error': 'Baseline video not found'}), 404
+    
     # Generate unique filename
     filename = f"{secure_filename(file.filename)}"
     verification_id = str(uuid.uuid4())
     
     # Save new video
-    file_path = os.path.join(current_app.config['VIDEO_FOLDER'], f"{verification_id}_{filename}")
-    file.save(file_path)
+    video_key, _ = store_blob(db, storage, VIDEOS, verification_id, filename, file.stream)
+    file_path = storage.local_path(video_key)
+    
+    # Reuse the face crops and embeddings from when the baseline was uploaded
+    baseline_video, baseline_faces = _load_stored_baseline(storage, current_app.config['VIDEO_FOLDER'],
+                                                           baseline_video_id, baseline_key)
+    baseline_embeddings = get_enrolled_embeddings(current_app.config['VIDEO_FOLDER'], baseline_video_id)
+    
+    # Verify faces
+    result = verify_faces(baseline_video, file_path, baseline_faces=baseline_faces,
+                          baseline_embeddings=baseline_embeddings)
     
-    # Find baseline video
-    baseline_video = None
-    for f in os.listdir(current_app.config['VIDEO_FOLDER']):
-        if f.startswith(baseline_video_id):
-            baseline_video = os.path.join(current_app.config['VIDEO_FOLDER'], f)
-            break
+    # The application pipeline can then reuse the pair without the client resending it
+    if request.form.get('application_id'):
+        record_application_video(db, request.form['application_id'], BASELINE_VIDEO, baseline_video_id)
+        record_application_video(db, request.form['application_id'], VERIFICATION_VIDEO, verification_id)
     
-    if baseline_video is None:
+    return jsonify(_verification_body(result)), 200
+
+@bp.route('/uploads', methods=['POST'])
+def create_chunked_upload():
+    """
+    Start a resumable video upload
+    
+    Expects JSON with 'filename', 'length' (total bytes) and optionally
+    'baseline_video_id' to verify against instead of registering a new video.
+    Chunks are then sent with PATCH /uploads/<upload_id> and the upload is
+    completed with POST /uploads/<upload_id>/finalize.
+    """
+    data = request.get_json(silent=True) or {}
+    filename = secure_filename(str(data.get('filename', '')))
+    
+    if not filename or not allowed_video_file(filename):
+        return jsonify({'error': 'Invalid file format. Allowed formats: mp4, webm, mov'}), 400
+    
+    try:
+        length = int(data.get('length'))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'length must be the size of the video in bytes'}), 400
+    
+    if length <= 0 or length > current_app.config['MAX_VIDEO_UPLOAD_LENGTH']:
+        return jsonify({'error': f"length must be between 1 and {current_app.config['MAX_VIDEO_UPLOAD_LENGTH']} bytes"}), 400
+    
+    baseline_video_id = data.get('baseline_video_id')
+    db = get_db()
+    if baseline_video_id and resolve_upload(db, get_storage(), VIDEOS, baseline_video_id) is None:
         return jsonify({'error': 'Baseline video not found'}), 404
     
-    # Verify faces
-    is_same_person = verify_faces(baseline_video, file_path)
+    upload_id = create_upload(db, current_app.config['VIDEO_FOLDER'], filename, length, baseline_video_id)
+    
+    return jsonify({
+        'upload_id': upload_id,
+        'offset': 0,
+        'length': length,
+        'status': 'success'
+    }), 201, {'Location': f"{bp.url_prefix}/uploads/{upload_id}", 'Upload-Offset': '0'}
+
+@bp.route('/uploads/<upload_id>', methods=['GET'])
+def get_chunked_upload(upload_id):
+    """
+    Get how many bytes of an upload were received, to resume after a dropped connection
+    """
+    upload = get_upload(get_db(), upload_id)
+    if upload is None:
+        return jsonify({'error': 'Upload not found'}), 404
     
     return jsonify({
-        'message': 'Face verification completed',
-        'is_same_person': is_same_person,
+        'upload_id': upload_id,
+        'offset': upload['received'],
+        'length': upload['length'],
+        'status': upload['status']
+    }), 200, {'Upload-Offset': str(upload['received']), 'Upload-Length': str(upload['length'])}
+
+@bp.route('/uploads/<upload_id>', methods=['PATCH'])
+def append_chunked_upload(upload_id):
+    """
+    Append a chunk to an upload
+    
+    The raw request body is the chunk and the Upload-Offset header must
+    match the number of bytes received so far.
+    """
+    db = get_db()
+    upload = get_upload(db, upload_id)
+    if upload is None:
+        return jsonify({'error': 'Upload not found'}), 404
+    
+    try:
+        offset = int(request.headers.get('Upload-Offset', ''))
+    except ValueError:
+        return jsonify({'error': 'Missing or invalid Upload-Offset header'}), 400
+    
+    if not lock_upload(db, upload_id, offset):
+        # Let the client resume from the offset that was actually received
+        upload = get_upload(db, upload_id)
+        return jsonify({
+            'error': 'Upload-Offset does not match, or the upload is busy or finalized',
+            'offset': upload['received'],
+            'status': upload['status']
+        }), 409, {'Upload-Offset': str(upload['received'])}
+    
+    try:
+        received = append_chunk(db, current_app.config['VIDEO_FOLDER'], get_upload(db, upload_id), request.stream)
+    except ValueError as e:
+        upload = get_upload(db, upload_id)
+        return jsonify({'error': str(e), 'offset': upload['received']}), 413, {'Upload-Offset': str(upload['received'])}
+    
+    # Start sampling frames from what has arrived, so finalize has less to do
+    analyze_prefix(current_app.config['VIDEO_FOLDER'], upload)
+    
+    return jsonify({
+        'upload_id': upload_id,
+        'offset': received,
+        'length': upload['length'],
         'status': 'success'
-    }), 200 
\ No newline at end of file
+    }), 200, {'Upload-Offset': str(received)}
+
+@bp.route('/uploads/<upload_id>/finalize', methods=['POST'])
+@admission_controlled('face')
+def finalize_chunked_upload(upload_id):
+    """
+    Complete an upload once all bytes were received
+    
+    Returns the same response as /upload, or as /verify when the upload
+    was started with a baseline_video_id. Repeated calls return the same
+    result, and a call that failed can be retried.
+    """
+    db = get_db()
+    upload = get_upload(db, upload_id)
+    if upload is None:
+        return jsonify({'error': 'Upload not found'}), 404
+    
+    if upload['status'] == 'complete':
+        result = json.loads(upload['result'])
+        return jsonify(result['body']), result['status_code']
+    
+    if upload['received'] != upload['length']:
+        return jsonify({
+            'error': 'Upload is incomplete',
+            'offset': upload['received'],
+            'length': upload['length']
+        }), 409, {'Upload-Offset': str(upload['received'])}
+    
+    # The baseline may have expired since the upload started; the video is
+    # then not stored, and the partial file goes with the open upload
+    storage = get_storage()
+    baseline_key = None
+    if upload['baseline_video_id']:
+        baseline_key = resolve_upload(db, storage, VIDEOS, upload['baseline_video_id'])
+        if baseline_key is None:
+            return jsonify({'error': 'Baseline video not found'}), 404
+    
+    if not lock_upload(db, upload_id, upload['length']):
+        return jsonify({'error': 'Upload is busy'}), 409, {'Retry-After': '5'}
+    
+    video_folder = current_app.config['VIDEO_FOLDER']
+    try:
+        # Faces found in the received prefix are reused when they cover the full sample
+        wait_for_prefix_analysis(upload_id)
+        face_data = load_face_cache(video_folder, upload_id)
+        
+        # A retry after a failure past this point finds the video already
+        # stored, and its partial file gone
+        video_key = resolve_upload(db, storage, VIDEOS, upload_id)
+        if video_key is None:
+            source_path = get_partial_path(video_folder, upload_id, upload['filename'])
+        else:
+            source_path = storage.local_path(video_key)
+        if face_data is None:
+            face_data = extract_face_data(source_path)
+        
+        if video_key is None:
+            video_key, _ = store_blob_file(db, storage, VIDEOS, upload_id, upload['filename'], source_path)
+        file_path = storage.local_path(video_key)
+        
+        if baseline_key is not None:
+            baseline_video, baseline_faces = _load_stored_baseline(storage, video_folder,
+                                                                   upload['baseline_video_id'], baseline_key)
+            baseline_embeddings = get_enrolled_embeddings(video_folder, upload['baseline_video_id'])
+            result = verify_faces(baseline_video, file_path, baseline_faces=baseline_faces, new_faces=face_data,
+                                  baseline_embeddings=baseline_embeddings)
+            body, status_code = _verification_body(result), 200
+        elif face_data is None:
+            body, status_code = {
+                'error': 'Could not read video frame',
+                'video_id': upload_id,
+                'status': 'error'
+            }, 400
+        else:
+            save_face_cache(video_folder, upload_id, face_data)
+            enroll_faces(video_folder, upload_id, face_data)
+            proxy = build_video_proxy(file_path, video_folder, upload_id)
+            body, status_code = {
+                'message': 'Video uploaded successfully',
+                'video_id': upload_id,
+                'faces_detected': len(face_data['crops']),
+                'video': _video_info(proxy),
+                'status': 'success'
+            }, 201
+    except Exception:
+        unlock_upload(db, upload_id)
+        raise
+    
+    complete_upload(db, upload_id, {'body': body, 'status_code': status_code})
+    return jsonify(body), status_code
+
+def _get_baseline_embeddings(db, video_folder, baseline_video_id):
+    """
+    Face embeddings of a baseline video, from the gallery, the face cache
+    or, for old uploads, the video itself
+
+    Returns:
+        tuple: (whether the baseline video exists, embeddings (empty if it
+                has no face) or None without the embedding model)
+    """
+    storage = get_storage()
+    baseline_key = resolve_upload(db, storage, VIDEOS, baseline_video_id)
+    if baseline_key is None:
+        return False, None
+    if get_face_recognizer() is None:
+        return True, None
+    
+    embeddings = get_enrolled_embeddings(video_folder, baseline_video_id)
+    if embeddings is not None:
+        return True, embeddings
+    
+    baseline_faces = _load_baseline_faces(video_folder, baseline_video_id)
+    if baseline_faces is None:
+        baseline_faces = _extract_stored_faces(storage, baseline_key)
+    if baseline_faces is None:
+        return True, compute_face_embeddings([])
+    return True, compute_face_embeddings(baseline_faces['crops'])
+
+def live_verification(ws):
+    """
+    Check face presence, and match the face against a baseline, while recording
+    
+    Connect with an optional ?baseline_video_id=. Send each downscaled frame
+    as a binary message (JPEG, PNG or WebP). Every frame is answered with
+    {"type": "frame", "face", "quality", "good", "similarity", ...}, and once
+    enough good frames arrived (or on a {"type": "end"} text message) a
+    {"type": "verdict", "face_present", "is_same_person", "similarity", ...}
+    message is sent and the socket is closed. Similarity and is_same_person
+    are null without a baseline or without the face embedding model.
+    
+    Each frame takes a slot of the face workload while it is checked, so
+    idle sockets hold none. A frame that gets no slot is answered with
+    {"type": "error", "retry_after"} and dropped.
+    """
+    video_folder = current_app.config['VIDEO_FOLDER']
+    baseline_video_id = request.args.get('baseline_video_id')
+    tenant = get_tenant()
+    admission_db = connect_admission_db()
+    try:
+        baseline_embeddings = None
+        if baseline_video_id:
+            try:
+                with admission_ticket('face', tenant, admission_db):
+                    exists, baseline_embeddings = _get_baseline_embeddings(get_db(), video_folder,
+                                                                           baseline_video_id)
+            except AdmissionRejected as e:
+                ws.send(json.dumps({'type': 'error', 'error': str(e), 'retry_after': e.retry_after}))
+                return
+            if not exists:
+                ws.send(json.dumps({'type': 'error', 'error': 'Baseline video not found'}))
+                return
+        
+        session = LiveVerificationSession(baseline_embeddings)
+        while not session.done:
+            message = ws.receive(timeout=LIVE_IDLE_TIMEOUT_SECONDS)
+            if message is None:
+                break
+            
+            if isinstance(message, str):
+                try:
+                    control = json.loads(message)
+                except ValueError:
+                    control = {}
+                if isinstance(control, dict) and control.get('type') == 'end':
+                    break
+                continue
+            
+            try:
+                with admission_ticket('face', tenant, admission_db):
+                    status = session.add_frame(message)
+            except AdmissionRejected as e:
+                ws.send(json.dumps({'type': 'error', 'error': str(e), 'retry_after': e.retry_after}))
+                continue
+            except ValueError as e:
+                ws.send(json.dumps({'type': 'error', 'error': str(e)}))
+                continue
+            ws.send(json.dumps(dict(status, type='frame')))
+    finally:
+        admission_db.close()
+    
+    ws.send(json.dumps(dict(session.verdict(), type='verdict', status='success')))
+
+if FLASK_SOCK_AVAILABLE:
+    sock.route('/live', bp=bp)(live_verification)
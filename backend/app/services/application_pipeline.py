@@ -0,0 +1,361 @@
+import os
+import json
+import hashlib
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from flask import current_app
+
+from app.services.blob_store import resolve_upload, get_blob_hash
+from app.services.storage import UPLOADS, VIDEOS
+from app.services.consistency_checker import check_application_consistency
+from app.services.loan_engine import decide, get_verified_monthly_income, DEFAULT_TENURE_MONTHS
+from app.utils.admission import admission_ticket, AdmissionRejected
+
+# Bump whenever what a node computes changes, so memoized results are recomputed
+APPLICATION_PIPELINE_VERSION = 3
+
+# Nodes running OCR or face verification at once, per worker process. Each
+# also takes a slot of its workload, so the OCR and face admission limits
+# hold across pipelines and the /api/document and /api/video routes.
+PIPELINE_WORKERS = int(os.environ.get('PIPELINE_WORKERS', 4))
+
+# Roles of the videos of an application
+BASELINE_VIDEO = 'baseline'
+VERIFICATION_VIDEO = 'verification'
+
+# Loan terms read by the decision node, as accepted by /api/loan/decision
+LOAN_TERMS = ('loan_amount', 'monthly_income', 'existing_emis', 'credit_score',
+              'tenure_months', 'annual_rate', 'employment_years')
+
+# The node pool is created on first use and shared by all requests of a worker
+_node_pool = None
+_node_pool_lock = threading.Lock()
+
+def _get_node_pool():
+    """Get the thread pool running the OCR and face nodes"""
+    global _node_pool
+    with _node_pool_lock:
+        if _node_pool is None:
+            _node_pool = ThreadPoolExecutor(max_workers=PIPELINE_WORKERS)
+        return _node_pool
+
+def _run_admitted(app, workload, tenant, run):
+    """Run a pooled node once its workload admits it"""
+    with app.app_context():
+        with admission_ticket(workload, tenant):
+            return run()
+
+def _hash(value):
+    """Stable hash of a JSON-serializable value"""
+    return hashlib.sha256(json.dumps(value, sort_keys=True).encode('utf-8')).hexdigest()
+
+def record_application_video(db, application_id, role, video_id):
+    """
+    Attach a video to an application, replacing the previous one of the same role
+
+    Args:
+        db (sqlite3.Connection): Database connection
+        application_id (str): Application identifier
+        role (str): BASELINE_VIDEO or VERIFICATION_VIDEO
+        video_id (str): Video identifier
+    """
+    db.execute(
+        'INSERT OR REPLACE INTO application_videos (application_id, role, video_id, updated_at)'
+        ' VALUES (?, ?, ?, CURRENT_TIMESTAMP)',
+        (application_id, role, video_id)
+    )
+    db.commit()
+
+def has_application_inputs(db, application_id):
+    """Whether any document or video was recorded for an application"""
+    return db.execute(
+        'SELECT 1 FROM application_documents WHERE application_id = ?'
+        ' UNION ALL SELECT 1 FROM application_videos WHERE application_id = ? LIMIT 1',
+        (application_id, application_id)
+    ).fetchone() is not None
+
+def _run_document_node(storage, doc_type, document_id, ocr_record, document_key, stored_data, results):
+    """
+    Node: extraction of one document, from its stored OCR when still current
+
+    Like the face node it has no dependencies, so results is empty.
+
+    Returns:
+        dict: 'doc_type', 'is_valid', 'extracted_data', 'source' and, when
+              the document was OCRed again, the new record under '_ocr'
+    """
+    from app.services.ocr_store import needs_ocr, reextract_document
+    from app.services.document_processor import process_document
+
+    if ocr_record is not None and not needs_ocr(ocr_record):
+        text, is_valid, extracted_data = reextract_document(ocr_record, doc_type)
+        return {'doc_type': doc_type, 'is_valid': is_valid, 'extracted_data': extracted_data, 'source': 'stored'}
+
+    if document_key is None:
+        # Documents recorded without their file (or OCR) keep what was extracted at upload
+        return {'doc_type': doc_type, 'is_valid': True, 'extracted_data': stored_data, 'source': 'recorded'}
+
+    new_record = {}
+    min_confidence = ocr_record['min_confidence'] if ocr_record else 0
+    text, is_valid, extracted_data = process_document(storage.local_path(document_key), doc_type,
+                                                      min_confidence, new_record)
+    return {
+        'doc_type': doc_type,
+        'is_valid': is_valid,
+        'extracted_data': extracted_data,
+        'source': new_record['source'],
+        '_ocr': (document_id, new_record, text, min_confidence)
+    }
+
+def _run_face_node(storage, video_folder, baseline, verification, results):
+    """
+    Node: whether the verification video shows the person of the baseline
+    video, as returned by verify_faces
+    """
+    from app.services.face_verification import verify_faces
+    from app.services.face_cache import load_face_cache
+    from app.services.face_gallery import get_enrolled_embeddings
+    from app.services.video_proxy import extract_face_data_from_proxy
+
+    baseline_faces = load_face_cache(video_folder, baseline['video_id'])
+    if baseline_faces is None:
+        baseline_faces = extract_face_data_from_proxy(video_folder, baseline['video_id'])
+
+    # The baseline video itself is only read when it has no face crops to compare
+    baseline_path = None
+    if baseline_faces is None or len(baseline_faces['crops']) == 0:
+        baseline_path = storage.local_path(baseline['key'])
+
+    return verify_faces(baseline_path, storage.local_path(verification['key']), baseline_faces=baseline_faces,
+                        baseline_embeddings=get_enrolled_embeddings(video_folder, baseline['video_id']))
+
+def _run_consistency_node(db, application_id, results):
+    """Node: cross-checks of the documents (each check is memoized on its own)"""
+    documents = {result['doc_type']: result['extracted_data']
+                 for name, result in results.items() if name.startswith('document:')}
+    consistency = check_application_consistency(db, application_id, documents)
+    consistency.pop('recomputed_checks')
+    return consistency
+
+def _run_decision_node(terms, results):
+    """Node: loan decision, held back when the applicant's identity doesn't hold up"""
+    income = None
+    for name, result in results.items():
+        if name.startswith('document:') and ('tax' in result['doc_type'] or 'income' in result['doc_type']):
+            income = get_verified_monthly_income(result['extracted_data'])
+            if income is not None:
+                break
+    income_source = 'tax_papers' if income is not None else 'declared'
+    if income is None:
+        income = terms.get('monthly_income')
+
+    missing = [field for field, value in (('loan_amount', terms.get('loan_amount')),
+                                          ('credit_score', terms.get('credit_score')),
+                                          ('monthly_income', income)) if value is None]
+    if missing:
+        return {'decision': None, 'reason': f"Missing loan terms: {', '.join(missing)}"}
+
+    decision = decide(income, terms.get('existing_emis') or 0, terms['credit_score'], terms['loan_amount'],
+                      int(terms.get('tenure_months') or DEFAULT_TENURE_MONTHS),
+                      terms.get('annual_rate'), terms.get('employment_years'))
+
+    consistency = results.get('consistency')
+    if consistency is not None and consistency['status'] == 'inconsistent':
+        decision['reasons'].append('Documents do not appear to belong to the same person')
+        decision['requiredInfo'].append('Re-upload of the mismatched documents')
+    face = results.get('face')
+    if face is not None and face['needs_review']:
+        decision['reasons'].append('Face verification needs manual review')
+        decision['requiredInfo'].append('Manual review of the verification video')
+    elif face is not None and not face['is_same_person']:
+        decision['reasons'].append('Face verification failed')
+        decision['requiredInfo'].append('A new verification video')
+    if decision['status'] == 'approved' and len(decision['reasons']):
+        decision['status'] = 'more_info'
+
+    return {'decision': decision, 'monthly_income': round(income, 2), 'income_source': income_source}
+
+def build_application_graph(db, storage, video_folder, application_id, terms):
+    """
+    Build the processing graph of an application
+
+    Each node has a 'name', the names of the nodes it depends on ('deps'),
+    a 'key' identifying its own inputs and a 'run' function taking the
+    results of its dependencies by node name. Nodes with a 'workload' (a key
+    of ADMISSION_LIMITS) run on the node pool once admitted; the others are
+    cheap and need the request's database connection.
+
+    Args:
+        db (sqlite3.Connection): Database connection
+        storage (LocalStorage): Storage from get_storage
+        video_folder (str): Folder where videos are stored
+        application_id (str): Application identifier
+        terms (dict): Loan terms (see LOAN_TERMS); the decision is skipped without them
+
+    Returns:
+        list: Nodes in dependency order
+    """
+    from app.services.ocr_store import load_ocr_record, needs_ocr, OCR_PIPELINE_VERSION
+
+    nodes = []
+    document_nodes = []
+    rows = db.execute(
+        'SELECT doc_type, document_id, extracted_data FROM application_documents'
+        ' WHERE application_id = ? ORDER BY doc_type',
+        (application_id,)
+    ).fetchall()
+    for row in rows:
+        ocr_record = load_ocr_record(db, row['document_id'])
+        document_key = resolve_upload(db, storage, UPLOADS, row['document_id'])
+        name = f"document:{row['doc_type']}"
+        document_nodes.append(name)
+        # Only reading the document again is OCR work; stored text is re-extracted inline
+        runs_ocr = document_key is not None and (ocr_record is None or needs_ocr(ocr_record))
+        nodes.append({
+            'name': name,
+            'deps': [],
+            # The same content of the same type reads the same, whichever upload it came from
+            'key': [row['doc_type'], get_blob_hash(db, row['document_id']) or row['document_id'],
+                    OCR_PIPELINE_VERSION, ocr_record['min_confidence'] if ocr_record else 0],
+            'workload': 'ocr' if runs_ocr else None,
+            'run': functools.partial(_run_document_node, storage, row['doc_type'], row['document_id'],
+                                     ocr_record, document_key, json.loads(row['extracted_data']))
+        })
+
+    videos = {
+        row['role']: {'video_id': row['video_id'],
+                      'key': resolve_upload(db, storage, VIDEOS, row['video_id'])}
+        for row in db.execute('SELECT role, video_id FROM application_videos WHERE application_id = ?',
+                              (application_id,))
+    }
+    baseline, verification = videos.get(BASELINE_VIDEO), videos.get(VERIFICATION_VIDEO)
+    has_face = baseline is not None and verification is not None and \
+        baseline['key'] is not None and verification['key'] is not None
+    if has_face:
+        nodes.append({
+            'name': 'face',
+            'deps': [],
+            'key': [get_blob_hash(db, baseline['video_id']), get_blob_hash(db, verification['video_id'])],
+            'workload': 'face',
+            'run': functools.partial(_run_face_node, storage, video_folder, baseline, verification)
+        })
+
+    if document_nodes:
+        nodes.append({
+            'name': 'consistency',
+            'deps': document_nodes,
+            'key': [],
+            'workload': None,
+            'run': functools.partial(_run_consistency_node, db, application_id)
+        })
+    nodes.append({
+        'name': 'decision',
+        'deps': document_nodes + (['consistency'] if document_nodes else []) + (['face'] if has_face else []),
+        'key': [terms.get(field) for field in LOAN_TERMS],
+        'workload': None,
+        'run': functools.partial(_run_decision_node, terms)
+    })
+    return nodes
+
+def run_graph(db, application_id, nodes, tenant):
+    """
+    Run the nodes of an application graph, reusing memoized results
+
+    A node's input hash covers its own inputs and the results of its
+    dependencies, so after one input changes only the nodes downstream of
+    it run again, and only as far as their results actually change.
+    Independent pooled nodes run concurrently, each under an admission
+    ticket of its workload. A node that isn't admitted fails with a
+    'retry_after' in its result, and runs again on the next call.
+
+    Args:
+        db (sqlite3.Connection): Database connection
+        application_id (str): Application identifier
+        nodes (list): Output of build_application_graph
+        tenant (str): Tenant the pooled nodes are queued under
+
+    Yields:
+        dict: 'node', 'status' ('cached', 'done', 'error' or 'skipped'
+              when a dependency failed) and 'result', as nodes finish
+    """
+    from app.services.ocr_store import save_ocr_record
+
+    memo = {
+        row['node']: (row['input_hash'], json.loads(row['result']))
+        for row in db.execute('SELECT node, input_hash, result FROM pipeline_results WHERE application_id = ?',
+                              (application_id,))
+    }
+
+    app = current_app._get_current_object()
+    results = {}
+    failed = set()
+    pending = {node['name']: node for node in nodes}
+    running = {}
+
+    def finish(node, input_hash, status, result):
+        del pending[node['name']]
+        if status == 'done':
+            ocr = result.pop('_ocr', None)
+            if ocr is not None:
+                document_id, new_record, text, min_confidence = ocr
+                save_ocr_record(db, document_id, result['doc_type'], new_record, text,
+                                result['is_valid'], result['extracted_data'], min_confidence)
+            db.execute(
+                'INSERT OR REPLACE INTO pipeline_results (application_id, node, input_hash, result, updated_at)'
+                ' VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)',
+                (application_id, node['name'], input_hash, json.dumps(result))
+            )
+            db.commit()
+        if status in ('done', 'cached'):
+            results[node['name']] = result
+        else:
+            failed.add(node['name'])
+        return {'node': node['name'], 'status': status, 'result': result}
+
+    while pending:
+        for node in [node for node in pending.values() if node['name'] not in running]:
+            if any(dep in failed for dep in node['deps']):
+                yield finish(node, None, 'skipped', None)
+                continue
+            if any(dep not in results for dep in node['deps']):
+                continue
+
+            input_hash = _hash([APPLICATION_PIPELINE_VERSION, node['name'], node['key'],
+                                {dep: _hash(results[dep]) for dep in node['deps']}])
+            if node['name'] in memo and memo[node['name']][0] == input_hash:
+                yield finish(node, input_hash, 'cached', memo[node['name']][1])
+                continue
+
+            run = functools.partial(node['run'], {dep: results[dep] for dep in node['deps']})
+            if node['workload'] is not None:
+                future = _get_node_pool().submit(_run_admitted, app, node['workload'], tenant, run)
+                running[node['name']] = (future, input_hash)
+                continue
+            try:
+                result = run()
+            except Exception as e:
+                print(f"Pipeline node {node['name']} of {application_id} failed: {e}")
+                yield finish(node, input_hash, 'error', {'error': str(e)})
+                continue
+            yield finish(node, input_hash, 'done', result)
+
+        if not running:
+            continue
+
+        done, _ = wait([future for future, _ in running.values()], return_when=FIRST_COMPLETED)
+        for name, (future, input_hash) in list(running.items()):
+            if future not in done:
+                continue
+            del running[name]
+            try:
+                result = future.result()
+            except AdmissionRejected as e:
+                yield finish(pending[name], input_hash, 'error', {'error': str(e), 'retry_after': e.retry_after})
+                continue
+            except Exception as e:
+                print(f"Pipeline node {name} of {application_id} failed: {e}")
+                yield finish(pending[name], input_hash, 'error', {'error': str(e)})
+                continue
+            yield finish(pending[name], input_hash, 'done', result)
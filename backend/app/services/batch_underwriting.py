@@ -0,0 +1,262 @@
+import os
+import numpy as np
+import pandas as pd
+
+from app.services.loan_engine import (
+    evaluate, rate_for_credit_score, STATUSES, APPROVED, MORE_INFO, DEFAULT_TENURE_MONTHS, MAX_TENURE_MONTHS
+)
+from app.utils.validators import VERHOEFF_MULTIPLICATION, VERHOEFF_PERMUTATION, PAN_ENTITY_CODES
+
+# pyarrow is optional; without it only CSV files can be underwritten
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except Exception as e:
+    print(f"Warning: pyarrow import failed: {e}")
+    print("Parquet application files will not be supported.")
+    PYARROW_AVAILABLE = False
+
+# Columns of an application file holding the fields of each document, as
+# {document: {field in extracted_data: column}}. A document is validated
+# when the file has any of its columns.
+DOCUMENT_COLUMNS = {
+    'aadhaar': {'aadhaar_number': 'aadhaar_number', 'name': 'aadhaar_name'},
+    'pan': {'pan_number': 'pan_number', 'name': 'pan_name'},
+    'tax': {'income': 'tax_income', 'tax_year': 'tax_year', 'pan': 'tax_pan'},
+    'bank': {'account_number': 'account_number', 'ifsc': 'ifsc'},
+}
+
+PAN_PATTERN = r'^[A-Z]{5}[0-9]{4}[A-Z]$'
+
+_VERHOEFF_MULTIPLICATION = np.array(VERHOEFF_MULTIPLICATION)
+_VERHOEFF_PERMUTATION = np.array(VERHOEFF_PERMUTATION)
+
+def _text(frame, column):
+    """A column as strings with missing values as '', or all '' if absent"""
+    if column not in frame:
+        return pd.Series('', index=frame.index)
+    return frame[column].fillna('').astype(str).str.strip()
+
+def _number(frame, column, default=np.nan):
+    """A column as floats, with unparseable values as NaN"""
+    if column not in frame:
+        return pd.Series(default, index=frame.index, dtype=np.float64)
+    values = frame[column]
+    if values.dtype == object:
+        values = values.astype(str).str.replace(',', '', regex=False)
+    return pd.to_numeric(values, errors='coerce').astype(np.float64)
+
+def verhoeff_valid(numbers):
+    """
+    Verhoeff checksum of many 12-digit numbers at once
+
+    Args:
+        numbers (pd.Series): Strings of exactly 12 digits
+
+    Returns:
+        np.ndarray: True where the checksum is valid
+    """
+    if len(numbers) == 0:
+        return np.zeros(0, dtype=bool)
+
+    digits = np.frombuffer(''.join(numbers).encode('ascii'), dtype=np.uint8).reshape(-1, 12) - ord('0')
+    checksum = np.zeros(len(numbers), dtype=np.int64)
+    for i in range(12):
+        checksum = _VERHOEFF_MULTIPLICATION[checksum, _VERHOEFF_PERMUTATION[i % 8][digits[:, 11 - i]]]
+    return checksum == 0
+
+def _join_messages(index, messages):
+    """Join the messages whose mask is set, per row, with '; '"""
+    joined = pd.Series('', index=index)
+    for mask, message in messages:
+        joined = joined.where(~mask, joined + message + '; ')
+    return joined.str.rstrip('; ')
+
+def _figures(values, decimals, invalid):
+    """Rounded loan figures, blank where the inputs were refused"""
+    return np.where(invalid, np.nan, np.round(values, decimals))
+
+def validate_document_columns(doc_type, frame):
+    """
+    Apply the rules of validate_document_data to whole columns
+
+    Args:
+        doc_type (str): 'aadhaar', 'pan', 'tax' or 'bank'
+        frame (pd.DataFrame): Application rows with the columns in DOCUMENT_COLUMNS
+
+    Returns:
+        pd.DataFrame: '<doc_type>_valid', '<doc_type>_errors' and '<doc_type>_warnings'
+    """
+    columns = DOCUMENT_COLUMNS[doc_type]
+    errors = []
+    warnings = []
+
+    if doc_type == 'aadhaar':
+        number = _text(frame, columns['aadhaar_number'])
+        missing = number == ''
+        bad_format = ~missing & ~number.str.fullmatch(r'\d{12}')
+        well_formed = ~missing & ~bad_format
+        valid_number = pd.Series(False, index=frame.index)
+        candidates = well_formed & number.str.match(r'[2-9]')
+        valid_number[candidates] = verhoeff_valid(number[candidates])
+        errors += [(missing, 'Aadhaar number is missing'),
+                   (bad_format, 'Invalid Aadhaar number format'),
+                   (well_formed & ~valid_number, 'Invalid Aadhaar number checksum')]
+        warnings.append((_text(frame, columns['name']) == '', 'Name not found in document'))
+
+    elif doc_type == 'pan':
+        number = _text(frame, columns['pan_number'])
+        missing = number == ''
+        bad_format = ~missing & ~number.str.fullmatch(PAN_PATTERN)
+        bad_holder = ~missing & ~bad_format & ~number.str[3].isin(list(PAN_ENTITY_CODES))
+        errors += [(missing, 'PAN number is missing'),
+                   (bad_format, 'Invalid PAN number format'),
+                   (bad_holder, 'Invalid PAN holder type')]
+        warnings.append((_text(frame, columns['name']) == '', 'Name not found in document'))
+
+    elif doc_type == 'tax':
+        errors.append((_text(frame, columns['income']) == '', 'Income information not found'))
+        warnings += [(_text(frame, columns['tax_year']) == '', 'Tax year not found'),
+                     (_text(frame, columns['pan']) == '', 'Valid PAN number not found in tax document')]
+
+    elif doc_type == 'bank':
+        errors.append((_text(frame, columns['account_number']) == '', 'Account number not found'))
+        warnings.append((_text(frame, columns['ifsc']) == '', 'IFSC code not found'))
+
+    invalid = np.logical_or.reduce([mask.to_numpy() for mask, _ in errors])
+    return pd.DataFrame({
+        f'{doc_type}_valid': ~invalid,
+        f'{doc_type}_errors': _join_messages(frame.index, errors),
+        f'{doc_type}_warnings': _join_messages(frame.index, warnings)
+    }, index=frame.index)
+
+def underwrite_frame(frame):
+    """
+    Validate documents and score the loan of every application in a frame
+
+    Income extracted from tax papers (annual, 'tax_income') is used when
+    present, otherwise the declared 'monthly_income', as in /api/loan/decision.
+    Rows /api/loan/decision would refuse (e.g. a tenure that isn't a whole
+    number of months up to MAX_TENURE_MONTHS) get their reasons in
+    'input_errors', no loan figures, and the 'more_info' status.
+
+    Args:
+        frame (pd.DataFrame): Application rows
+
+    Returns:
+        pd.DataFrame: 'application_id' (if present), document validation
+                      columns, 'input_errors', loan results and the overall 'status'
+    """
+    result = pd.DataFrame(index=frame.index)
+    if 'application_id' in frame:
+        result['application_id'] = frame['application_id']
+
+    documents_valid = pd.Series(True, index=frame.index)
+    for doc_type, columns in DOCUMENT_COLUMNS.items():
+        if any(column in frame for column in columns.values()):
+            validation = validate_document_columns(doc_type, frame)
+            result = result.join(validation)
+            documents_valid &= validation[f'{doc_type}_valid']
+    result['documents_valid'] = documents_valid
+
+    tax_income = _number(frame, DOCUMENT_COLUMNS['tax']['income']) / 12
+    monthly_income = tax_income.where(tax_income > 0, _number(frame, 'monthly_income'))
+    loan_amount = _number(frame, 'loan_amount')
+    existing_emis = _number(frame, 'existing_emis', 0).fillna(0)
+    credit_score = _number(frame, 'credit_score')
+    tenure_months = _number(frame, 'tenure_months', DEFAULT_TENURE_MONTHS)
+    if 'tenure_months' in frame:
+        tenure_months = tenure_months.where(_text(frame, 'tenure_months') != '', DEFAULT_TENURE_MONTHS)
+
+    # The checks of /api/loan/decision; the row is scored with the default
+    # tenure so nothing divides by zero, and its figures are dropped below
+    tenure_not_number = tenure_months.isna() | np.isinf(tenure_months)
+    tenure_out_of_range = ~tenure_not_number & ((tenure_months < 1) | (tenure_months > MAX_TENURE_MONTHS))
+    tenure_fractional = ~tenure_not_number & ~tenure_out_of_range & (tenure_months % 1 != 0)
+    input_errors = _join_messages(frame.index, [
+        (tenure_not_number, 'tenure_months must be a number'),
+        (tenure_out_of_range, f'tenure_months must be between 1 and {MAX_TENURE_MONTHS}'),
+        (tenure_fractional, 'tenure_months must be a whole number'),
+    ])
+    invalid_inputs = (input_errors != '').to_numpy()
+    tenure_months = tenure_months.where(~invalid_inputs, DEFAULT_TENURE_MONTHS)
+
+    # Rows without a rate of their own get the rate of their credit band
+    annual_rate = _number(frame, 'annual_rate').fillna(
+        pd.Series(rate_for_credit_score(credit_score.fillna(0)), index=frame.index))
+    employment_years = _number(frame, 'employment_years').to_numpy() if 'employment_years' in frame else None
+
+    scores = evaluate(monthly_income.to_numpy(), existing_emis.to_numpy(), credit_score.to_numpy(),
+                      loan_amount.to_numpy(), tenure_months.to_numpy(), annual_rate.to_numpy(), employment_years)
+
+    missing_inputs = (monthly_income.isna() | loan_amount.isna() | credit_score.isna()).to_numpy()
+    loan_status = np.where(missing_inputs | invalid_inputs, MORE_INFO, scores['status'])
+
+    result['input_errors'] = input_errors
+    result['monthly_income'] = monthly_income.round(2)
+    result['income_source'] = np.where(tax_income > 0, 'tax_papers', 'declared')
+    result['annual_rate'] = scores['annual_rate']
+    result['emi'] = _figures(scores['emi'], 2, invalid_inputs)
+    result['max_eligible_amount'] = _figures(scores['max_eligible_amount'], 2, invalid_inputs)
+    result['foir'] = _figures(scores['foir'], 4, invalid_inputs)
+    for flag in ('low_credit_score', 'high_dti', 'short_employment', 'exceeds_eligibility'):
+        result[flag] = scores[flag]
+    result['missing_inputs'] = missing_inputs
+    result['loan_status'] = STATUSES[loan_status]
+
+    # Invalid documents need another look even when the loan itself passes
+    status = np.where((loan_status == APPROVED) & ~documents_valid.to_numpy(), MORE_INFO, loan_status)
+    result['status'] = STATUSES[status]
+    return result
+
+def iter_application_chunks(path, chunk_size):
+    """
+    Read an application file in chunks of rows
+
+    Args:
+        path (str): CSV or Parquet file
+        chunk_size (int): Rows per chunk
+
+    Yields:
+        pd.DataFrame: Consecutive chunks of the file
+    """
+    if path.lower().endswith('.parquet'):
+        if not PYARROW_AVAILABLE:
+            raise RuntimeError('Parquet files require pyarrow')
+        parquet_file = pq.ParquetFile(path)
+        for batch in parquet_file.iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+    else:
+        # Read everything as text so identifiers keep their leading zeros
+        yield from pd.read_csv(path, chunksize=chunk_size, dtype=str, keep_default_na=False)
+
+class ResultWriter:
+    """Append result chunks to a CSV or Parquet file as they are produced"""
+
+    def __init__(self, path):
+        self.path = path
+        self.parquet = path.lower().endswith('.parquet')
+        self._writer = None
+        self._started = False
+
+        if self.parquet and not PYARROW_AVAILABLE:
+            raise RuntimeError('Parquet output requires pyarrow')
+        if os.path.exists(path):
+            os.unlink(path)
+
+    def write(self, frame):
+        """Append a chunk of results"""
+        if self.parquet:
+            table = pa.Table.from_pandas(frame, preserve_index=False)
+            if self._writer is None:
+                self._writer = pq.ParquetWriter(self.path, table.schema)
+            self._writer.write_table(table.cast(self._writer.schema))
+        else:
+            frame.to_csv(self.path, mode='a', header=not self._started, index=False)
+        self._started = True
+
+    def close(self):
+        """Finish the file"""
+        if self._writer is not None:
+            self._writer.close()
@@ -0,0 +1,292 @@
+import os
+import json
+import time
+import hashlib
+
+from app.services.storage import make_key
+
+# Uploads are stored once per distinct content under <area>/blobs, and
+# document and video ids are references to those blobs
+BLOB_DIR = 'blobs'
+
+CHUNK_SIZE = 1024 * 1024
+
+# Unreferenced blobs younger than this are kept, so an upload that is
+# referencing a blob while the sweep runs never loses its file
+GC_GRACE_SECONDS = 3600
+
+# How long an upload waits for the sweep to finish deleting a blob with the
+# same content before storing it again
+BLOB_DELETE_WAIT_SECONDS = 30
+
+# With a remote storage, each node's database only knows the uploads it
+# received, so every reference is also recorded in the bucket:
+#   <area>/refs/ids/<ref_id>.json      key, hash and filename of the upload
+#   <area>/refs/hashes/<hash>/<ref_id> empty marker, one per reference
+# Any node can then resolve any upload id, and a node only deletes content
+# no node refers to.
+REF_DIR = 'refs'
+
+def get_blob_key(area, blob_hash, extension):
+    """
+    Get the storage key of a blob
+
+    Args:
+        area (str): Storage area, UPLOADS or VIDEOS
+        blob_hash (str): SHA-256 of the content
+        extension (str): File extension including the dot, e.g. '.png'
+
+    Returns:
+        str: Key of the blob
+    """
+    return make_key(area, f"{BLOB_DIR}/{blob_hash[:2]}/{blob_hash}{extension}")
+
+def _ref_key(area, ref_id):
+    """Key of the bucket record of a reference"""
+    return make_key(area, f"{REF_DIR}/ids/{ref_id}.json")
+
+def _ref_marker_prefix(area, blob_hash):
+    """Prefix of the markers of the references to a blob"""
+    return make_key(area, f"{REF_DIR}/hashes/{blob_hash}/")
+
+def _record_remote_reference(storage, area, ref_id, filename, blob_hash, key):
+    """Record a reference in the bucket, before its blob is checked for"""
+    if not storage.remote:
+        return
+    # The marker goes first, so a sweep on another node sees the blob as
+    # referenced before the id resolves to it
+    storage.put_bytes(_ref_marker_prefix(area, blob_hash) + ref_id, b'')
+    storage.put_bytes(_ref_key(area, ref_id),
+                      json.dumps({'key': key, 'hash': blob_hash, 'filename': filename}).encode('utf-8'))
+
+def _delete_remote_reference(storage, key, ref_id, blob_hash):
+    """Drop the bucket record and marker of a reference to the blob at key"""
+    if not storage.remote:
+        return
+    area = key.partition('/')[0]
+    storage.delete(_ref_key(area, ref_id))
+    storage.delete(_ref_marker_prefix(area, blob_hash) + ref_id)
+
+def hash_stream(stream):
+    """
+    Hash a seekable binary stream and rewind it
+
+    Args:
+        stream (file-like): Binary stream
+
+    Returns:
+        tuple: (hex digest, size in bytes)
+    """
+    digest = hashlib.sha256()
+    size = 0
+    stream.seek(0)
+    for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+        digest.update(chunk)
+        size += len(chunk)
+    stream.seek(0)
+    return digest.hexdigest(), size
+
+def _add_reference(db, area, ref_id, filename, blob_hash, size):
+    """Reference a blob, counting it, and return its key"""
+    extension = os.path.splitext(filename)[1].lower()
+
+    # A blob being deleted (refcount -1) can't be referenced again until its
+    # row is gone, otherwise the sweep would delete a referenced file
+    deadline = time.monotonic() + BLOB_DELETE_WAIT_SECONDS
+    while True:
+        # Reuse the key of an existing blob, whatever extension it was stored with
+        row = db.execute('SELECT path FROM blobs WHERE hash = ?', (blob_hash,)).fetchone()
+        key = row['path'] if row else get_blob_key(area, blob_hash, extension)
+
+        cursor = db.execute(
+            'INSERT INTO blobs (hash, path, size, refcount) VALUES (?, ?, ?, 1)'
+            ' ON CONFLICT(hash) DO UPDATE SET refcount = refcount + 1,'
+            ' last_referenced_at = CURRENT_TIMESTAMP WHERE refcount >= 0',
+            (blob_hash, key, size)
+        )
+        if cursor.rowcount == 1:
+            break
+        db.commit()
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"Blob {blob_hash} is still being deleted")
+        time.sleep(0.1)
+
+    db.execute(
+        'INSERT INTO blob_refs (ref_id, hash, filename) VALUES (?, ?, ?)',
+        (ref_id, blob_hash, filename)
+    )
+    db.commit()
+    return key
+
+def store_blob(db, storage, area, ref_id, filename, stream):
+    """
+    Store an upload, writing it only if the same content isn't stored yet
+
+    Args:
+        db (sqlite3.Connection): Database connection
+        storage (LocalStorage): Storage from get_storage
+        area (str): Storage area, UPLOADS or VIDEOS
+        ref_id (str): Document or video id referencing the content
+        filename (str): Original (secured) file name, kept for reference
+        stream (file-like): Seekable binary stream with the content
+
+    Returns:
+        tuple: (key of the stored blob, True if the content was already stored)
+    """
+    blob_hash, size = hash_stream(stream)
+    key = _add_reference(db, area, ref_id, filename, blob_hash, size)
+    _record_remote_reference(storage, area, ref_id, filename, blob_hash, key)
+
+    if storage.exists(key):
+        return key, True
+
+    storage.put_stream(key, stream)
+    return key, False
+
+def store_blob_file(db, storage, area, ref_id, filename, source_path):
+    """
+    Store a file that is already on disk, moving it instead of copying it
+
+    The source file is consumed: it becomes the blob, or is deleted if the
+    same content is already stored. It must be on the same filesystem as
+    the local folder of the area.
+
+    Args:
+        db (sqlite3.Connection): Database connection
+        storage (LocalStorage): Storage from get_storage
+        area (str): Storage area, UPLOADS or VIDEOS
+        ref_id (str): Document or video id referencing the content
+        filename (str): Original (secured) file name, kept for reference
+        source_path (str): File to store
+
+    Returns:
+        tuple: (key of the stored blob, True if the content was already stored)
+    """
+    with open(source_path, 'rb') as f:
+        blob_hash, size = hash_stream(f)
+    key = _add_reference(db, area, ref_id, filename, blob_hash, size)
+    _record_remote_reference(storage, area, ref_id, filename, blob_hash, key)
+
+    if storage.exists(key):
+        os.unlink(source_path)
+        return key, True
+
+    storage.put_file(key, source_path)
+    return key, False
+
+def resolve_upload(db, storage, area, ref_id):
+    """
+    Find the stored file of a document or video id
+
+    Uploads received by another node are found through their record in
+    the bucket. Falls back to files saved as <id>_<name> in the local folder
+    before uploads were content-addressed.
+
+    Args:
+        db (sqlite3.Connection): Database connection
+        storage (LocalStorage): Storage from get_storage
+        area (str): Storage area, UPLOADS or VIDEOS
+        ref_id (str): Document or video id
+
+    Returns:
+        str: Key of the file (see storage.local_path), or None if not found
+    """
+    row = db.execute(
+        'SELECT blobs.path FROM blob_refs JOIN blobs ON blobs.hash = blob_refs.hash'
+        ' WHERE blob_refs.ref_id = ?',
+        (ref_id,)
+    ).fetchone()
+    if row and storage.exists(row['path']):
+        return row['path']
+
+    if storage.remote:
+        record = storage.get_bytes(_ref_key(area, ref_id))
+        if record is not None:
+            key = json.loads(record)['key']
+            if storage.exists(key):
+                return key
+
+    folder = storage.folders[area]
+    if not os.path.isdir(folder):
+        return None
+    for f in os.listdir(folder):
+        if f.startswith(ref_id) and os.path.isfile(os.path.join(folder, f)):
+            return make_key(area, f)
+    return None
+
+def get_blob_hash(db, ref_id):
+    """Content hash of a document or video id, or None for uploads from before blobs"""
+    row = db.execute('SELECT hash FROM blob_refs WHERE ref_id = ?', (ref_id,)).fetchone()
+    return row['hash'] if row else None
+
+def expire_references(db, storage, retention_days):
+    """
+    Drop references older than the retention period
+
+    Args:
+        db (sqlite3.Connection): Database connection
+        storage (LocalStorage): Storage from get_storage
+        retention_days (float): Age after which references are dropped
+
+    Returns:
+        list: Ids of the dropped references
+    """
+    expired = db.execute(
+        'SELECT blob_refs.ref_id, blob_refs.hash, blobs.path FROM blob_refs'
+        ' JOIN blobs ON blobs.hash = blob_refs.hash WHERE blob_refs.created_at < datetime(\'now\', ?)',
+        (f"-{float(retention_days)} days",)
+    ).fetchall()
+
+    for row in expired:
+        _delete_remote_reference(storage, row['path'], row['ref_id'], row['hash'])
+        db.execute('DELETE FROM blob_refs WHERE ref_id = ?', (row['ref_id'],))
+        db.execute(
+            'UPDATE blobs SET refcount = refcount - 1, last_referenced_at = CURRENT_TIMESTAMP'
+            ' WHERE hash = ?',
+            (row['hash'],)
+        )
+    db.commit()
+
+    return [row['ref_id'] for row in expired]
+
+def collect_garbage(db, storage, grace_seconds=GC_GRACE_SECONDS):
+    """
+    Delete blobs that no reference points to any more
+
+    Args:
+        db (sqlite3.Connection): Database connection
+        storage (LocalStorage): Storage from get_storage
+        grace_seconds (int): Keep unreferenced blobs younger than this
+
+    Returns:
+        tuple: (number of blobs deleted, bytes freed)
+    """
+    candidates = db.execute(
+        'SELECT hash, path, size FROM blobs WHERE refcount <= 0'
+        ' AND last_referenced_at < datetime(\'now\', ?)',
+        (f"-{int(grace_seconds)} seconds",)
+    ).fetchall()
+
+    deleted = freed = 0
+    for row in candidates:
+        # Claim the blob first: once its refcount is -1 no upload references
+        # it until the row is gone. Rows left claimed by an interrupted sweep
+        # are claimed again here.
+        cursor = db.execute('UPDATE blobs SET refcount = -1 WHERE hash = ? AND refcount <= 0', (row['hash'],))
+        db.commit()
+        if cursor.rowcount != 1:
+            continue
+
+        # Content uploaded again on another node stays: this node only forgets it
+        if storage.remote and storage.list_keys(_ref_marker_prefix(row['path'].partition('/')[0], row['hash']), 1):
+            db.execute('DELETE FROM blobs WHERE hash = ? AND refcount = -1', (row['hash'],))
+            db.commit()
+            continue
+
+        storage.delete(row['path'])
+        db.execute('DELETE FROM blobs WHERE hash = ? AND refcount = -1', (row['hash'],))
+        db.commit()
+        deleted += 1
+        freed += row['size']
+
+    return deleted, freed
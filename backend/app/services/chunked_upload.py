@@ -0,0 +1,242 @@
+import os
+import json
+import time
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+from app.services.face_verification import extract_face_data, MAX_SAMPLED_FRAMES, FRAME_SAMPLE_STRIDE
+from app.services.face_cache import save_face_cache, get_face_cache_path
+
+# Chunks are appended to <VIDEO_FOLDER>/partial/<upload_id><ext> until the
+# upload is finalized, then the file is moved into the blob store
+PARTIAL_DIR = 'partial'
+
+CHUNK_SIZE = 1024 * 1024
+
+# A request holding an upload for longer than this is assumed to have died
+LOCK_TIMEOUT_SECONDS = 300
+
+# Frames that must be decodable after the last sampled one before the face
+# sample of a prefix is trusted; the last frames of a prefix may be cut off
+PREFIX_SAFETY_FRAMES = FRAME_SAMPLE_STRIDE
+
+# Face detection on received prefixes runs in the background, one at a time
+_analysis_pool = None
+_analyses = {}
+_analysis_lock = threading.Lock()
+
+def _get_analysis_pool():
+    """Get the thread pool analyzing received prefixes"""
+    global _analysis_pool
+    with _analysis_lock:
+        if _analysis_pool is None:
+            _analysis_pool = ThreadPoolExecutor(max_workers=1)
+        return _analysis_pool
+
+def get_partial_path(video_folder, upload_id, filename):
+    """Get the path chunks of an upload are appended to"""
+    extension = os.path.splitext(filename)[1].lower()
+    return os.path.join(video_folder, PARTIAL_DIR, f"{upload_id}{extension}")
+
+def create_upload(db, video_folder, filename, length, baseline_video_id=None):
+    """
+    Start a chunked video upload
+
+    Args:
+        db (sqlite3.Connection): Database connection
+        video_folder (str): Folder where videos are stored
+        filename (str): Secured name of the video file
+        length (int): Total size of the video in bytes
+        baseline_video_id (str): Baseline to verify against when finalized (optional).
+            Without it the video is registered like /api/video/upload.
+
+    Returns:
+        str: Upload id, which also becomes the video id
+    """
+    upload_id = str(uuid.uuid4())
+
+    partial_path = get_partial_path(video_folder, upload_id, filename)
+    os.makedirs(os.path.dirname(partial_path), exist_ok=True)
+    open(partial_path, 'wb').close()
+
+    db.execute(
+        'INSERT INTO video_uploads (upload_id, filename, length, baseline_video_id) VALUES (?, ?, ?, ?)',
+        (upload_id, filename, length, baseline_video_id)
+    )
+    db.commit()
+    return upload_id
+
+def get_upload(db, upload_id):
+    """Get the state of a chunked upload, or None if it doesn't exist"""
+    return db.execute('SELECT * FROM video_uploads WHERE upload_id = ?', (upload_id,)).fetchone()
+
+def lock_upload(db, upload_id, offset=None):
+    """
+    Take the upload for this request, so chunks and finalize don't overlap
+
+    Args:
+        db (sqlite3.Connection): Database connection
+        upload_id (str): Upload id
+        offset (int): Expected number of bytes received so far (optional)
+
+    Returns:
+        bool: True if locked, False if another request holds the upload or
+              the offset doesn't match
+    """
+    now = time.time()
+    query = ('UPDATE video_uploads SET locked_at = ? WHERE upload_id = ? AND status = \'open\''
+             ' AND (locked_at IS NULL OR locked_at < ?)')
+    params = [now, upload_id, now - LOCK_TIMEOUT_SECONDS]
+    if offset is not None:
+        query += ' AND received = ?'
+        params.append(offset)
+
+    cursor = db.execute(query, params)
+    db.commit()
+    return cursor.rowcount == 1
+
+def unlock_upload(db, upload_id):
+    """Release an upload taken with lock_upload"""
+    db.execute('UPDATE video_uploads SET locked_at = NULL WHERE upload_id = ?', (upload_id,))
+    db.commit()
+
+def append_chunk(db, video_folder, upload, stream):
+    """
+    Append a chunk to a locked upload
+
+    Bytes past the declared length are rejected. If the request breaks off,
+    whatever was written is kept and the client resumes from the new offset.
+
+    Args:
+        db (sqlite3.Connection): Database connection
+        video_folder (str): Folder where videos are stored
+        upload (sqlite3.Row): Upload state, locked by this request
+        stream (file-like): Request body
+
+    Returns:
+        int: Number of bytes received so far
+    """
+    partial_path = get_partial_path(video_folder, upload['upload_id'], upload['filename'])
+    received = upload['received']
+    overflow = False
+
+    try:
+        with open(partial_path, 'r+b') as f:
+            # Drop anything a failed request wrote past the recorded offset
+            f.seek(received)
+            f.truncate()
+
+            for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+                if received + len(chunk) > upload['length']:
+                    overflow = True
+                    break
+                f.write(chunk)
+                received += len(chunk)
+    finally:
+        db.execute(
+            'UPDATE video_uploads SET received = ?, locked_at = NULL WHERE upload_id = ?',
+            (received, upload['upload_id'])
+        )
+        db.commit()
+
+    if overflow:
+        raise ValueError('Chunk goes past the declared upload length')
+    return received
+
+def _prefix_has_frames(partial_path, frame_count):
+    """Check that the first frame_count frames of a prefix can be decoded"""
+    cap = cv2.VideoCapture(partial_path)
+    try:
+        for _ in range(frame_count):
+            if not cap.grab():
+                return False
+        return True
+    finally:
+        cap.release()
+
+def prefix_covers_sample(prefix_path):
+    """Check that the prefix of a video holds every frame extract_face_data samples"""
+    frames_needed = (MAX_SAMPLED_FRAMES - 1) * FRAME_SAMPLE_STRIDE + 1 + PREFIX_SAFETY_FRAMES
+    return _prefix_has_frames(prefix_path, frames_needed)
+
+def _analyze_prefix(video_folder, upload_id, partial_path):
+    """Worker: detect faces in a received prefix and cache them once complete"""
+    try:
+        if not prefix_covers_sample(partial_path):
+            return
+
+        # Frames are sampled from the start of the video, so once the prefix
+        # holds all of them the result is the same as for the whole file
+        face_data = extract_face_data(partial_path)
+        if face_data is not None and face_data['frames_read'] >= MAX_SAMPLED_FRAMES:
+            save_face_cache(video_folder, upload_id, face_data)
+    except Exception as e:
+        print(f"Error analyzing upload prefix {upload_id}: {e}")
+
+def analyze_prefix(video_folder, upload):
+    """
+    Start face detection on the bytes received so far, unless it is done or running
+
+    Args:
+        video_folder (str): Folder where videos are stored
+        upload (sqlite3.Row): Upload state
+    """
+    upload_id = upload['upload_id']
+    if os.path.exists(get_face_cache_path(video_folder, upload_id)):
+        return
+
+    with _analysis_lock:
+        future = _analyses.get(upload_id)
+        if future is not None and not future.done():
+            return
+
+    partial_path = get_partial_path(video_folder, upload_id, upload['filename'])
+    future = _get_analysis_pool().submit(_analyze_prefix, video_folder, upload_id, partial_path)
+    with _analysis_lock:
+        _analyses[upload_id] = future
+
+def wait_for_prefix_analysis(upload_id):
+    """Wait for prefix analysis of an upload running in this process, if any"""
+    with _analysis_lock:
+        future = _analyses.pop(upload_id, None)
+    if future is not None:
+        future.result()
+
+def complete_upload(db, upload_id, result):
+    """Mark an upload finalized, keeping its result for repeated finalize calls"""
+    db.execute(
+        'UPDATE video_uploads SET status = \'complete\', result = ?, locked_at = NULL WHERE upload_id = ?',
+        (json.dumps(result), upload_id)
+    )
+    db.commit()
+
+def expire_uploads(db, video_folder, max_age_days=1):
+    """
+    Delete uploads that were never finalized
+
+    Args:
+        db (sqlite3.Connection): Database connection
+        video_folder (str): Folder where videos are stored
+        max_age_days (float): Age after which open uploads are dropped
+
+    Returns:
+        int: Number of uploads deleted
+    """
+    rows = db.execute(
+        'SELECT upload_id, filename FROM video_uploads WHERE status = \'open\''
+        ' AND created_at < datetime(\'now\', ?)',
+        (f"-{float(max_age_days)} days",)
+    ).fetchall()
+
+    for row in rows:
+        for path in (get_partial_path(video_folder, row['upload_id'], row['filename']),
+                     get_face_cache_path(video_folder, row['upload_id'])):
+            if os.path.exists(path):
+                os.unlink(path)
+        db.execute('DELETE FROM video_uploads WHERE upload_id = ?', (row['upload_id'],))
+    db.commit()
+
+    return len(rows)
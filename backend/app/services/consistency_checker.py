@@ -0,0 +1,369 @@
+import re
+import json
+import hashlib
+import datetime
+import unicodedata
+
+# Honorifics that appear on some documents but not others
+NAME_PREFIXES = {'mr', 'mrs', 'ms', 'miss', 'dr', 'shri', 'sri', 'smt', 'kumari', 'km'}
+
+DATE_FORMATS = ['%d/%m/%Y', '%d-%m-%Y', '%d/%m/%y', '%d-%m-%y', '%Y-%m-%d']
+
+# Minimum fuzzy score for two names to count as the same person
+NAME_MATCH_THRESHOLD = 0.85
+
+# Overall score needed for an application to be considered consistent
+CONSISTENCY_THRESHOLD = 0.85
+
+# Bump whenever normalization or scoring changes, so cached check results
+# are recomputed
+CONSISTENCY_CHECK_VERSION = 1
+
+# Each check compares one field of one document with one field of another.
+# 'fuzzy' checks score names, 'exact' checks compare normalized values.
+CONSISTENCY_CHECKS = [
+    {'name': 'name_aadhaar_pan', 'kind': 'fuzzy',
+     'left': ('aadhaar-front', 'name'), 'right': ('pan-front', 'name')},
+    {'name': 'name_pan_tax', 'kind': 'fuzzy',
+     'left': ('pan-front', 'name'), 'right': ('tax-papers', 'name')},
+    {'name': 'name_aadhaar_tax', 'kind': 'fuzzy',
+     'left': ('aadhaar-front', 'name'), 'right': ('tax-papers', 'name')},
+    {'name': 'name_pan_bank', 'kind': 'fuzzy',
+     'left': ('pan-front', 'name'), 'right': ('bank-statement', 'name')},
+    {'name': 'father_name_pan_aadhaar', 'kind': 'fuzzy',
+     'left': ('pan-front', 'father_name'), 'right': ('aadhaar-back', 'care_of')},
+    {'name': 'dob_aadhaar_pan', 'kind': 'exact',
+     'left': ('aadhaar-front', 'dob'), 'right': ('pan-front', 'dob')},
+    {'name': 'pan_pan_tax', 'kind': 'exact',
+     'left': ('pan-front', 'pan_number'), 'right': ('tax-papers', 'pan')},
+]
+
+def normalize_name(name):
+    """
+    Normalize a person's name for comparison
+
+    Applies Unicode compatibility normalization, case folding, removes
+    punctuation and honorifics and collapses all kinds of whitespace.
+
+    Args:
+        name (str): Name as extracted from a document
+
+    Returns:
+        str: Normalized name, or None if nothing is left
+    """
+    if not name:
+        return None
+
+    # The extraction regexes can run on into the next line of OCR text
+    lines = str(name).strip().splitlines()
+    if not lines:
+        return None
+
+    name = unicodedata.normalize('NFKC', lines[0]).casefold()
+    name = re.sub(r"[^\w\s]", ' ', name)
+    tokens = [t for t in name.split() if t not in NAME_PREFIXES]
+
+    return ' '.join(tokens) or None
+
+def normalize_date(value):
+    """
+    Parse a date in any of the formats seen on documents
+
+    Args:
+        value (str): Date string such as 01/01/1990
+
+    Returns:
+        str: ISO formatted date, or None if it could not be parsed
+    """
+    if not value:
+        return None
+
+    value = unicodedata.normalize('NFKC', str(value)).strip()
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.datetime.strptime(value, date_format).date().isoformat()
+        except ValueError:
+            continue
+    return None
+
+def normalize_identifier(value):
+    """Normalize an identifier such as a PAN or Aadhaar number"""
+    if not value:
+        return None
+    return re.sub(r"\s+", '', unicodedata.normalize('NFKC', str(value))).upper() or None
+
+def normalize_field(field, value):
+    """
+    Normalize an extracted field according to its type
+
+    Args:
+        field (str): Field name from extract_document_data
+        value (str): Raw value
+
+    Returns:
+        str: Normalized value, or None if empty or unparseable
+    """
+    if field == 'dob':
+        return normalize_date(value)
+    if field in ('pan', 'pan_number', 'aadhaar_number'):
+        return normalize_identifier(value)
+    return normalize_name(value)
+
+def jaro_winkler(s1, s2, prefix_scale=0.1):
+    """
+    Compute the Jaro-Winkler similarity between two strings
+
+    Args:
+        s1 (str): First string
+        s2 (str): Second string
+        prefix_scale (float): Weight given to a common prefix
+
+    Returns:
+        float: Similarity (0-1, higher is more similar)
+    """
+    if s1 == s2:
+        return 1.0
+
+    len1, len2 = len(s1), len(s2)
+    if len1 == 0 or len2 == 0:
+        return 0.0
+
+    match_distance = max(len1, len2) // 2 - 1
+    matched1 = [False] * len1
+    matched2 = [False] * len2
+
+    matches = 0
+    for i in range(len1):
+        start = max(0, i - match_distance)
+        end = min(i + match_distance + 1, len2)
+        for j in range(start, end):
+            if not matched2[j] and s1[i] == s2[j]:
+                matched1[i] = matched2[j] = True
+                matches += 1
+                break
+
+    if matches == 0:
+        return 0.0
+
+    # Count transpositions between the matched characters
+    transpositions = 0
+    j = 0
+    for i in range(len1):
+        if matched1[i]:
+            while not matched2[j]:
+                j += 1
+            if s1[i] != s2[j]:
+                transpositions += 1
+            j += 1
+
+    jaro = (matches / len1 + matches / len2 + (matches - transpositions / 2) / matches) / 3
+
+    prefix = 0
+    for c1, c2 in zip(s1[:4], s2[:4]):
+        if c1 != c2:
+            break
+        prefix += 1
+
+    return jaro + prefix * prefix_scale * (1 - jaro)
+
+def name_similarity(name1, name2):
+    """
+    Token-based fuzzy similarity between two normalized names
+
+    Every token of the shorter name is matched to its best token in the
+    other name, so word order and extra middle names matter less. A single
+    letter matches any token starting with it, to handle initials.
+
+    Args:
+        name1 (str): First normalized name
+        name2 (str): Second normalized name
+
+    Returns:
+        float: Similarity (0-1, higher is more similar)
+    """
+    tokens1 = name1.split()
+    tokens2 = name2.split()
+    if not tokens1 or not tokens2:
+        return 0.0
+
+    if len(tokens1) > len(tokens2):
+        tokens1, tokens2 = tokens2, tokens1
+
+    scores = []
+    for token in tokens1:
+        best = 0.0
+        for other in tokens2:
+            if len(token) == 1 or len(other) == 1:
+                score = 0.9 if token[0] == other[0] else 0.0
+            else:
+                score = jaro_winkler(token, other)
+            best = max(best, score)
+        scores.append(best)
+
+    # Penalize names that differ in length, e.g. a missing surname
+    coverage = len(tokens1) / len(tokens2)
+    return sum(scores) / len(scores) * (0.8 + 0.2 * coverage)
+
+def run_check(check, documents):
+    """
+    Run one consistency check over an application's documents
+
+    Args:
+        check (dict): Entry from CONSISTENCY_CHECKS
+        documents (dict): Extracted data keyed by document type
+
+    Returns:
+        dict: Check result with 'status' of 'match', 'mismatch' or 'skipped'
+    """
+    left_doc, left_field = check['left']
+    right_doc, right_field = check['right']
+
+    left = normalize_field(left_field, documents.get(left_doc, {}).get(left_field))
+    right = normalize_field(right_field, documents.get(right_doc, {}).get(right_field))
+
+    result = {
+        'check': check['name'],
+        'left': f"{left_doc}.{left_field}",
+        'right': f"{right_doc}.{right_field}",
+    }
+
+    if left is None or right is None:
+        result.update({'status': 'skipped', 'score': None})
+        return result
+
+    if check['kind'] == 'fuzzy':
+        score = name_similarity(left, right)
+        matched = score >= NAME_MATCH_THRESHOLD
+    else:
+        score = 1.0 if left == right else 0.0
+        matched = score == 1.0
+
+    result.update({'status': 'match' if matched else 'mismatch', 'score': round(score, 4)})
+    return result
+
+def _check_input_hash(check, documents):
+    """
+    Hash the inputs of a check so unchanged pairs can reuse their result
+
+    The check definition, its threshold and CONSISTENCY_CHECK_VERSION are
+    part of the hash, so results computed by older rules are not reused.
+    """
+    left_doc, left_field = check['left']
+    right_doc, right_field = check['right']
+    payload = json.dumps([
+        CONSISTENCY_CHECK_VERSION,
+        check,
+        NAME_MATCH_THRESHOLD if check['kind'] == 'fuzzy' else None,
+        documents.get(left_doc, {}).get(left_field),
+        documents.get(right_doc, {}).get(right_field),
+    ])
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def record_document(db, application_id, doc_type, document_id, extracted_data):
+    """
+    Store the latest extracted data for a document of an application
+
+    Args:
+        db (sqlite3.Connection): Database connection
+        application_id (str): Application the document belongs to
+        doc_type (str): Type of document
+        document_id (str): Unique identifier of the uploaded document
+        extracted_data (dict): Output of extract_document_data
+    """
+    db.execute(
+        'INSERT OR REPLACE INTO application_documents'
+        ' (application_id, doc_type, document_id, extracted_data, updated_at)'
+        ' VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)',
+        (application_id, doc_type, document_id, json.dumps(extracted_data))
+    )
+    db.commit()
+
+def get_application_documents(db, application_id):
+    """
+    Get the latest extracted data for each document type of an application
+
+    Args:
+        db (sqlite3.Connection): Database connection
+        application_id (str): Application identifier
+
+    Returns:
+        dict: Extracted data keyed by document type
+    """
+    rows = db.execute(
+        'SELECT doc_type, extracted_data FROM application_documents WHERE application_id = ?',
+        (application_id,)
+    ).fetchall()
+    return {row['doc_type']: json.loads(row['extracted_data']) for row in rows}
+
+def check_application_consistency(db, application_id, documents=None):
+    """
+    Check that all documents of an application belong to the same person
+
+    Results of individual checks are cached by a hash of their inputs, so
+    after a single re-upload only the checks involving that document are
+    recomputed.
+
+    Args:
+        db (sqlite3.Connection): Database connection
+        application_id (str): Application identifier
+        documents (dict): Extracted data keyed by document type
+            (default: the data recorded for the application)
+
+    Returns:
+        dict: Overall 'score' and 'status' plus the individual 'checks'
+    """
+    if documents is None:
+        documents = get_application_documents(db, application_id)
+
+    cached = {
+        row['check_name']: (row['input_hash'], row['result'])
+        for row in db.execute(
+            'SELECT check_name, input_hash, result FROM consistency_checks WHERE application_id = ?',
+            (application_id,)
+        )
+    }
+
+    results = []
+    recomputed = 0
+    for check in CONSISTENCY_CHECKS:
+        input_hash = _check_input_hash(check, documents)
+        if check['name'] in cached and cached[check['name']][0] == input_hash:
+            results.append(json.loads(cached[check['name']][1]))
+            continue
+
+        result = run_check(check, documents)
+        results.append(result)
+        recomputed += 1
+        db.execute(
+            'INSERT OR REPLACE INTO consistency_checks (application_id, check_name, input_hash, result)'
+            ' VALUES (?, ?, ?, ?)',
+            (application_id, check['name'], input_hash, json.dumps(result))
+        )
+
+    if recomputed:
+        db.commit()
+
+    scored = [r for r in results if r['score'] is not None]
+    score = sum(r['score'] for r in scored) / len(scored) if scored else None
+
+    # An exact identifier mismatch fails the application whatever the average says
+    exact_mismatch = any(
+        r['status'] == 'mismatch' and check['kind'] == 'exact'
+        for r, check in zip(results, CONSISTENCY_CHECKS)
+    )
+
+    if score is None:
+        status = 'incomplete'
+    elif exact_mismatch or score < CONSISTENCY_THRESHOLD:
+        status = 'inconsistent'
+    else:
+        status = 'consistent'
+
+    return {
+        'application_id': application_id,
+        'documents': sorted(documents),
+        'score': round(score, 4) if score is not None else None,
+        'status': status,
+        'checks': results,
+        'recomputed_checks': recomputed
+    }
@@ -7,9 +7,20 @@ import os
 import json
 import subprocess
 import shutil
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
 
-from app.utils.validators import validate_aadhaar, validate_pan
-from app.utils.image_processing import preprocess_image, enhance_document_image
+from app.utils.validators import (
+    validate_aadhaar, validate_pan, validate_document_data,
+    is_valid_aadhaar_number, is_valid_pan_number
+)
+from app.utils.image_processing import (
+    preprocess_image, enhance_document_image, normalize_document_image, rectify_card
+)
+from app.services.ocr_result import run_tesseract, mean_confidence, field_confidences
+from app.utils.shared_images import publish_array, attach_image, release, submit_with_images
+from app.services.pdf_processor import is_pdf_file, extract_pdf_text
 
 # Set the tesseract command explicitly
 pytesseract.pytesseract.tesseract_cmd = "/opt/homebrew/bin/tesseract"
@@ -20,7 +31,7 @@ MOCK_OCR_DATA = {
     Government of India
     Unique Identification Authority of India
     AADHAAR
-    1234 5678 9012
+    2345 6789 0124
     John Doe
     DOB: 01/01/1990
     Male
@@ -34,7 +45,7 @@ MOCK_OCR_DATA = {
     INCOME TAX DEPARTMENT
     GOVT. OF INDIA
     Permanent Account Number
-    ABCDE1234F
+    ABCPD1234F
     Name: John Doe
     Father's Name: Robert Doe
     DOB: 01/01/1990
@@ -45,11 +56,19 @@ MOCK_OCR_DATA = {
     'tax-papers': """
     INCOME TAX RETURN
     Assessment Year: 2023-24
-    PAN: ABCDE1234F
+    PAN: ABCPD1234F
     Name: John Doe
     Gross Total Income: Rs. 950,000
     Tax Payable: Rs. 76,000
     Employment Type: Salaried
+    """,
+    'bank-statement': """
+    STATEMENT OF ACCOUNT
+    Name: John Doe
+    Account No: 1234 5678 9012 34
+    IFSC: SBIN0001234
+    Opening Balance: Rs. 1,20,000.00
+    Closing Balance: Rs. 1,45,500.00
     """
 }
 
@@ -59,7 +78,7 @@ MOCK_EXTRACTED_DATA = {
         'document_type': 'aadhaar-front',
         'name': 'John Doe',
         'dob': '01/01/1990',
-        'aadhaar_number': '123456789012',
+        'aadhaar_number': '234567890124',
         'gender': 'Male'
     },
     'aadhaar-back': {
@@ -72,7 +91,7 @@ MOCK_EXTRACTED_DATA = {
         'name': 'John Doe',
         'father_name': 'Robert Doe',
         'dob': '01/01/1990',
-        'pan_number': 'ABCDE1234F'
+        'pan_number': 'ABCPD1234F'
     },
     'pan-back': {
         'document_type': 'pan-back'
@@ -80,10 +99,17 @@ MOCK_EXTRACTED_DATA = {
     'tax-papers': {
         'document_type': 'tax-papers',
         'name': 'John Doe',
-        'pan': 'ABCDE1234F',
+        'pan': 'ABCPD1234F',
         'tax_year': '2023-24',
         'income': '950000',
         'tax_amount': '76000'
+    },
+    'bank-statement': {
+        'document_type': 'bank-statement',
+        'name': 'John Doe',
+        'account_number': '12345678901234',
+        'ifsc': 'SBIN0001234',
+        'closing_balance': '145500.00'
     }
 }
 
@@ -110,13 +136,424 @@ def is_tesseract_installed():
     print("Tesseract not found - using mock data")
     return False
 
-def process_document(file_path, doc_type):
+# Bump whenever image normalization, preprocessing or the OCR attempts
+# change, so stored OCR text is recomputed instead of re-extracted from
+OCR_PIPELINE_VERSION = 3
+
+def _parse_model_tiers(value):
+    """Parse 'name:lang[:tessdata dir],...' into a list of tiers"""
+    tiers = []
+    for entry in value.split(','):
+        parts = entry.strip().split(':', 2)
+        if len(parts) < 2 or not parts[0] or not parts[1]:
+            continue
+        tessdata_dir = parts[2] if len(parts) > 2 and parts[2] else None
+        tiers.append({'name': parts[0], 'lang': parts[1], 'tessdata_dir': tessdata_dir})
+    return tiers
+
+# Tesseract models tried in order, each only when the fields of the document
+# couldn't be read with the previous one: the integer models of tessdata_fast
+# first, then tessdata_best, then with Hindi for the bilingual labels of
+# Aadhaar cards. Without the directories the installed models are used, and
+# tiers that end up identical are only run once.
+TESSDATA_FAST_DIR = os.environ.get('TESSDATA_FAST_DIR', '')
+TESSDATA_BEST_DIR = os.environ.get('TESSDATA_BEST_DIR', '')
+OCR_MODEL_TIERS = _parse_model_tiers(os.environ.get(
+    'OCR_MODEL_TIERS',
+    f'fast:eng:{TESSDATA_FAST_DIR},best:eng:{TESSDATA_BEST_DIR},bilingual:eng+hin:{TESSDATA_BEST_DIR}'
+))
+
+# Languages installed per tessdata directory, looked up once per process
+_installed_languages = {}
+
+def _tessdata_config(tier):
+    """Tesseract option selecting the model directory of a tier"""
+    return f"--tessdata-dir {tier['tessdata_dir']}" if tier['tessdata_dir'] else ''
+
+def _tier_available(tier):
+    """Check that the languages of a tier are installed"""
+    key = tier['tessdata_dir']
+    if key not in _installed_languages:
+        try:
+            _installed_languages[key] = set(pytesseract.get_languages(config=_tessdata_config(tier)))
+        except Exception as e:
+            # Let the attempts themselves fail if Tesseract is unusable
+            print(f"Could not list Tesseract languages: {e}")
+            _installed_languages[key] = None
+    
+    installed = _installed_languages[key]
+    return installed is None or all(lang in installed for lang in tier['lang'].split('+'))
+
+def get_model_tiers():
     """
-    Process document image with OCR and extract relevant information
+    Get the OCR model tiers that can run here
+    
+    Returns:
+        list: Tiers of OCR_MODEL_TIERS with their languages installed,
+              without duplicates
+    """
+    tiers = []
+    seen = set()
+    for tier in OCR_MODEL_TIERS:
+        model = (tier['lang'], tier['tessdata_dir'])
+        if model in seen or not _tier_available(tier):
+            continue
+        seen.add(model)
+        tiers.append(tier)
+    return tiers
+
+def _run_attempt(image, tier, config):
+    """Run one OCR attempt with the model of a tier, timing it"""
+    started = time.perf_counter()
+    result = run_tesseract(image, lang=tier['lang'], config=f"{_tessdata_config(tier)} {config}".strip())
+    result['seconds'] = time.perf_counter() - started
+    return result
+
+# Number of processes running fallback OCR attempts of an image in parallel.
+# 0 runs them one after the other in the request, which keeps one upload
+# to one core as admission control assumes.
+OCR_ATTEMPT_WORKERS = int(os.environ.get('OCR_ATTEMPT_WORKERS', 0))
+
+# The attempt pool is created on first use and shared by all requests of a worker
+_attempt_pool = None
+_attempt_pool_lock = threading.Lock()
+
+def _get_attempt_pool():
+    """Get the process pool used to run fallback OCR attempts"""
+    global _attempt_pool
+    with _attempt_pool_lock:
+        if _attempt_pool is None:
+            _attempt_pool = ProcessPoolExecutor(max_workers=OCR_ATTEMPT_WORKERS)
+        return _attempt_pool
+
+def _run_shared_attempt(handle, tier, config):
+    """
+    Worker: run one OCR attempt on a published image
+
+    Only the handle of the image is sent to the worker, which maps the
+    image instead of receiving a pickled copy of it.
+    """
+    return _run_attempt(attach_image(handle), tier, config)
+
+def iter_ocr_attempts(file_path, parallel=False):
+    """
+    Run OCR on a document image with one preprocessing and page
+    segmentation setting after the other, escalating to the next model
+    tier once all settings were tried
+    
+    Attempts are only run as they are consumed, so callers that stop early
+    don't pay for the remaining ones, nor for the slower models.
+    
+    Args:
+        file_path (str): Path to document image, or the image itself
+        parallel (bool): Once the first attempt has been consumed, run the
+            remaining ones of each tier in the attempt pool (if
+            OCR_ATTEMPT_WORKERS is set)
+    
+    Yields:
+        dict: 'settings' (name of the attempt), 'model' (name of the tier),
+              'seconds', and 'text' and 'words' as returned by run_tesseract.
+              Failed attempts are skipped.
+    """
+    # Rotate and deskew once, so every attempt below works on an upright image
+    image, orientation = normalize_document_image(file_path)
+    if image is None:
+        image = file_path
+    elif orientation['rotation'] or orientation['skew']:
+        print(f"Normalized document orientation: {orientation}")
+    
+    images = {
+        # Preprocess the image for better OCR
+        'preprocessed': preprocess_image(image),
+        
+        # Also try enhanced version for better recognition
+        'enhanced': enhance_document_image(image)
+    }
+    
+    # Try different approaches for OCR, as (settings, image, Tesseract config).
+    # The image is already upright, so the first attempt normally succeeds and
+    # the rest are fallbacks.
+    ocr_settings = [
+        # 1. Regular preprocessing with default settings
+        ('preprocessed', 'preprocessed', ''),
+        
+        # 2. Enhanced image with default settings
+        ('enhanced', 'enhanced', ''),
+        
+        # 3. Treat the card as a single uniform block of text
+        ('preprocessed-psm6', 'preprocessed', '--psm 6 --oem 3'),
+        ('enhanced-psm6', 'enhanced', '--psm 6 --oem 3'),
+        
+        # 4. Single column of text of variable sizes
+        ('preprocessed-psm4', 'preprocessed', '--psm 4 --oem 3')
+    ]
+    
+    # A card photographed on a table is also tried flattened to CARD_SIZE:
+    # small, tightly framed and without perspective, so it OCRs quickly
+    card = rectify_card(image) if isinstance(image, np.ndarray) else None
+    if card is not None:
+        images['card'] = preprocess_image(card)
+        ocr_settings.insert(1, ('card', 'card', ''))
+    
+    # Without Tesseract OSD a page on its side may have been turned the wrong
+    # way, so try it the other way up early on
+    if orientation['orientation_source'] == 'text_lines' and orientation['rotation']:
+        ocr_settings.insert(1, ('rotated-180', 'rotated-180', ''))
+    
+    # Every setting with the cheapest model first, then with the next ones
+    ocr_attempts = [(tier, settings, image_name, config)
+                    for tier in get_model_tiers() for settings, image_name, config in ocr_settings]
+    
+    def get_image(name):
+        # The upside down image is only prepared if its attempt is reached
+        if name not in images:
+            images[name] = preprocess_image(cv2.rotate(image, cv2.ROTATE_180))
+        return images[name]
+    
+    handles = {}
+    futures = {}
+    try:
+        for i, (tier, settings, image_name, config) in enumerate(ocr_attempts):
+            if i >= 1 and i not in futures and parallel and OCR_ATTEMPT_WORKERS > 0:
+                # The attempts so far weren't enough, so publish the images
+                # once and run the rest of this tier at the same time
+                pool = _get_attempt_pool()
+                batch = [j for j in range(i, len(ocr_attempts)) if ocr_attempts[j][0] is tier]
+                for j in batch:
+                    _, _, name, attempt_config = ocr_attempts[j]
+                    if name not in handles:
+                        handles[name] = publish_array(get_image(name))
+                    futures[j] = submit_with_images(pool, [handles[name]], _run_shared_attempt,
+                                                    handles[name], tier, attempt_config)
+            
+            try:
+                if i in futures:
+                    result = futures[i].result()
+                else:
+                    result = _run_attempt(get_image(image_name), tier, config)
+            except Exception as e:
+                print(f"OCR attempt {i+1} ({tier['name']}) failed: {e}")
+                continue
+            yield {'settings': settings, 'model': tier['name'], 'seconds': round(result['seconds'], 3),
+                   'text': result['text'], 'words': result['words']}
+    finally:
+        # Attempts the caller didn't need are dropped; images still read by
+        # running attempts are removed once those finish
+        for future in futures.values():
+            future.cancel()
+        for handle in handles.values():
+            release(handle)
+
+def select_ocr_result(attempts, doc_type=None, min_confidence=0, used_attempts=None):
+    """
+    Combine OCR attempts into the text and fields of a document
+    
+    Fields are extracted after every attempt and merged across attempts,
+    so e.g. the name from one attempt and the Aadhaar number from another
+    are combined. Each field keeps the Tesseract confidence of the words it
+    was read from. Attempts stop being consumed once the fields needed for
+    the document type are valid, or without a known doc_type, once a decent
+    amount of text was read with good confidence.
+    
+    Works the same on live attempts from iter_ocr_attempts and on attempts
+    stored earlier, so extraction rules can be re-run without OCR.
+    
+    Args:
+        attempts (iterable): Attempts as yielded by iter_ocr_attempts
+        doc_type (str): Type of document (optional)
+        min_confidence (float): Ignore field values read with a lower
+            confidence (0-100)
+        used_attempts (list): If given, every consumed attempt is appended to it
+    
+    Returns:
+        tuple: (text, extracted_data) as returned by run_ocr
+    """
+    text = ""
+    words = []
+    extracted_data = {'document_type': doc_type, 'field_confidence': {}} if doc_type else None
+    best_score = None
+    field_driven = doc_type is not None and _is_known_doc_type(doc_type)
+    
+    # Try each OCR approach until we get decent results
+    for i, attempt in enumerate(attempts):
+        if used_attempts is not None:
+            used_attempts.append(attempt)
+        attempt_text = attempt['text']
+        
+        if not field_driven:
+            # Prefer the attempt read with the highest confidence, so
+            # noisy attempts full of junk characters don't win on length
+            confidence = mean_confidence(attempt['words'])
+            print(f"OCR attempt {i+1}: {len(attempt_text)} characters, confidence {confidence:.1f}")
+            
+            score = (len(attempt_text.strip()) > 20, confidence)
+            if best_score is None or score > best_score:
+                text, words, best_score = attempt_text, attempt['words'], score
+            
+            # If we have a decent amount of confident text, stop trying
+            if len(text.strip()) > 50 and best_score[1] >= GOOD_OCR_CONFIDENCE:
+                print("Good OCR result achieved, stopping attempts")
+                break
+            continue
+        
+        attempt_data = extract_document_data(attempt_text, doc_type)
+        confidences = field_confidences(attempt_data, attempt['words'])
+        merge_extracted_data(extracted_data, attempt_data, confidences, min_confidence)
+        
+        # Keep the text of the attempt that read the most fields, with
+        # the mean confidence of those fields as a tie break
+        confidence = sum(confidences.values()) / len(confidences) if confidences else 0.0
+        print(f"OCR attempt {i+1}: {len(attempt_text)} characters, field confidence {confidence:.1f}")
+        
+        score = (len(confidences), confidence)
+        if best_score is None or score > best_score:
+            text, words, best_score = attempt_text, attempt['words'], score
+        
+        # Stop as soon as the required fields are present and valid
+        if is_document_valid(text, doc_type, extracted_data):
+            print(f"Required fields for {doc_type} found, stopping attempts")
+            break
+    
+    if extracted_data is not None and not field_driven:
+        attempt_data = extract_document_data(text, doc_type)
+        extracted_data = merge_extracted_data(
+            {'document_type': doc_type}, attempt_data, field_confidences(attempt_data, words), min_confidence
+        )
+    
+    return text, extracted_data
+
+def run_ocr(file_path, doc_type=None, min_confidence=0, used_attempts=None, parallel=False):
+    """
+    Run OCR on a document image, trying several preprocessing and page
+    segmentation settings until the fields needed for the document type
+    have been read
+    
+    See iter_ocr_attempts and select_ocr_result.
     
     Args:
         file_path (str): Path to document image
+        doc_type (str): Type of document (optional)
+        min_confidence (float): Ignore field values read with a lower
+            confidence (0-100)
+        used_attempts (list): If given, every attempt that was run is appended to it
+        parallel (bool): Run fallback attempts in parallel (see iter_ocr_attempts)
+    
+    Returns:
+        tuple: (text, extracted_data). text is the OCR output of the best
+               attempt (may be empty), extracted_data the merged fields with
+               a 'field_confidence' dict, or None without a doc_type.
+               Mock data is never used here.
+    """
+    attempts = iter_ocr_attempts(file_path, parallel)
+    try:
+        return select_ocr_result(attempts, doc_type, min_confidence, used_attempts)
+    finally:
+        # Stops fallback attempts still running in the pool
+        attempts.close()
+
+# Mean word confidence (0-100) at which an attempt is accepted without
+# trying the remaining settings
+GOOD_OCR_CONFIDENCE = 80
+
+# Fields whose validity matters more than their confidence when merging
+# OCR attempts: a valid value is never replaced by an invalid one
+FIELD_VALIDATORS = {
+    'aadhaar_number': is_valid_aadhaar_number,
+    'pan_number': is_valid_pan_number,
+    'pan': is_valid_pan_number,
+}
+
+def merge_extracted_data(merged, data, confidences=None, min_confidence=0):
+    """
+    Merge fields extracted from one OCR attempt into those of earlier attempts
+    
+    A field is taken from the new attempt when it is missing so far, when
+    only the new value is valid, or when it was read with a higher confidence.
+    
+    Args:
+        merged (dict): Fields from earlier attempts, updated in place. Its
+            'field_confidence' dict is kept in step with the chosen values.
+        data (dict): Fields from the latest attempt
+        confidences (dict): Confidence of the new fields (optional)
+        min_confidence (float): Ignore new values read with a lower confidence
+    
+    Returns:
+        dict: The merged fields
+    """
+    confidences = confidences or {}
+    merged_confidences = merged.setdefault('field_confidence', {})
+    
+    for field, value in data.items():
+        if field in ('document_type', 'field_confidence') or not value:
+            continue
+        
+        confidence = confidences.get(field)
+        if min_confidence and (confidence is None or confidence < min_confidence):
+            continue
+        
+        current = merged.get(field)
+        validator = FIELD_VALIDATORS.get(field)
+        if not current:
+            replace = True
+        elif validator and validator(current) != validator(value):
+            replace = validator(value)
+        else:
+            replace = confidence is not None and confidence > merged_confidences.get(field, -1)
+        
+        if replace:
+            merged[field] = value
+            if confidence is not None:
+                merged_confidences[field] = confidence
+            else:
+                merged_confidences.pop(field, None)
+    
+    return merged
+
+def _is_known_doc_type(doc_type):
+    """Check whether a document type has specific required fields"""
+    doc_type = doc_type.lower()
+    return any(kind in doc_type for kind in ('aadhaar', 'pan', 'tax', 'income', 'bank'))
+
+def is_document_valid(text, doc_type, extracted_data):
+    """
+    Check whether the extracted data is enough to accept a document
+    
+    Args:
+        text (str): OCR text
+        doc_type (str): Type of document
+        extracted_data (dict): Extracted data fields
+    
+    Returns:
+        bool: True if valid, False otherwise
+    """
+    if 'aadhaar' in doc_type.lower():
+        return validate_aadhaar(text, extracted_data)
+    elif 'pan' in doc_type.lower():
+        return validate_pan(text, extracted_data)
+    elif 'tax' in doc_type.lower() or 'income' in doc_type.lower():
+        # For income documents, validation is more complex
+        # At minimum, check if we have income data and some identifying info
+        return (extracted_data.get('income') is not None and 
+                (extracted_data.get('name') is not None or 
+                 extracted_data.get('pan') is not None))
+    elif 'bank' in doc_type.lower():
+        # Bank statements must at least identify the account
+        return extracted_data.get('account_number') is not None
+    else:
+        # For unrecognized document types, assume valid if we have some text
+        return len(text.strip()) > 20
+
+def process_document(file_path, doc_type, min_confidence=0, ocr_record=None):
+    """
+    Process document image with OCR and extract relevant information
+    
+    Args:
+        file_path (str): Path to document image or PDF
         doc_type (str): Type of document ('aadhaar-front', 'aadhaar-back', 'pan-front', etc.)
+        min_confidence (float): Minimum OCR confidence (0-100) for a field to be accepted
+        ocr_record (dict): If given, filled with what is needed to re-extract
+            the document later without OCR: 'source' ('ocr', 'pdf' or 'mock'),
+            'pipeline_version' and 'attempts' (see iter_ocr_attempts)
     
     Returns:
         tuple: (extracted_text, is_valid, extracted_data)
@@ -126,53 +563,20 @@ def process_document(file_path, doc_type):
     
     # Flag to track if we're using mock data
     using_mock_data = False
+    source = 'ocr'
+    attempts = []
     
     # Try OCR since we know Tesseract is installed
     try:
-        # Preprocess the image for better OCR
-        preprocessed_image = preprocess_image(file_path)
-        
-        # Also try enhanced version for better recognition
-        enhanced_image = enhance_document_image(file_path)
-        
-        # Try to use pytesseract OCR with multiple attempts
-        ocr_successful = False
-        text = ""
-        
-        # Try different approaches for OCR
-        ocr_attempts = [
-            # 1. Regular preprocessing with default settings
-            lambda: pytesseract.image_to_string(preprocessed_image, lang='eng'),
-            
-            # 2. Enhanced image with default settings
-            lambda: pytesseract.image_to_string(enhanced_image, lang='eng'),
-            
-            # 3. Try different PSM modes with preprocessed image
-            lambda: pytesseract.image_to_string(preprocessed_image, lang='eng', config='--psm 6 --oem 3'),
-            lambda: pytesseract.image_to_string(preprocessed_image, lang='eng', config='--psm 3 --oem 3'),
-            lambda: pytesseract.image_to_string(preprocessed_image, lang='eng', config='--psm 4 --oem 3'),
-            
-            # 4. Try different PSM modes with enhanced image
-            lambda: pytesseract.image_to_string(enhanced_image, lang='eng', config='--psm 6 --oem 3'),
-            lambda: pytesseract.image_to_string(enhanced_image, lang='eng', config='--psm 3 --oem 3')
-        ]
-        
-        # Try each OCR approach until we get decent results
-        for i, ocr_attempt in enumerate(ocr_attempts):
-            try:
-                attempt_text = ocr_attempt()
-                print(f"OCR attempt {i+1}: {len(attempt_text)} characters")
-                
-                # If this attempt produced more text, use it
-                if len(attempt_text.strip()) > len(text.strip()):
-                    text = attempt_text
-                
-                # If we have a decent amount of text, stop trying
-                if len(text.strip()) > 50:
-                    print("Good OCR result achieved, stopping attempts")
-                    break
-            except Exception as e:
-                print(f"OCR attempt {i+1} failed: {e}")
+        if is_pdf_file(file_path):
+            # PDFs use their text layer where present and OCR the other pages
+            text, pdf_info = extract_pdf_text(file_path)
+            print(f"PDF pages: {pdf_info}")
+            extracted_data = extract_document_data(text, doc_type)
+            source = 'pdf'
+            attempts = [{'settings': 'pdf', 'text': text, 'words': []}]
+        else:
+            text, extracted_data = run_ocr(file_path, doc_type, min_confidence, attempts, parallel=True)
         
         # Check if OCR was successful
         ocr_successful = len(text.strip()) > 20
@@ -194,26 +598,21 @@ def process_document(file_path, doc_type):
             print(f"Using mock OCR data for {doc_type}")
         else:
             text = f"Document type: {doc_type}\nSample extracted text for development."
+        
+        # Extract data from the mock OCR text
+        extracted_data = extract_document_data(text, doc_type)
+        source = 'mock'
+        attempts = [{'settings': 'mock', 'text': text, 'words': []}]
     
-    # Extract data from OCR text
-    extracted_data = extract_document_data(text, doc_type)
+    if ocr_record is not None:
+        ocr_record.update({
+            'source': source,
+            'pipeline_version': OCR_PIPELINE_VERSION,
+            'attempts': attempts
+        })
     
     # Validate document based on type (even for mock data, we'll try real validation)
-    is_valid = False
-    
-    if 'aadhaar' in doc_type.lower():
-        is_valid = validate_aadhaar(text, extracted_data)
-    elif 'pan' in doc_type.lower():
-        is_valid = validate_pan(text, extracted_data)
-    elif 'tax' in doc_type.lower() or 'income' in doc_type.lower():
-        # For income documents, validation is more complex
-        # At minimum, check if we have income data and some identifying info
-        is_valid = (extracted_data.get('income') is not None and 
-                   (extracted_data.get('name') is not None or 
-                    extracted_data.get('pan') is not None))
-    else:
-        # For unrecognized document types, assume valid if we have some text
-        is_valid = len(text.strip()) > 20
+    is_valid = is_document_valid(text, doc_type, extracted_data)
     
     # If we don't have enough data and we're using mock OCR, use mock extract data
     if using_mock_data and not is_valid and doc_type in MOCK_EXTRACTED_DATA:
@@ -279,25 +678,35 @@ def extract_document_data(text, doc_type):
             r"\b(\d{12})\b"                   # 123456789012
         ]
         
+        # Prefer the first candidate with a valid checksum, since OCR text can
+        # contain other 12 digit runs (VIDs, misread dates, phone numbers)
+        # Candidates may overlap, e.g. the end of a date followed by the number
+        candidates = []
         for pattern in aadhaar_patterns:
-            aadhaar_match = re.search(pattern, text)
-            if aadhaar_match:
-                aadhaar_num = aadhaar_match.group(1).replace(' ', '')
-                data['aadhaar_number'] = aadhaar_num
-                break
+            for aadhaar_match in re.finditer(f"(?={pattern})", text):
+                candidates.append(re.sub(r"\s", '', aadhaar_match.group(1)))
+        
+        if candidates:
+            valid_candidates = [c for c in candidates if is_valid_aadhaar_number(c)]
+            data['aadhaar_number'] = valid_candidates[0] if valid_candidates else candidates[0]
         
         # We don't need other Aadhaar data for validation, but still extract if available
         if 'back' in doc_type.lower() and 'address' not in data:
             address_match = re.search(r"(?:Address|पता)[:\s]+(.+)", text, re.DOTALL | re.IGNORECASE)
             if address_match:
                 data['address'] = address_match.group(1).strip()
+        
+        # Son/daughter of relation, used to cross-check the father's name on PAN
+        care_of_match = re.search(r"\b(?:S/O|D/O)[:\s]+([A-Za-z\s]+?)\s*(?:,|\n|$)", text, re.IGNORECASE)
+        if care_of_match:
+            data['care_of'] = care_of_match.group(1).strip()
     
     elif 'pan' in doc_type.lower():
         # PAN card number extraction (10 characters: AAAAA9999A)
         pan_pattern = r"\b([A-Z]{5}[0-9]{4}[A-Z]{1})\b"
-        pan_match = re.search(pan_pattern, text)
-        if pan_match:
-            data['pan_number'] = pan_match.group(1)
+        pan_number = _find_pan(pan_pattern, text)
+        if pan_number:
+            data['pan_number'] = pan_number
         
         # Father's name for PAN - should be capital letters
         father_pattern = r"(?:Father|Father's Name|पिता)[:\s]+([A-Z][A-Z\s]+)"
@@ -314,9 +723,9 @@ def extract_document_data(text, doc_type):
     elif 'tax' in doc_type.lower():
         # PAN card number in tax document
         pan_pattern = r"\b([A-Z]{5}[0-9]{4}[A-Z]{1})\b"
-        pan_match = re.search(pan_pattern, text)
-        if pan_match:
-            data['pan'] = pan_match.group(1)
+        pan_number = _find_pan(pan_pattern, text)
+        if pan_number:
+            data['pan'] = pan_number
         
         # Tax year or assessment year
         year_pattern = r"(?:Assessment Year|AY|Tax Year)[:\s]+(\d{4}-\d{2,4})"
@@ -336,4 +745,30 @@ def extract_document_data(text, doc_type):
         if tax_match:
             data['tax_amount'] = tax_match.group(1).replace(',', '')
     
-    return data 
\ No newline at end of file
+    elif 'bank' in doc_type.lower():
+        # Account number, usually 9 to 18 digits, sometimes grouped
+        account_pattern = r"(?:Account\s*(?:No|Number)|A/c\s*No)\.?[:\s]+(\d[\d \-]{7,22}\d)"
+        account_match = re.search(account_pattern, text, re.IGNORECASE)
+        if account_match:
+            data['account_number'] = re.sub(r"[ \-]", '', account_match.group(1))
+        
+        # IFSC code of the branch (4 letters, a zero, 6 letters or digits)
+        ifsc_match = re.search(r"\b([A-Z]{4}0[A-Z0-9]{6})\b", text)
+        if ifsc_match:
+            data['ifsc'] = ifsc_match.group(1)
+        
+        # Closing balance of the statement period
+        balance_pattern = r"Closing\s+Balance[:\s]+(?:Rs\.?|₹|INR)?[,\s]*([\d,]+(?:\.\d{2})?)"
+        balance_match = re.search(balance_pattern, text, re.IGNORECASE)
+        if balance_match:
+            data['closing_balance'] = balance_match.group(1).replace(',', '')
+    
+    return data
+
+def _find_pan(pattern, text):
+    """Return the first PAN candidate with a valid holder type, else the first candidate"""
+    candidates = re.findall(pattern, text)
+    if not candidates:
+        return None
+    valid_candidates = [c for c in candidates if is_valid_pan_number(c)]
+    return valid_candidates[0] if valid_candidates else candidates[0]
@@ -0,0 +1,86 @@
+import os
+import numpy as np
+
+# Bump this whenever the crop size, alignment or detector changes so stale
+# caches are ignored instead of being compared against new crops
+FACE_CACHE_VERSION = 1
+
+FACE_CACHE_DIR = 'faces'
+
+def get_face_cache_path(video_folder, video_id):
+    """
+    Get the path of the face cache file for a video
+
+    Args:
+        video_folder (str): Folder where videos are stored
+        video_id (str): Unique identifier of the video
+
+    Returns:
+        str: Path to the cache file
+    """
+    return os.path.join(video_folder, FACE_CACHE_DIR, f"{video_id}.npz")
+
+def save_face_cache(video_folder, video_id, face_data):
+    """
+    Persist face crops and detection metadata for a video
+
+    Args:
+        video_folder (str): Folder where videos are stored
+        video_id (str): Unique identifier of the video
+        face_data (dict): Output of extract_face_data
+
+    Returns:
+        bool: True if the cache was written, False otherwise
+    """
+    try:
+        cache_path = get_face_cache_path(video_folder, video_id)
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+
+        # Write to a temporary file first so readers never see a partial cache
+        temp_path = f"{cache_path}.tmp.npz"
+        np.savez_compressed(
+            temp_path,
+            version=np.array(FACE_CACHE_VERSION),
+            crops=face_data['crops'],
+            boxes=face_data['boxes'],
+            landmarks=face_data['landmarks'],
+            quality=face_data['quality'],
+            frames_read=np.array(face_data['frames_read'])
+        )
+        os.replace(temp_path, cache_path)
+        return True
+    except Exception as e:
+        print(f"Error saving face cache for {video_id}: {e}")
+        return False
+
+def load_face_cache(video_folder, video_id):
+    """
+    Load cached face crops and detection metadata for a video
+
+    Args:
+        video_folder (str): Folder where videos are stored
+        video_id (str): Unique identifier of the video
+
+    Returns:
+        dict: Face data in the same format as extract_face_data, or None if not cached
+    """
+    cache_path = get_face_cache_path(video_folder, video_id)
+    if not os.path.exists(cache_path):
+        return None
+
+    try:
+        with np.load(cache_path) as cache:
+            if int(cache['version']) != FACE_CACHE_VERSION:
+                print(f"Ignoring outdated face cache for {video_id}")
+                return None
+
+            return {
+                'crops': cache['crops'],
+                'boxes': cache['boxes'],
+                'landmarks': cache['landmarks'],
+                'quality': cache['quality'],
+                'frames_read': int(cache['frames_read'])
+            }
+    except Exception as e:
+        print(f"Error loading face cache for {video_id}: {e}")
+        return None
@@ -0,0 +1,355 @@
+import os
+import json
+import fcntl
+import threading
+import numpy as np
+
+from app.services.face_cache import FACE_CACHE_VERSION
+from app.services.face_verification import (
+    compute_face_embeddings, get_face_recognizer, EMBEDDING_DIM, FACE_EMBEDDING_MODEL
+)
+
+# The gallery keeps the face embeddings of enrolled videos on disk, so every
+# worker maps the same file (and shares its page cache) instead of loading
+# its own copy. Per generation there are three append-only files:
+#   embeddings-<generation>.f32  float32 rows of EMBEDDING_DIM, one per face crop
+#   ids-<generation>.idx         video id of each row, ID_WIDTH bytes each
+#   deleted-<generation>.idx     ids removed since the generation was written
+# gallery.json names the current generation; compaction writes the next one.
+# Each process indexes the ids of a generation as it maps them, so looking
+# up a video reads its rows only. Videos are only enrolled, and the gallery
+# only read, when the embedding model verify_faces uses is available.
+GALLERY_DIR = 'gallery'
+ID_WIDTH = 40
+ID_DTYPE = np.dtype(f'S{ID_WIDTH}')
+
+# Compact once this share of the rows belongs to deleted videos
+COMPACTION_RATIO = 0.25
+
+# Rows copied at a time when compacting
+COMPACTION_BATCH_ROWS = 65536
+
+# Ids read at a time when indexing a generation
+INDEX_BATCH_ROWS = 65536
+
+# One gallery object per folder and process, refreshed when another worker appends
+_galleries = {}
+_galleries_lock = threading.Lock()
+
+def get_face_gallery(video_folder):
+    """
+    Get the face gallery of a video folder
+
+    Args:
+        video_folder (str): Folder where videos are stored
+
+    Returns:
+        FaceGallery: Gallery shared by the requests of this process
+    """
+    with _galleries_lock:
+        if video_folder not in _galleries:
+            _galleries[video_folder] = FaceGallery(os.path.join(video_folder, GALLERY_DIR))
+        return _galleries[video_folder]
+
+def _size(path):
+    """Size of a file, or 0 if it doesn't exist"""
+    try:
+        return os.path.getsize(path)
+    except FileNotFoundError:
+        return 0
+
+def _truncate(path, size):
+    """Drop a partly written tail left by a writer that died"""
+    if _size(path) > size:
+        os.truncate(path, size)
+
+def _index_rows(ids, start, index):
+    """
+    Add the rows of ids from start on to an index of id -> ((start, stop), ...)
+
+    The rows of a video are appended together, so a video has one range
+    unless it was enrolled again. Ranges are tuples: an index can be copied
+    and extended while readers use the copy it was made from.
+    """
+    for batch_start in range(start, len(ids), INDEX_BATCH_ROWS):
+        batch = np.asarray(ids[batch_start:batch_start + INDEX_BATCH_ROWS])
+        boundaries = np.flatnonzero(batch[1:] != batch[:-1]) + 1
+        run_starts = np.concatenate(([0], boundaries)) + batch_start
+        run_stops = np.concatenate((boundaries, [len(batch)])) + batch_start
+        for key, run_start, run_stop in zip(batch[run_starts - batch_start].tolist(),
+                                            run_starts.tolist(), run_stops.tolist()):
+            ranges = index.get(key, ())
+            if ranges and ranges[-1][1] == run_start:
+                # The run continues the last one (split across batches or appends)
+                index[key] = ranges[:-1] + ((ranges[-1][0], run_stop),)
+            else:
+                index[key] = ranges + ((run_start, run_stop),)
+    return index
+
+class FaceGallery:
+    """Memory-mapped, append-only store of face embeddings by video id"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._state = None
+        os.makedirs(path, exist_ok=True)
+
+    def _file(self, kind, generation):
+        extension = 'f32' if kind == 'embeddings' else 'idx'
+        return os.path.join(self.path, f'{kind}-{generation}.{extension}')
+
+    def _read_manifest(self):
+        """Current generation, or a new empty one if the embeddings changed"""
+        try:
+            with open(os.path.join(self.path, 'gallery.json')) as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            manifest = None
+
+        model = os.path.basename(FACE_EMBEDDING_MODEL)
+        if manifest is None or manifest['version'] != FACE_CACHE_VERSION or manifest['dim'] != EMBEDDING_DIM or \
+           manifest.get('model') != model:
+            generation = manifest['generation'] + 1 if manifest else 0
+            manifest = {'version': FACE_CACHE_VERSION, 'dim': EMBEDDING_DIM, 'model': model,
+                        'generation': generation, 'new': True}
+        return manifest
+
+    def _write_manifest(self, manifest):
+        manifest_path = os.path.join(self.path, 'gallery.json')
+        with open(manifest_path + '.tmp', 'w') as f:
+            json.dump({key: value for key, value in manifest.items() if key != 'new'}, f)
+        os.replace(manifest_path + '.tmp', manifest_path)
+
+    def _open(self, generation, previous=None):
+        """
+        Map the files of a generation; only committed rows are visible
+
+        Args:
+            generation (int): Generation to map
+            previous (dict): State mapped before, whose index is extended
+                             when it is of the same generation
+        """
+        ids_path = self._file('ids', generation)
+        embeddings_path = self._file('embeddings', generation)
+        deleted_path = self._file('deleted', generation)
+
+        ids_size = _size(ids_path)
+        deleted_size = _size(deleted_path)
+        rows = min(ids_size // ID_WIDTH, _size(embeddings_path) // (EMBEDDING_DIM * 4))
+
+        if rows:
+            ids = np.memmap(ids_path, dtype=ID_DTYPE, mode='r', shape=(rows,))
+            embeddings = np.memmap(embeddings_path, dtype=np.float32, mode='r', shape=(rows, EMBEDDING_DIM))
+        else:
+            ids = np.zeros(0, ID_DTYPE)
+            embeddings = np.zeros((0, EMBEDDING_DIM), np.float32)
+
+        if previous is not None and previous['generation'] == generation and len(previous['ids']) <= rows:
+            index = _index_rows(ids, len(previous['ids']), dict(previous['index']))
+        else:
+            index = _index_rows(ids, 0, {})
+
+        # Deletions are few, so they are read into a set
+        deleted = set()
+        if deleted_size >= ID_WIDTH:
+            deleted = set(np.fromfile(deleted_path, dtype=ID_DTYPE, count=deleted_size // ID_WIDTH).tolist())
+
+        return {
+            'generation': generation,
+            'ids_size': ids_size,
+            'deleted_size': deleted_size,
+            'ids': ids,
+            'embeddings': embeddings,
+            'index': index,
+            'deleted': deleted
+        }
+
+    def refresh(self):
+        """
+        Pick up rows appended, deleted or compacted by other processes
+
+        Only stats the files, so it is cheap to call before every read.
+        """
+        with self._lock:
+            manifest = self._read_manifest()
+            state = self._state
+            if state is None or state['generation'] != manifest['generation'] or \
+               state['ids_size'] != _size(self._file('ids', manifest['generation'])) or \
+               state['deleted_size'] != _size(self._file('deleted', manifest['generation'])):
+                self._state = self._open(manifest['generation'], state)
+            return self._state
+
+    def _write_lock(self):
+        """Exclusive lock across processes for appends and compaction"""
+        lock_file = open(os.path.join(self.path, 'gallery.lock'), 'a')
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        return lock_file
+
+    def add(self, video_id, embeddings):
+        """
+        Append the embeddings of a video
+
+        Args:
+            video_id (str): Unique identifier of the video
+            embeddings (numpy.ndarray): N x EMBEDDING_DIM embeddings
+        """
+        key = video_id.encode('ascii')
+        if len(key) > ID_WIDTH:
+            raise ValueError(f'Video ids are limited to {ID_WIDTH} characters')
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32).reshape(-1, EMBEDDING_DIM)
+        if len(embeddings) == 0:
+            return
+
+        with self._write_lock():
+            manifest = self._read_manifest()
+            if manifest.get('new'):
+                self._write_manifest(manifest)
+
+            ids_path = self._file('ids', manifest['generation'])
+            embeddings_path = self._file('embeddings', manifest['generation'])
+            rows = _size(ids_path) // ID_WIDTH
+            _truncate(ids_path, rows * ID_WIDTH)
+            _truncate(embeddings_path, rows * EMBEDDING_DIM * 4)
+
+            # Rows only count once their ids are written, so readers never
+            # see embeddings without an owner
+            with open(embeddings_path, 'ab') as f:
+                f.write(embeddings.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            with open(ids_path, 'ab') as f:
+                f.write(np.full(len(embeddings), key, dtype=ID_DTYPE).tobytes())
+
+    def remove(self, video_ids):
+        """
+        Mark the embeddings of videos as deleted; compact drops them
+
+        Args:
+            video_ids (list): Unique identifiers of the videos
+        """
+        keys = np.array([video_id.encode('ascii') for video_id in video_ids if len(video_id) <= ID_WIDTH], dtype=ID_DTYPE)
+
+        # Only videos with faces were enrolled
+        state = self.refresh()
+        keys = keys[[key in state['index'] for key in keys.tolist()]]
+        if len(keys) == 0:
+            return
+
+        with self._write_lock():
+            manifest = self._read_manifest()
+            with open(self._file('deleted', manifest['generation']), 'ab') as f:
+                f.write(keys.tobytes())
+
+    def get(self, video_id):
+        """
+        Get the embeddings of a video
+
+        Args:
+            video_id (str): Unique identifier of the video
+
+        Returns:
+            numpy.ndarray: N x EMBEDDING_DIM embeddings, or None if not enrolled
+        """
+        state = self.refresh()
+        key = video_id.encode('ascii', 'replace')
+        if key in state['deleted']:
+            return None
+
+        ranges = state['index'].get(key)
+        if ranges is None:
+            return None
+        return np.concatenate([state['embeddings'][start:stop] for start, stop in ranges])
+
+    def stats(self):
+        """
+        Count rows
+
+        Returns:
+            dict: 'generation', 'rows' and 'deleted_rows'
+        """
+        state = self.refresh()
+        deleted_rows = sum(stop - start for key in state['deleted']
+                           for start, stop in state['index'].get(key, ()))
+        return {'generation': state['generation'], 'rows': len(state['ids']), 'deleted_rows': deleted_rows}
+
+    def compact(self):
+        """
+        Rewrite the gallery without deleted rows, as a new generation
+
+        Readers keep using the old files they have mapped until they refresh.
+
+        Returns:
+            int: Number of rows dropped
+        """
+        with self._write_lock():
+            manifest = self._read_manifest()
+            state = self._open(manifest['generation'])
+            if not state['deleted']:
+                return 0
+
+            deleted = np.array(list(state['deleted']), dtype=ID_DTYPE)
+            generation = manifest['generation'] + 1
+            kept = 0
+            with open(self._file('embeddings', generation), 'wb') as embeddings_file, \
+                 open(self._file('ids', generation), 'wb') as ids_file:
+                for start in range(0, len(state['ids']), COMPACTION_BATCH_ROWS):
+                    ids = state['ids'][start:start + COMPACTION_BATCH_ROWS]
+                    live = ~np.isin(ids, deleted)
+                    embeddings_file.write(np.ascontiguousarray(state['embeddings'][start:start + COMPACTION_BATCH_ROWS][live]).tobytes())
+                    ids_file.write(np.ascontiguousarray(ids[live]).tobytes())
+                    kept += int(live.sum())
+                embeddings_file.flush()
+                os.fsync(embeddings_file.fileno())
+
+            self._write_manifest(dict(manifest, generation=generation, new=False))
+            for kind in ('embeddings', 'ids', 'deleted'):
+                try:
+                    os.unlink(self._file(kind, manifest['generation']))
+                except FileNotFoundError:
+                    pass
+
+            return len(state['ids']) - kept
+
+def enroll_faces(video_folder, video_id, face_data):
+    """
+    Add the embeddings of the face crops of a video to the gallery
+
+    Args:
+        video_folder (str): Folder where videos are stored
+        video_id (str): Unique identifier of the video
+        face_data (dict): Output of extract_face_data
+
+    Returns:
+        bool: True if faces were enrolled, False without faces or without
+              the embedding model
+    """
+    if face_data is None or len(face_data['crops']) == 0:
+        return False
+
+    try:
+        embeddings = compute_face_embeddings(face_data['crops'])
+        if embeddings is None:
+            return False
+        get_face_gallery(video_folder).add(video_id, embeddings)
+        return True
+    except Exception as e:
+        print(f"Error enrolling faces of {video_id}: {e}")
+        return False
+
+def get_enrolled_embeddings(video_folder, video_id):
+    """
+    Get the gallery embeddings of a video, as passed to verify_faces
+
+    Returns:
+        numpy.ndarray: Embeddings, or None if the video is not enrolled or
+                       the embedding model is not available
+    """
+    if get_face_recognizer() is None:
+        return None
+
+    try:
+        return get_face_gallery(video_folder).get(video_id)
+    except Exception as e:
+        print(f"Error reading face gallery for {video_id}: {e}")
+        return None
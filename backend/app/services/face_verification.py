@@ -2,17 +2,130 @@ import cv2
 import numpy as np
 import os
 import tempfile
+import threading
 
-# Try to import DeepFace, but don't fail if it's not available
-try:
-    from deepface import DeepFace
-    DEEPFACE_AVAILABLE = True
-except Exception as e:
-    print(f"Warning: DeepFace import failed: {e}")
-    print("Using fallback image comparison method instead.")
-    DEEPFACE_AVAILABLE = False
+# DeepFace pulls in TensorFlow, which takes seconds and hundreds of MB to
+# import, so it is only loaded the first time a face actually needs verifying
+_deepface = None
+_deepface_loaded = False
+_deepface_lock = threading.Lock()
 
-def verify_faces(baseline_video_path, new_video_path, tolerance=0.6):
+# Size of the square, aligned face crops kept for verification
+FACE_CROP_SIZE = 160
+
+# How many frames to sample from a video when looking for faces
+MAX_SAMPLED_FRAMES = 5
+FRAME_SAMPLE_STRIDE = 5
+
+# detect_face crops a square this many times the size of the detected face
+FACE_CROP_MARGIN = 1.2
+
+# Fallback matcher: OpenCV's SFace embedding (face_recognition_sface_2021dec.onnx
+# from the OpenCV model zoo), run through cv2.dnn. It needs no TensorFlow and
+# takes a few milliseconds per crop. Without the model file, or without a
+# face in both videos, a verification needs manual review.
+FACE_EMBEDDING_MODEL = os.environ.get('FACE_EMBEDDING_MODEL', '')
+EMBEDDING_DIM = 128
+SFACE_INPUT_SIZE = 112
+
+# Cosine similarity above which two embeddings are the same person. 0.363 is
+# OpenCV's threshold for SFace, calibrated on LFW.
+FACE_EMBEDDING_THRESHOLD = float(os.environ.get('FACE_EMBEDDING_THRESHOLD', 0.363))
+
+# The SFace model is loaded once per process on first use; cv2.dnn networks
+# can't run two inputs at once, so calls are serialized
+_face_recognizer = None
+_face_recognizer_loaded = False
+_face_recognizer_lock = threading.Lock()
+
+# Haar cascades are loaded once per process on first use
+_face_cascade = None
+_eye_cascade = None
+
+def get_deepface():
+    """
+    Import DeepFace on first use
+    
+    Returns:
+        module: The DeepFace module, or None if it is not available
+    """
+    global _deepface, _deepface_loaded
+    if _deepface_loaded:
+        return _deepface
+    
+    with _deepface_lock:
+        if not _deepface_loaded:
+            try:
+                from deepface import DeepFace
+                _deepface = DeepFace
+            except Exception as e:
+                print(f"Warning: DeepFace import failed: {e}")
+                print("Using fallback image comparison method instead.")
+                _deepface = None
+            _deepface_loaded = True
+    
+    return _deepface
+
+def warm_up_deepface():
+    """
+    Import DeepFace and build the verification model ahead of the first request
+    
+    Returns:
+        bool: True if DeepFace is ready, False if the fallback method will be used
+    """
+    DeepFace = get_deepface()
+    if DeepFace is None:
+        return False
+    
+    try:
+        DeepFace.build_model("VGG-Face")
+        return True
+    except Exception as e:
+        print(f"Warning: Could not build DeepFace model: {e}")
+        return False
+
+def get_face_recognizer():
+    """
+    Load the SFace embedding model on first use
+    
+    Returns:
+        cv2.FaceRecognizerSF: The recognizer, or None if FACE_EMBEDDING_MODEL
+                              is not set or can't be loaded
+    """
+    global _face_recognizer, _face_recognizer_loaded
+    if _face_recognizer_loaded:
+        return _face_recognizer
+    
+    with _face_recognizer_lock:
+        if not _face_recognizer_loaded:
+            if FACE_EMBEDDING_MODEL:
+                try:
+                    _face_recognizer = cv2.FaceRecognizerSF.create(FACE_EMBEDDING_MODEL, "")
+                except Exception as e:
+                    print(f"Warning: Could not load face embedding model {FACE_EMBEDDING_MODEL}: {e}")
+            _face_recognizer_loaded = True
+    
+    return _face_recognizer
+
+def _get_cascades():
+    """Load the OpenCV Haar cascades bundled with opencv-python"""
+    global _face_cascade, _eye_cascade
+    if _face_cascade is None:
+        _face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+        _eye_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_eye.xml')
+    return _face_cascade, _eye_cascade
+
+def _verification_result(is_same_person, method=None, similarity=None):
+    """Result of verify_faces; is_same_person is None when the video needs manual review"""
+    return {
+        'is_same_person': is_same_person,
+        'needs_review': is_same_person is None,
+        'method': method,
+        'similarity': round(similarity, 4) if similarity is not None else None
+    }
+
+def verify_faces(baseline_video_path, new_video_path, tolerance=0.6, baseline_faces=None, new_faces=None,
+                 baseline_embeddings=None):
     """
     Compare faces between two videos to verify if they are the same person
     
@@ -20,23 +133,45 @@ def verify_faces(baseline_video_path, new_video_path, tolerance=0.6):
         baseline_video_path (str): Path to the first video
         new_video_path (str): Path to the second video
         tolerance (float): Face recognition tolerance threshold
+        baseline_faces (dict): Cached face data for the baseline video (optional).
+            When provided the baseline video is not decoded again.
+        new_faces (dict): Face data already extracted from the new video (optional)
+        baseline_embeddings (numpy.ndarray): Embeddings of the baseline crops,
+            as returned by compute_face_embeddings (optional)
         
     Returns:
-        bool: True if same person, False otherwise
+        dict: 'is_same_person' (bool, or None when neither DeepFace nor the
+              embedding model could compare the faces), 'needs_review',
+              'method' ('deepface', 'embedding' or None) and 'similarity'
+              (cosine similarity of the embeddings, None with DeepFace)
     """
     try:
-        # Extract frame from baseline video
-        baseline_frame = extract_first_frame(baseline_video_path)
-        if baseline_frame is None:
-            return False
+        # Use cached baseline crops if available, otherwise decode the video
+        if baseline_faces is None or len(baseline_faces['crops']) == 0:
+            baseline_faces = extract_face_data(baseline_video_path)
+        if baseline_faces is None:
+            return _verification_result(False)
+        
+        if new_faces is None:
+            new_faces = extract_face_data(new_video_path)
+        if new_faces is None:
+            return _verification_result(False)
         
-        # Extract frame from new video
-        new_frame = extract_first_frame(new_video_path)
-        if new_frame is None:
-            return False
+        # Compare aligned crops when a face was found in both videos,
+        # otherwise fall back to the raw first frames
+        use_crops = len(baseline_faces['crops']) > 0 and len(new_faces['crops']) > 0
+        if use_crops:
+            baseline_frame = baseline_faces['crops'][0]
+            new_frame = new_faces['crops'][0]
+        else:
+            baseline_frame = extract_first_frame(baseline_video_path)
+            new_frame = extract_first_frame(new_video_path)
+            if baseline_frame is None or new_frame is None:
+                return _verification_result(False)
         
         # Try to use DeepFace if available
-        if DEEPFACE_AVAILABLE:
+        DeepFace = get_deepface()
+        if DeepFace is not None:
             try:
                 # Save frames to temporary files for DeepFace
                 with tempfile.NamedTemporaryFile(suffix='.jpg', delete=False) as f1, \
@@ -49,12 +184,14 @@ def verify_faces(baseline_video_path, new_video_path, tolerance=0.6):
                     cv2.imwrite(new_temp, new_frame)
                 
                 try:
-                    # Verify faces using DeepFace
+                    # Verify faces using DeepFace. Crops are already detected and
+                    # aligned, so DeepFace can skip its own detection step.
                     result = DeepFace.verify(
                         img1_path=baseline_temp,
                         img2_path=new_temp,
                         enforce_detection=False,  # Don't enforce face detection (more lenient)
-                        model_name="VGG-Face"     # Faster model
+                        model_name="VGG-Face",    # Faster model
+                        detector_backend="skip" if use_crops else "opencv"
                     )
                     
                     # Clean up temporary files
@@ -62,29 +199,199 @@ def verify_faces(baseline_video_path, new_video_path, tolerance=0.6):
                     os.unlink(new_temp)
                     
                     # Get verification result
-                    is_same_person = result.get('verified', False)
+                    is_same_person = bool(result.get('verified', False))
                     
-                    return is_same_person
+                    return _verification_result(is_same_person, 'deepface')
                 
                 except Exception as e:
-                    # If DeepFace fails, clean up and fall back to histogram comparison
+                    # If DeepFace fails, clean up and fall back to the embedding model
                     os.unlink(baseline_temp)
                     os.unlink(new_temp)
-                    print(f"DeepFace verification failed: {e}. Falling back to histogram comparison.")
+                    print(f"DeepFace verification failed: {e}. Falling back to face embeddings.")
                     # Continue to fallback method
             
             except Exception as e:
                 print(f"Error preparing images for DeepFace: {e}. Using fallback method.")
                 # Continue to fallback method
         
-        # Fallback: histogram comparison
-        similarity = compare_frames(baseline_frame, new_frame)
-        print(f"Using fallback comparison method. Similarity score: {similarity}")
-        return similarity >= 0.5
+        # Fallback: SFace embeddings. Each new crop is matched with its
+        # closest baseline crop and the similarities are averaged, so a
+        # single lucky pair doesn't decide.
+        if use_crops:
+            if baseline_embeddings is None or len(baseline_embeddings) == 0:
+                baseline_embeddings = compute_face_embeddings(baseline_faces['crops'])
+            new_embeddings = compute_face_embeddings(new_faces['crops']) if baseline_embeddings is not None else None
+            if new_embeddings is not None:
+                similarity = float((new_embeddings @ baseline_embeddings.T).max(axis=1).mean())
+                print(f"Using face embeddings. Similarity score: {similarity}")
+                return _verification_result(similarity >= FACE_EMBEDDING_THRESHOLD, 'embedding', similarity)
+            print("No face embedding model (FACE_EMBEDDING_MODEL). Needs manual review.")
+        else:
+            print("No face found in both videos to compare. Needs manual review.")
+        return _verification_result(None)
     
     except Exception as e:
         print(f"Error in face verification: {e}")
-        return False
+        return _verification_result(False)
+
+def extract_face_data(video_path, max_frames=MAX_SAMPLED_FRAMES, stride=FRAME_SAMPLE_STRIDE):
+    """
+    Sample frames from a video and extract aligned face crops with detection metadata
+    
+    Args:
+        video_path (str): Path to the video file
+        max_frames (int): Maximum number of frames to sample
+        stride (int): Number of frames between samples
+        
+    Returns:
+        dict: Face data with 'crops' (N x size x size x 3 uint8), 'boxes' (N x 4),
+              'landmarks' (N x 2 x 2 eye centers, NaN if not found), 'quality' (N,)
+              sorted by quality (best first) and 'frames_read'.
+              None if no frame could be read from the video.
+    """
+    cap = None
+    try:
+        cap = cv2.VideoCapture(video_path)
+        return detect_faces_in_frames(_sample_frames(cap, max_frames, stride))
+        
+    except Exception as e:
+        print(f"Error extracting faces from video: {e}")
+        return None
+    finally:
+        if cap is not None:
+            cap.release()
+
+def _sample_frames(cap, max_frames, stride):
+    """Yield every stride-th frame of a capture, up to max_frames"""
+    frames_read = 0
+    frame_index = 0
+    
+    # Read sequentially instead of seeking, since browser WebM files
+    # usually have no index and seeking decodes from the start anyway
+    while frames_read < max_frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        
+        if frame_index % stride == 0:
+            frames_read += 1
+            yield frame
+        frame_index += 1
+
+def detect_faces_in_frames(frames):
+    """
+    Extract aligned face crops from already sampled frames
+    
+    Args:
+        frames (iterable): BGR frames
+        
+    Returns:
+        dict: Face data as returned by extract_face_data, or None without frames
+    """
+    faces = []
+    frames_read = 0
+    for frame in frames:
+        frames_read += 1
+        face = detect_face(frame)
+        if face is not None:
+            faces.append(face)
+    
+    if frames_read == 0:
+        return None
+    
+    return _stack_faces(faces, frames_read)
+
+def _stack_faces(faces, frames_read):
+    """Stack per-frame detections into arrays sorted by quality (best first)"""
+    faces = sorted(faces, key=lambda face: face['quality'], reverse=True)
+    
+    if not faces:
+        return {
+            'crops': np.zeros((0, FACE_CROP_SIZE, FACE_CROP_SIZE, 3), np.uint8),
+            'boxes': np.zeros((0, 4), np.int32),
+            'landmarks': np.zeros((0, 2, 2), np.float32),
+            'quality': np.zeros((0,), np.float32),
+            'frames_read': frames_read
+        }
+    
+    return {
+        'crops': np.stack([face['crop'] for face in faces]),
+        'boxes': np.array([face['box'] for face in faces], np.int32),
+        'landmarks': np.array([face['landmarks'] for face in faces], np.float32),
+        'quality': np.array([face['quality'] for face in faces], np.float32),
+        'frames_read': frames_read
+    }
+
+def detect_face(frame):
+    """
+    Detect the largest face in a frame and return an aligned crop
+    
+    Args:
+        frame (numpy.ndarray): BGR frame
+        
+    Returns:
+        dict: 'crop', 'box' (x, y, w, h), 'landmarks' (eye centers) and 'quality',
+              or None if no face was found
+    """
+    face_cascade, eye_cascade = _get_cascades()
+    
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    
+    # Detect on a downscaled copy to keep detection cheap on HD recordings
+    scale = 1.0
+    max_dim = max(gray.shape[0], gray.shape[1])
+    if max_dim > 640:
+        scale = 640 / max_dim
+        small = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    else:
+        small = gray
+    
+    detections = face_cascade.detectMultiScale(small, scaleFactor=1.1, minNeighbors=5, minSize=(40, 40))
+    if len(detections) == 0:
+        return None
+    
+    # Keep the largest face and map it back to full resolution
+    x, y, w, h = max(detections, key=lambda d: d[2] * d[3])
+    x, y, w, h = [int(round(v / scale)) for v in (x, y, w, h)]
+    
+    face_gray = gray[y:y+h, x:x+w]
+    
+    # Look for eyes in the upper half of the face to use as landmarks
+    landmarks = np.full((2, 2), np.nan, np.float32)
+    eyes = eye_cascade.detectMultiScale(face_gray[:h // 2], scaleFactor=1.1, minNeighbors=5)
+    if len(eyes) >= 2:
+        eyes = sorted(eyes, key=lambda e: e[2] * e[3], reverse=True)[:2]
+        centers = sorted([(x + ex + ew / 2.0, y + ey + eh / 2.0) for ex, ey, ew, eh in eyes])
+        landmarks = np.array(centers, np.float32)
+    
+    # Rotate around the face center so the eyes are level
+    center = (x + w / 2.0, y + h / 2.0)
+    if not np.isnan(landmarks).any():
+        (lx, ly), (rx, ry) = landmarks
+        angle = float(np.degrees(np.arctan2(ry - ly, rx - lx)))
+        rotation = cv2.getRotationMatrix2D(center, angle, 1.0)
+        aligned = cv2.warpAffine(frame, rotation, (frame.shape[1], frame.shape[0]), flags=cv2.INTER_LINEAR)
+    else:
+        aligned = frame
+    
+    # Crop a square around the face with a small margin
+    side = int(max(w, h) * FACE_CROP_MARGIN)
+    x0 = int(max(0, center[0] - side / 2))
+    y0 = int(max(0, center[1] - side / 2))
+    x1 = int(min(aligned.shape[1], x0 + side))
+    y1 = int(min(aligned.shape[0], y0 + side))
+    crop = cv2.resize(aligned[y0:y1, x0:x1], (FACE_CROP_SIZE, FACE_CROP_SIZE), interpolation=cv2.INTER_AREA)
+    
+    # Quality combines sharpness and face size, both clipped to 0-1
+    sharpness = cv2.Laplacian(face_gray, cv2.CV_64F).var()
+    quality = min(1.0, sharpness / 300.0) * min(1.0, min(w, h) / 120.0)
+    
+    return {
+        'crop': crop,
+        'box': (x, y, w, h),
+        'landmarks': landmarks,
+        'quality': float(quality)
+    }
 
 def extract_first_frame(video_path):
     """
@@ -115,34 +422,30 @@ def extract_first_frame(video_path):
         if 'cap' in locals():
             cap.release()
 
-def compare_frames(frame1, frame2):
+def compute_face_embeddings(crops):
     """
-    Compare two frames using histogram comparison
+    Compute SFace embeddings for a batch of face crops
     
     Args:
-        frame1 (numpy.ndarray): First frame
-        frame2 (numpy.ndarray): Second frame
+        crops (numpy.ndarray): N x H x W x 3 BGR crops from detect_face
         
     Returns:
-        float: Similarity score (0-1, higher is more similar)
+        numpy.ndarray: N x EMBEDDING_DIM float32 embeddings with unit L2 norm,
+                       or None if the embedding model is not available
     """
-    # Convert frames to grayscale
-    gray1 = cv2.cvtColor(frame1, cv2.COLOR_BGR2GRAY)
-    gray2 = cv2.cvtColor(frame2, cv2.COLOR_BGR2GRAY)
-    
-    # Resize to same dimensions if needed
-    if gray1.shape != gray2.shape:
-        gray2 = cv2.resize(gray2, (gray1.shape[1], gray1.shape[0]))
-    
-    # Calculate histograms
-    hist1 = cv2.calcHist([gray1], [0], None, [256], [0, 256])
-    hist2 = cv2.calcHist([gray2], [0], None, [256], [0, 256])
-    
-    # Normalize histograms
-    cv2.normalize(hist1, hist1, 0, 1, cv2.NORM_MINMAX)
-    cv2.normalize(hist2, hist2, 0, 1, cv2.NORM_MINMAX)
-    
-    # Compare histograms
-    similarity = cv2.compareHist(hist1, hist2, cv2.HISTCMP_CORREL)
+    recognizer = get_face_recognizer()
+    if recognizer is None:
+        return None
+    if len(crops) == 0:
+        return np.zeros((0, EMBEDDING_DIM), np.float32)
     
-    return similarity 
\ No newline at end of file
+    # SFace expects tight crops, so the margin detect_face adds is cut off
+    inset = int(round(FACE_CROP_SIZE * (1 - 1 / FACE_CROP_MARGIN) / 2))
+    faces = [
+        cv2.resize(crop[inset:FACE_CROP_SIZE - inset, inset:FACE_CROP_SIZE - inset],
+                   (SFACE_INPUT_SIZE, SFACE_INPUT_SIZE), interpolation=cv2.INTER_AREA)
+        for crop in crops
+    ]
+    with _face_recognizer_lock:
+        embeddings = np.stack([recognizer.feature(face).reshape(-1) for face in faces]).astype(np.float32)
+    return embeddings / np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
@@ -0,0 +1,118 @@
+import hmac
+import hashlib
+
+from app.services.consistency_checker import normalize_identifier
+from app.utils.validators import is_valid_aadhaar_number, is_valid_pan_number
+
+# Identifier fields produced by extract_document_data, with the check a
+# value must pass before it is indexed
+IDENTIFIER_FIELDS = {
+    'aadhaar_number': ('aadhaar', is_valid_aadhaar_number),
+    'pan_number': ('pan', is_valid_pan_number),
+    'pan': ('pan', is_valid_pan_number),
+}
+
+def hash_identifier(key, identifier_type, value):
+    """
+    Compute the keyed hash under which an identifier is indexed
+
+    Raw Aadhaar and PAN numbers are never stored, only their HMAC.
+
+    Args:
+        key (str): Secret HMAC key
+        identifier_type (str): 'aadhaar' or 'pan'
+        value (str): Normalized identifier
+
+    Returns:
+        str: Hex digest
+    """
+    message = f"{identifier_type}:{value}".encode('utf-8')
+    return hmac.new(key.encode('utf-8'), message, hashlib.sha256).hexdigest()
+
+def get_identifiers(extracted_data):
+    """
+    Get the well-formed identifiers found in extracted document data
+
+    Args:
+        extracted_data (dict): Output of extract_document_data
+
+    Returns:
+        dict: Normalized identifier keyed by identifier type
+    """
+    identifiers = {}
+    for field, (identifier_type, is_valid) in IDENTIFIER_FIELDS.items():
+        value = normalize_identifier(extracted_data.get(field))
+        if value and is_valid(value):
+            identifiers[identifier_type] = value
+    return identifiers
+
+def find_duplicates(db, key, extracted_data, application_id=None):
+    """
+    Find other applications that used the same Aadhaar or PAN number
+
+    Only documents of applications are compared: a document uploaded
+    without an application can't be told apart from another upload by the
+    same person, so it is neither checked nor counted as a duplicate.
+
+    Args:
+        db (sqlite3.Connection): Database connection
+        key (str): Secret HMAC key
+        extracted_data (dict): Output of extract_document_data
+        application_id (str): Application the document belongs to
+
+    Returns:
+        dict: Other application ids keyed by identifier type, empty
+              without an application_id
+    """
+    if not application_id:
+        return {}
+
+    duplicates = {}
+    for identifier_type, value in get_identifiers(extracted_data).items():
+        rows = db.execute(
+            'SELECT DISTINCT application_id FROM identity_index'
+            ' WHERE identifier_type = ? AND identifier_hash = ?'
+            ' AND application_id IS NOT NULL AND application_id != ?',
+            (identifier_type, hash_identifier(key, identifier_type, value), application_id)
+        ).fetchall()
+        if rows:
+            duplicates[identifier_type] = sorted(row['application_id'] for row in rows)
+    return duplicates
+
+def index_identifiers(db, key, identifiers, document_id, application_id=None):
+    """
+    Add already extracted identifiers of a document to the index
+
+    Args:
+        db (sqlite3.Connection): Database connection
+        key (str): Secret HMAC key
+        identifiers (dict): Output of get_identifiers
+        document_id (str): Unique identifier of the uploaded document
+        application_id (str): Application the document belongs to (optional)
+    """
+    for identifier_type, value in identifiers.items():
+        db.execute(
+            'INSERT OR REPLACE INTO identity_index'
+            ' (identifier_type, identifier_hash, document_id, application_id)'
+            ' VALUES (?, ?, ?, ?)',
+            (identifier_type, hash_identifier(key, identifier_type, value), document_id, application_id)
+        )
+
+def record_identifiers(db, key, extracted_data, document_id, application_id=None):
+    """
+    Add the identifiers of a document to the index
+
+    Args:
+        db (sqlite3.Connection): Database connection
+        key (str): Secret HMAC key
+        extracted_data (dict): Output of extract_document_data
+        document_id (str): Unique identifier of the uploaded document
+        application_id (str): Application the document belongs to (optional)
+
+    Returns:
+        int: Number of identifiers indexed
+    """
+    identifiers = get_identifiers(extracted_data)
+    index_identifiers(db, key, identifiers, document_id, application_id)
+    db.commit()
+    return len(identifiers)
@@ -0,0 +1,110 @@
+import cv2
+import numpy as np
+
+from app.services.face_verification import detect_face, compute_face_embeddings, FACE_EMBEDDING_THRESHOLD
+
+# A verdict is given as soon as this many frames had a usable face
+LIVE_REQUIRED_GOOD_FRAMES = 3
+
+# Frames with a face below this quality (see detect_face) don't count
+LIVE_MIN_FACE_QUALITY = 0.2
+
+# A verdict is forced after this many frames, so a session can't run forever
+LIVE_MAX_FRAMES = 60
+
+# Larger messages are rejected; clients are expected to send downscaled JPEGs
+LIVE_MAX_FRAME_BYTES = 512 * 1024
+
+# Frames are downscaled to this size before detection
+LIVE_MAX_FRAME_DIM = 640
+
+class LiveVerificationSession:
+    """
+    Face presence and matching over frames sent one by one while recording
+
+    Each frame is decoded and checked for a face. When a baseline is known
+    and the embedding model is available, every good face is embedded and
+    matched against the baseline the way verify_faces matches crops: its
+    closest baseline embedding, averaged over the good frames.
+    """
+
+    def __init__(self, baseline_embeddings=None):
+        self.baseline_embeddings = baseline_embeddings
+        self.frames = 0
+        self.good_frames = 0
+        self.similarities = []
+
+    @property
+    def done(self):
+        """Whether enough frames arrived for a verdict"""
+        return self.good_frames >= LIVE_REQUIRED_GOOD_FRAMES or self.frames >= LIVE_MAX_FRAMES
+
+    def add_frame(self, data):
+        """
+        Check one encoded frame
+
+        Args:
+            data (bytes): JPEG, PNG or WebP image
+
+        Returns:
+            dict: 'frame' (index), 'face' (bool), 'quality', 'good',
+                  'similarity' (None without a baseline, model or face) and 'good_frames'
+        """
+        if len(data) > LIVE_MAX_FRAME_BYTES:
+            raise ValueError(f'Frames are limited to {LIVE_MAX_FRAME_BYTES} bytes')
+
+        frame = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+        if frame is None:
+            raise ValueError('Frame is not a readable image')
+
+        max_dim = max(frame.shape[0], frame.shape[1])
+        if max_dim > LIVE_MAX_FRAME_DIM:
+            scale = LIVE_MAX_FRAME_DIM / max_dim
+            frame = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+        self.frames += 1
+        face = detect_face(frame)
+        status = {
+            'frame': self.frames,
+            'face': face is not None,
+            'quality': round(face['quality'], 3) if face else 0.0,
+            'good': False,
+            'similarity': None,
+            'good_frames': self.good_frames
+        }
+        if face is None or face['quality'] < LIVE_MIN_FACE_QUALITY:
+            return status
+
+        if self.baseline_embeddings is not None and len(self.baseline_embeddings):
+            embedding = compute_face_embeddings(face['crop'][None])
+            if embedding is not None:
+                similarity = float((self.baseline_embeddings @ embedding.T).max())
+                status['similarity'] = round(similarity, 4)
+                self.similarities.append(similarity)
+
+        self.good_frames += 1
+        status['good'] = True
+        status['good_frames'] = self.good_frames
+        return status
+
+    def verdict(self):
+        """
+        Result of the frames so far
+
+        Returns:
+            dict: 'face_present', 'is_same_person' (None without a baseline,
+                  the embedding model or a present face), 'similarity'
+                  (mean over the good frames), 'frames' and 'good_frames'
+        """
+        face_present = self.good_frames >= LIVE_REQUIRED_GOOD_FRAMES
+        similarity = float(np.mean(self.similarities)) if self.similarities else None
+        is_same_person = None
+        if face_present and similarity is not None:
+            is_same_person = similarity >= FACE_EMBEDDING_THRESHOLD
+        return {
+            'face_present': face_present,
+            'is_same_person': is_same_person,
+            'similarity': round(similarity, 4) if similarity is not None else None,
+            'frames': self.frames,
+            'good_frames': self.good_frames
+        }
@@ -0,0 +1,261 @@
+import numpy as np
+
+# Share of monthly income that may go to EMIs, existing ones included
+MAX_FOIR = 0.5
+
+# Existing EMIs above these shares of income need review / are rejected
+MAX_DTI = 0.40
+REJECT_DTI = 0.60
+
+# Credit scores below these need review / are rejected
+MIN_CREDIT_SCORE = 650
+REJECT_CREDIT_SCORE = 550
+
+# Requests above this multiple of the eligible amount are rejected outright
+REJECT_AMOUNT_MULTIPLE = 2
+
+MIN_EMPLOYMENT_YEARS = 1
+
+DEFAULT_TENURE_MONTHS = 36
+MAX_TENURE_MONTHS = 360
+
+# Annual interest rate (%) by credit score band: scores from each bound up
+# to the next one get the rate at the same position
+CREDIT_SCORE_BANDS = np.array([300, 650, 700, 750])
+BAND_RATES = np.array([16.0, 14.0, 12.0, 10.5])
+
+# Status codes used by evaluate, in the order of STATUSES
+APPROVED, MORE_INFO, REJECTED = 0, 1, 2
+STATUSES = np.array(['approved', 'more_info', 'rejected'])
+
+def rate_for_credit_score(credit_score):
+    """
+    Annual interest rate (%) offered for a credit score
+
+    Args:
+        credit_score (array-like): Credit score(s), 300-900
+
+    Returns:
+        np.ndarray: Annual rate(s) in percent
+    """
+    band = np.searchsorted(CREDIT_SCORE_BANDS, np.asarray(credit_score, dtype=np.float64), side='right') - 1
+    return BAND_RATES[np.clip(band, 0, len(BAND_RATES) - 1)]
+
+def _monthly_growth(annual_rate, tenure_months):
+    """Monthly rate r and (1 + r) ** n for annual rates in percent"""
+    r = np.asarray(annual_rate, dtype=np.float64) / 1200
+    n = np.asarray(tenure_months, dtype=np.float64)
+    return r, np.power(1 + r, n)
+
+def emi(principal, annual_rate, tenure_months):
+    """
+    Equated monthly instalment of a reducing-balance loan
+
+    All arguments broadcast against each other, so a single loan and a grid
+    of scenarios are computed the same way.
+
+    Args:
+        principal (array-like): Loan amount(s)
+        annual_rate (array-like): Annual interest rate(s) in percent
+        tenure_months (array-like): Tenure(s) in months
+
+    Returns:
+        np.ndarray: EMI for every combination
+    """
+    principal = np.asarray(principal, dtype=np.float64)
+    r, growth = _monthly_growth(annual_rate, tenure_months)
+    n = np.asarray(tenure_months, dtype=np.float64)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        amortized = principal * r * growth / (growth - 1)
+    return np.where(r > 0, amortized, principal / n)
+
+def max_principal(monthly_capacity, annual_rate, tenure_months):
+    """
+    Largest loan whose EMI fits a monthly repayment capacity
+
+    Args:
+        monthly_capacity (array-like): Amount(s) available for the EMI each month
+        annual_rate (array-like): Annual interest rate(s) in percent
+        tenure_months (array-like): Tenure(s) in months
+
+    Returns:
+        np.ndarray: Loan amount(s), 0 where there is no capacity
+    """
+    capacity = np.maximum(np.asarray(monthly_capacity, dtype=np.float64), 0)
+    r, growth = _monthly_growth(annual_rate, tenure_months)
+    n = np.asarray(tenure_months, dtype=np.float64)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        discounted = capacity * (growth - 1) / (r * growth)
+    return np.where(r > 0, discounted, capacity * n)
+
+def amortization_schedule(principal, annual_rate, tenure_months):
+    """
+    Month by month repayment schedule of a loan
+
+    Args:
+        principal (float): Loan amount
+        annual_rate (float): Annual interest rate in percent
+        tenure_months (int): Tenure in months
+
+    Returns:
+        dict: Arrays 'month', 'emi', 'interest', 'principal' and 'balance'
+              (outstanding after the payment), one entry per month
+    """
+    tenure_months = int(tenure_months)
+    payment = float(emi(principal, annual_rate, tenure_months))
+    r = annual_rate / 1200
+    months = np.arange(1, tenure_months + 1)
+
+    # Closed form of the balance after k payments, so no month-by-month loop
+    if r > 0:
+        growth = np.power(1 + r, months)
+        balance = principal * growth - payment * (growth - 1) / r
+    else:
+        balance = principal - payment * months
+    balance = np.maximum(balance, 0)
+    balance[-1] = 0.0
+
+    opening = np.concatenate(([principal], balance[:-1]))
+    interest = opening * r
+    principal_paid = opening - balance
+
+    return {
+        'month': months,
+        'emi': interest + principal_paid,
+        'interest': interest,
+        'principal': principal_paid,
+        'balance': balance
+    }
+
+def evaluate(monthly_income, existing_emis, credit_score, loan_amount,
+             tenure_months=DEFAULT_TENURE_MONTHS, annual_rate=None, employment_years=None):
+    """
+    Score one applicant or a batch of scenarios
+
+    Every argument broadcasts against the others, e.g. amounts of shape
+    (A, 1, 1), tenures of shape (1, T, 1) and rates of shape (1, 1, R)
+    score all A x T x R combinations in one pass.
+
+    Args:
+        monthly_income (array-like): Monthly income
+        existing_emis (array-like): EMIs already being paid each month
+        credit_score (array-like): Credit score, 300-900
+        loan_amount (array-like): Requested loan amount
+        tenure_months (array-like): Tenure in months
+        annual_rate (array-like): Annual interest rate in percent (default: by credit score)
+        employment_years (array-like): Years in current employment (optional)
+
+    Returns:
+        dict: Arrays 'status' (APPROVED, MORE_INFO or REJECTED), 'emi',
+              'annual_rate', 'emi_capacity', 'max_eligible_amount', 'dti',
+              'foir' (with the new EMI) and the boolean reason flags
+              'low_credit_score', 'high_dti', 'short_employment' and 'exceeds_eligibility'
+    """
+    monthly_income = np.asarray(monthly_income, dtype=np.float64)
+    existing_emis = np.asarray(existing_emis, dtype=np.float64)
+    credit_score = np.asarray(credit_score, dtype=np.float64)
+    loan_amount = np.asarray(loan_amount, dtype=np.float64)
+    tenure_months = np.asarray(tenure_months, dtype=np.float64)
+
+    if annual_rate is None:
+        annual_rate = rate_for_credit_score(credit_score)
+    annual_rate = np.asarray(annual_rate, dtype=np.float64)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        dti = np.where(monthly_income > 0, existing_emis / monthly_income, np.inf)
+
+    emi_capacity = np.maximum(monthly_income * MAX_FOIR - existing_emis, 0)
+    max_eligible_amount = max_principal(emi_capacity, annual_rate, tenure_months)
+    payment = emi(loan_amount, annual_rate, tenure_months)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        foir = np.where(monthly_income > 0, (existing_emis + payment) / monthly_income, np.inf)
+
+    low_credit_score = credit_score < MIN_CREDIT_SCORE
+    high_dti = dti > MAX_DTI
+    exceeds_eligibility = loan_amount > max_eligible_amount
+    if employment_years is None:
+        short_employment = np.zeros_like(low_credit_score)
+    else:
+        short_employment = np.asarray(employment_years, dtype=np.float64) < MIN_EMPLOYMENT_YEARS
+
+    flags = np.broadcast_arrays(low_credit_score, high_dti, short_employment, exceeds_eligibility)
+    any_reason = np.logical_or.reduce(flags)
+    rejected = (credit_score < REJECT_CREDIT_SCORE) | (dti > REJECT_DTI) | \
+               (loan_amount > max_eligible_amount * REJECT_AMOUNT_MULTIPLE)
+    status = np.where(~any_reason, APPROVED, np.where(rejected, REJECTED, MORE_INFO))
+
+    return {
+        'status': status,
+        'emi': payment,
+        'annual_rate': annual_rate,
+        'emi_capacity': emi_capacity,
+        'max_eligible_amount': max_eligible_amount,
+        'dti': dti,
+        'foir': foir,
+        'low_credit_score': flags[0],
+        'high_dti': flags[1],
+        'short_employment': flags[2],
+        'exceeds_eligibility': flags[3]
+    }
+
+def decide(monthly_income, existing_emis, credit_score, loan_amount,
+           tenure_months=DEFAULT_TENURE_MONTHS, annual_rate=None, employment_years=None):
+    """
+    Loan decision for a single applicant, in the shape the frontend shows
+
+    Args:
+        Same as evaluate, as scalars
+
+    Returns:
+        dict: 'status' ('approved', 'rejected' or 'more_info'), 'reasons',
+              'requiredInfo', 'maxEligibleAmount', 'recommendedEMI', 'emi',
+              'annualRate' and 'tenureMonths'
+    """
+    result = evaluate(monthly_income, existing_emis, credit_score, loan_amount,
+                      tenure_months, annual_rate, employment_years)
+    result = {key: value.item() for key, value in result.items()}
+
+    reasons = []
+    required_info = []
+    if result['low_credit_score']:
+        reasons.append(f'Low credit score (below {MIN_CREDIT_SCORE})')
+        required_info.append('Credit report or guarantor details')
+    if result['high_dti']:
+        reasons.append(f'High debt-to-income ratio (over {MAX_DTI:.0%})')
+        required_info.append('Statements of existing loans')
+    if result['short_employment']:
+        reasons.append(f'Employment duration less than {MIN_EMPLOYMENT_YEARS} year')
+        required_info.append('Employment history or appointment letter')
+    if result['exceeds_eligibility']:
+        reasons.append(f"Requested loan amount exceeds your eligibility (max: ₹{round(result['max_eligible_amount']):,})")
+        required_info.append('Additional income proof')
+
+    return {
+        'status': str(STATUSES[result['status']]),
+        'reasons': reasons,
+        'requiredInfo': required_info,
+        'maxEligibleAmount': round(result['max_eligible_amount']),
+        'recommendedEMI': round(result['emi_capacity']),
+        'emi': round(result['emi'], 2),
+        'annualRate': result['annual_rate'],
+        'tenureMonths': int(tenure_months)
+    }
+
+def get_verified_monthly_income(extracted_data):
+    """
+    Monthly income from the data extracted from tax papers
+
+    Args:
+        extracted_data (dict): Extracted data of a tax document
+
+    Returns:
+        float: Annual income / 12, or None if no income was extracted
+    """
+    try:
+        income = float(str(extracted_data.get('income', '')).replace(',', ''))
+    except ValueError:
+        return None
+    return income / 12 if income > 0 else None
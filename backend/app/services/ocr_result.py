@@ -0,0 +1,125 @@
+import re
+import pytesseract
+
+def run_tesseract(image, lang='eng', config=''):
+    """
+    Run Tesseract and keep word-level confidences and boxes
+
+    Uses image_to_data, which returns the words together with their
+    confidences in the same pass that recognizes the text.
+
+    Args:
+        image (PIL.Image): Image to recognize
+        lang (str): Tesseract language(s)
+        config (str): Extra Tesseract options, e.g. '--psm 6 --oem 3'
+
+    Returns:
+        dict: 'text' rebuilt line by line, and 'words', a list of dicts with
+              'text', 'conf' (0-100) and 'box' (left, top, width, height)
+    """
+    data = pytesseract.image_to_data(image, lang=lang, config=config, output_type=pytesseract.Output.DICT)
+
+    words = []
+    lines = []
+    current_line = None
+    current_block = None
+    for i, word in enumerate(data['text']):
+        conf = float(data['conf'][i])
+        word = word.strip()
+        if conf < 0 or not word:
+            continue
+
+        words.append({
+            'text': word,
+            'conf': conf,
+            'box': (data['left'][i], data['top'][i], data['width'][i], data['height'][i])
+        })
+
+        # Rebuild the text with one line per Tesseract line and a blank
+        # line between blocks, like image_to_string does
+        block = data['block_num'][i]
+        line = (block, data['par_num'][i], data['line_num'][i])
+        if line != current_line:
+            if current_block is not None and block != current_block:
+                lines.append('')
+            lines.append(word)
+            current_line = line
+            current_block = block
+        else:
+            lines[-1] += ' ' + word
+
+    return {'text': '\n'.join(lines), 'words': words}
+
+def mean_confidence(words):
+    """
+    Mean confidence of a list of words
+
+    Args:
+        words (list): Words from run_tesseract
+
+    Returns:
+        float: Mean confidence (0-100), 0 if there are no words
+    """
+    if not words:
+        return 0.0
+    return sum(word['conf'] for word in words) / len(words)
+
+def _normalize_token(text):
+    """Lowercase and keep only letters and digits"""
+    return re.sub(r'[^0-9a-z]', '', text.lower())
+
+def field_confidence(value, words):
+    """
+    Confidence of the words an extracted field value was read from
+
+    Looks for a run of consecutive words that spells the value (ignoring
+    spaces and punctuation), e.g. '2345', '6789', '0124' for an Aadhaar
+    number. Falls back to the words contained in the value.
+
+    Args:
+        value (str): Extracted field value
+        words (list): Words from run_tesseract
+
+    Returns:
+        float: Mean confidence (0-100), or None if no word matches
+    """
+    # Values can run on into the next OCR line; only score what was on the first
+    target = _normalize_token(str(value).strip().split('\n')[0])
+    if not target:
+        return None
+
+    tokens = [_normalize_token(word['text']) for word in words]
+
+    for start in range(len(tokens)):
+        if not tokens[start] or not target.startswith(tokens[start]):
+            continue
+        spelled = ''
+        for end in range(start, len(tokens)):
+            spelled += tokens[end]
+            if spelled == target:
+                return mean_confidence(words[start:end + 1])
+            if not target.startswith(spelled):
+                break
+
+    matched = [word for word, token in zip(words, tokens) if len(token) >= 3 and token in target]
+    return mean_confidence(matched) if matched else None
+
+def field_confidences(extracted_data, words):
+    """
+    Confidence for every extracted field
+
+    Args:
+        extracted_data (dict): Output of extract_document_data
+        words (list): Words from run_tesseract
+
+    Returns:
+        dict: Confidence (0-100) keyed by field name, for fields whose words were found
+    """
+    confidences = {}
+    for field, value in extracted_data.items():
+        if field in ('document_type', 'field_confidence') or not value:
+            continue
+        confidence = field_confidence(value, words)
+        if confidence is not None:
+            confidences[field] = round(confidence, 1)
+    return confidences
@@ -0,0 +1,131 @@
+import json
+import zlib
+
+from app.services.document_processor import (
+    select_ocr_result, extract_document_data, is_document_valid, OCR_PIPELINE_VERSION
+)
+
+def save_ocr_record(db, document_id, doc_type, ocr_record, text, is_valid, extracted_data, min_confidence=0):
+    """
+    Keep the OCR attempts of a document so it can be re-extracted without OCR
+
+    Args:
+        db (sqlite3.Connection): Database connection
+        document_id (str): Unique identifier of the uploaded document
+        doc_type (str): Type of document
+        ocr_record (dict): Filled in by process_document
+        text (str): Text returned by process_document
+        is_valid (bool): Validation result returned by process_document
+        extracted_data (dict): Extracted data returned by process_document
+        min_confidence (float): Minimum field confidence used for the document
+    """
+    # Word boxes make attempts large, and they compress well
+    attempts = zlib.compress(json.dumps(ocr_record['attempts']).encode('utf-8'))
+    db.execute(
+        'INSERT OR REPLACE INTO document_ocr'
+        ' (document_id, doc_type, source, pipeline_version, min_confidence, attempts, text, is_valid, extracted_data)'
+        ' VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+        (document_id, doc_type, ocr_record['source'], ocr_record['pipeline_version'], min_confidence,
+         attempts, text, int(bool(is_valid)), json.dumps(extracted_data))
+    )
+    db.commit()
+
+def load_ocr_record(db, document_id):
+    """
+    Get the stored OCR of a document
+
+    Returns:
+        dict: Row of document_ocr with 'attempts' decoded, or None if not stored
+    """
+    row = db.execute('SELECT * FROM document_ocr WHERE document_id = ?', (document_id,)).fetchone()
+    if row is None:
+        return None
+    return decode_ocr_record(dict(row))
+
+def decode_ocr_record(record):
+    """Decode the attempts of a document_ocr row, given as a dict"""
+    record['attempts'] = json.loads(zlib.decompress(record['attempts']).decode('utf-8'))
+    return record
+
+def needs_ocr(record):
+    """
+    Check whether a stored document must be OCRed again rather than re-extracted
+
+    Mock text never came from the document, and text from an older image
+    pipeline would not match what the current one reads.
+    """
+    return record['source'] == 'mock' or record['pipeline_version'] != OCR_PIPELINE_VERSION
+
+def reextract_document(record, doc_type=None):
+    """
+    Re-run extraction and validation over the stored OCR of a document
+
+    Args:
+        record (dict): Output of load_ocr_record
+        doc_type (str): Type of document (default: the stored one)
+
+    Returns:
+        tuple: (text, is_valid, extracted_data) like process_document
+    """
+    doc_type = doc_type or record['doc_type']
+
+    if record['source'] == 'pdf':
+        text = record['attempts'][0]['text']
+        extracted_data = extract_document_data(text, doc_type)
+    else:
+        text, extracted_data = select_ocr_result(record['attempts'], doc_type, record['min_confidence'])
+
+    return text, is_document_valid(text, doc_type, extracted_data), extracted_data
+
+def record_ocr_tiers(db, ocr_record, is_valid):
+    """
+    Count the OCR attempts of a document per model tier
+
+    The last tier that ran either resolved the document or left it
+    invalid; earlier tiers escalated it.
+
+    Args:
+        db (sqlite3.Connection): Database connection
+        ocr_record (dict): Filled in by process_document
+        is_valid (bool): Validation result returned by process_document
+    """
+    if ocr_record['source'] != 'ocr' or not ocr_record['attempts']:
+        return
+
+    tiers = {}
+    for attempt in ocr_record['attempts']:
+        tier = tiers.setdefault(attempt['model'], {'attempts': 0, 'seconds': 0.0})
+        tier['attempts'] += 1
+        tier['seconds'] += attempt['seconds']
+
+    last_model = ocr_record['attempts'][-1]['model']
+    for model, tier in tiers.items():
+        db.execute('INSERT OR IGNORE INTO ocr_tier_stats (model) VALUES (?)', (model,))
+        db.execute(
+            'UPDATE ocr_tier_stats SET documents = documents + 1, attempts = attempts + ?,'
+            ' total_seconds = total_seconds + ?, resolved = resolved + ?, unresolved = unresolved + ?'
+            ' WHERE model = ?',
+            (tier['attempts'], tier['seconds'], int(model == last_model and bool(is_valid)),
+             int(model == last_model and not is_valid), model)
+        )
+    db.commit()
+
+def get_ocr_tier_stats(db):
+    """
+    Get the counters of every OCR model tier
+
+    Returns:
+        dict: Per model 'documents', 'attempts', 'resolved', 'unresolved',
+              'escalated' (to the next tier) and 'mean_seconds' per attempt
+    """
+    stats = {}
+    for row in db.execute('SELECT * FROM ocr_tier_stats'):
+        stats[row['model']] = {
+            'documents': row['documents'],
+            'attempts': row['attempts'],
+            'resolved': row['resolved'],
+            'unresolved': row['unresolved'],
+            'escalated': row['documents'] - row['resolved'] - row['unresolved'],
+            'mean_seconds': round(row['total_seconds'] / row['attempts'], 3) if row['attempts'] else 0.0
+        }
+    return stats
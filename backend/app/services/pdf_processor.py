@@ -0,0 +1,141 @@
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from app.utils.concurrency import bounded_map
+
+# pypdfium2 is optional; without it PDF uploads can't be processed
+try:
+    import pypdfium2 as pdfium
+    PDFIUM_AVAILABLE = True
+except Exception as e:
+    print(f"Warning: pypdfium2 import failed: {e}")
+    print("PDF documents will not be processed.")
+    PDFIUM_AVAILABLE = False
+
+# Scanned pages are rendered at this resolution for OCR
+PDF_RENDER_DPI = 200
+
+# Pages after this are ignored, to bound the work a single upload can cause
+MAX_PDF_PAGES = 50
+
+# A page whose text layer has fewer characters is treated as scanned
+MIN_TEXT_LAYER_CHARS = 20
+
+# Number of processes rasterizing and OCRing scanned pages. Every Gunicorn
+# worker has a pool of its own while a document holds a single ocr admission
+# slot, so this stays small rather than one process per core
+PDF_OCR_WORKERS = int(os.environ.get('PDF_OCR_WORKERS', 2))
+
+# The page pool is created on first use and shared by all requests of a worker
+_page_pool = None
+_page_pool_lock = threading.Lock()
+
+def _get_page_pool():
+    """Get the process pool used to OCR scanned pages"""
+    global _page_pool
+    with _page_pool_lock:
+        if _page_pool is None:
+            _page_pool = ProcessPoolExecutor(max_workers=PDF_OCR_WORKERS)
+        return _page_pool
+
+def is_pdf_file(file_path):
+    """
+    Check whether a file is a PDF by its magic bytes
+
+    Args:
+        file_path (str): Path to the file
+
+    Returns:
+        bool: True if the file is a PDF
+    """
+    try:
+        with open(file_path, 'rb') as f:
+            return f.read(5) == b'%PDF-'
+    except OSError:
+        return False
+
+def _ocr_pdf_page(task):
+    """
+    Worker: rasterize one page of a PDF and OCR it
+
+    Each worker opens the PDF itself, so only the page number is sent to it
+    and only one rendered page per worker is in memory at a time.
+    """
+    # Imported here to avoid a circular import with document_processor
+    from app.services.document_processor import run_ocr
+
+    file_path, page_index, dpi = task
+    pdf = pdfium.PdfDocument(file_path)
+    try:
+        page = pdf[page_index]
+        bitmap = page.render(scale=dpi / 72)
+        image = bitmap.to_numpy()[:, :, :3].copy()  # BGR, without alpha
+        bitmap.close()
+        page.close()
+    finally:
+        pdf.close()
+
+    text, _ = run_ocr(image)
+    return page_index, text
+
+def _iter_scanned_pages(pdf, file_path, page_count, texts, dpi):
+    """
+    Read the text layer of each page, yielding OCR tasks for pages without one
+
+    Text layer pages are stored in texts as they are read, so scanned pages
+    are handed to the pool while later pages are still being scanned.
+    """
+    for page_index in range(page_count):
+        page = pdf[page_index]
+        textpage = page.get_textpage()
+        page_text = textpage.get_text_bounded().replace('\r\n', '\n')
+        textpage.close()
+        page.close()
+
+        if len(page_text.strip()) >= MIN_TEXT_LAYER_CHARS:
+            texts[page_index] = page_text
+        else:
+            yield file_path, page_index, dpi
+
+def extract_pdf_text(file_path, dpi=PDF_RENDER_DPI):
+    """
+    Extract the text of a PDF document
+
+    Pages with an embedded text layer are read directly without OCR.
+    Scanned pages are rendered and OCRed page by page in a process pool,
+    with only a few pages queued at a time so memory stays bounded.
+
+    Args:
+        file_path (str): Path to the PDF file
+        dpi (int): Resolution for rendering scanned pages
+
+    Returns:
+        tuple: (text, info) where text joins the pages in order and info has
+               'pages', 'text_layer_pages', 'ocr_pages' and 'truncated'
+    """
+    if not PDFIUM_AVAILABLE:
+        raise RuntimeError('PDF support requires pypdfium2')
+
+    texts = {}
+    ocr_pages = 0
+
+    pdf = pdfium.PdfDocument(file_path)
+    try:
+        total_pages = len(pdf)
+        page_count = min(total_pages, MAX_PDF_PAGES)
+
+        tasks = _iter_scanned_pages(pdf, file_path, page_count, texts, dpi)
+        for page_index, page_text in bounded_map(_get_page_pool(), _ocr_pdf_page, tasks, PDF_OCR_WORKERS * 2):
+            texts[page_index] = page_text
+            ocr_pages += 1
+    finally:
+        pdf.close()
+
+    info = {
+        'pages': page_count,
+        'text_layer_pages': len(texts) - ocr_pages,
+        'ocr_pages': ocr_pages,
+        'truncated': total_pages > page_count
+    }
+    return '\n\n'.join(texts[i] for i in sorted(texts)), info
@@ -0,0 +1,286 @@
+import os
+import time
+import tempfile
+import threading
+
+from flask import current_app
+
+# Stored files are addressed by keys '<area>/<path in the area>'. Each area
+# is a local folder for the local backend, and a key prefix in the bucket
+# for the S3 backend.
+UPLOADS = 'uploads'
+VIDEOS = 'videos'
+
+CHUNK_SIZE = 1024 * 1024
+
+# Files above this size are sent to and read from S3 in parts of this size,
+# several at a time
+MULTIPART_CHUNK_SIZE = 8 * 1024 * 1024
+MULTIPART_CONCURRENCY = 4
+
+_storage = None
+_storage_config = None
+_storage_lock = threading.Lock()
+
+def make_key(area, path):
+    """Key of a file in an area"""
+    return f"{area}/{path}"
+
+def _is_missing(error):
+    """Whether a botocore ClientError says the object doesn't exist"""
+    return error.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound')
+
+class LocalStorage:
+    """
+    Files kept in the local upload and video folders
+
+    Only serves a single node, unless the folders are on a shared volume.
+    """
+
+    remote = False
+
+    def __init__(self, folders):
+        """
+        Args:
+            folders (dict): Local folder of each area
+        """
+        self.folders = folders
+
+    def local_file(self, key):
+        """Where a key is kept on this node"""
+        # Blobs stored before the storage backends are recorded by absolute path
+        if os.path.isabs(key):
+            return key
+        area, _, path = key.partition('/')
+        return os.path.join(self.folders[area], path)
+
+    def is_cached(self, key):
+        """Whether the file can be read without going over the network"""
+        return os.path.exists(self.local_file(key))
+
+    def exists(self, key):
+        """Whether a file is stored under a key"""
+        return os.path.exists(self.local_file(key))
+
+    def local_path(self, key):
+        """
+        Get a local path of a stored file, for readers that need one (OpenCV, Tesseract)
+
+        Returns:
+            str: Path of the file
+        """
+        return self.local_file(key)
+
+    def read_range(self, key, start, length):
+        """Read length bytes of a stored file from offset start"""
+        with open(self.local_file(key), 'rb') as f:
+            f.seek(start)
+            return f.read(length)
+
+    def _write_local(self, key, stream):
+        """Write a stream to the local file of a key, through a temporary file"""
+        path = self.local_file(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+                    f.write(chunk)
+            os.replace(temp_path, path)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+        return path
+
+    def _move_local(self, key, source_path):
+        """Move a file to the local file of a key; it must be on the same filesystem"""
+        path = self.local_file(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(source_path, path)
+        return path
+
+    def put_stream(self, key, stream):
+        """Store a binary stream under a key, never exposing a half-written file"""
+        self._write_local(key, stream)
+
+    def put_file(self, key, source_path):
+        """Store a local file under a key, consuming the file"""
+        self._move_local(key, source_path)
+
+    def delete(self, key):
+        path = self.local_file(key)
+        if os.path.exists(path):
+            os.unlink(path)
+
+    def trim_cache(self, max_age_seconds):
+        """Nothing to trim: local files are the stored copy"""
+        return 0
+
+class S3Storage(LocalStorage):
+    """
+    Files kept in an S3-compatible bucket (AWS S3, MinIO, ...)
+
+    The local folders keep a copy of files written or read on this node,
+    since OpenCV and Tesseract read from paths. The copies are only a cache:
+    any node can serve any file, and trim_cache drops the unused ones.
+    """
+
+    remote = True
+
+    def __init__(self, folders, bucket, endpoint_url=None, region=None, max_connections=10):
+        """
+        Args:
+            folders (dict): Local folder of each area, used as cache
+            bucket (str): Bucket name
+            endpoint_url (str): Endpoint of an S3-compatible service, None for AWS
+            region (str): Region of the bucket
+            max_connections (int): Size of the connection pool shared by the threads of a worker
+        """
+        # boto3 is optional and slow to import, so it is only imported by the
+        # S3 backend; without it only the local storage backend is available
+        try:
+            import boto3
+            from boto3.s3.transfer import TransferConfig
+            from botocore.config import Config
+            from botocore.exceptions import ClientError
+        except Exception as e:
+            raise RuntimeError(f'STORAGE_BACKEND=s3 needs boto3: {e}')
+        self._client_error = ClientError
+
+        super().__init__(folders)
+        self.bucket = bucket
+        # boto3 clients are thread-safe; one per process keeps connections alive
+        self.client = boto3.client(
+            's3', endpoint_url=endpoint_url, region_name=region,
+            config=Config(max_pool_connections=max_connections, retries={'mode': 'standard'})
+        )
+        self.transfer_config = TransferConfig(
+            multipart_threshold=MULTIPART_CHUNK_SIZE,
+            multipart_chunksize=MULTIPART_CHUNK_SIZE,
+            max_concurrency=min(MULTIPART_CONCURRENCY, max_connections)
+        )
+
+    def exists(self, key):
+        # Always asks the bucket: a local copy outlives the object when
+        # another node deletes it, and writers skip uploads of stored keys
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=key)
+            return True
+        except self._client_error as e:
+            if _is_missing(e):
+                return False
+            raise
+
+    def put_bytes(self, key, data):
+        """Store a small object in the bucket, without a local copy"""
+        self.client.put_object(Bucket=self.bucket, Key=key, Body=data)
+
+    def get_bytes(self, key):
+        """
+        Read a small object from the bucket
+
+        Returns:
+            bytes: Content of the object, or None if it doesn't exist
+        """
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=key)['Body'].read()
+        except self._client_error as e:
+            if _is_missing(e):
+                return None
+            raise
+
+    def list_keys(self, prefix, limit=1000):
+        """Keys in the bucket starting with prefix, at most limit of them"""
+        response = self.client.list_objects_v2(Bucket=self.bucket, Prefix=prefix, MaxKeys=limit)
+        return [item['Key'] for item in response.get('Contents', [])]
+
+    def local_path(self, key):
+        path = self.local_file(key)
+        if os.path.exists(path):
+            # Mark the copy as used, so trim_cache keeps it
+            os.utime(path)
+            return path
+
+        # Download next to the copy, in parallel ranged parts for large files
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        os.close(fd)
+        try:
+            self.client.download_file(self.bucket, key, temp_path, Config=self.transfer_config)
+            os.replace(temp_path, path)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+        return path
+
+    def read_range(self, key, start, length):
+        if self.is_cached(key):
+            return super().read_range(key, start, length)
+        response = self.client.get_object(Bucket=self.bucket, Key=key,
+                                          Range=f"bytes={start}-{start + length - 1}")
+        return response['Body'].read()
+
+    def put_stream(self, key, stream):
+        # The local copy is written first: the upload is processed from it
+        path = self._write_local(key, stream)
+        self.client.upload_file(path, self.bucket, key, Config=self.transfer_config)
+
+    def put_file(self, key, source_path):
+        path = self._move_local(key, source_path)
+        self.client.upload_file(path, self.bucket, key, Config=self.transfer_config)
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+        super().delete(key)
+
+    def trim_cache(self, max_age_seconds):
+        """
+        Delete local copies of stored files not used for a while
+
+        Returns:
+            int: Number of copies deleted
+        """
+        from app.services.blob_store import BLOB_DIR
+
+        cutoff = time.time() - max_age_seconds
+        trimmed = 0
+        for folder in self.folders.values():
+            for root, _, files in os.walk(os.path.join(folder, BLOB_DIR)):
+                for name in files:
+                    path = os.path.join(root, name)
+                    try:
+                        if os.stat(path).st_mtime < cutoff:
+                            os.unlink(path)
+                            trimmed += 1
+                    except FileNotFoundError:
+                        continue
+        return trimmed
+
+def get_storage():
+    """
+    Get the storage of the current app, as configured by STORAGE_BACKEND
+
+    The storage is created once per process and shared by its threads.
+    """
+    global _storage, _storage_config
+    config = current_app.config
+    settings = (config['STORAGE_BACKEND'], config['UPLOAD_FOLDER'], config['VIDEO_FOLDER'],
+                config['S3_BUCKET'], config['S3_ENDPOINT_URL'], config['S3_REGION'],
+                config['S3_MAX_CONNECTIONS'])
+
+    with _storage_lock:
+        if _storage is None or _storage_config != settings:
+            backend, upload_folder, video_folder, bucket, endpoint_url, region, max_connections = settings
+            folders = {UPLOADS: upload_folder, VIDEOS: video_folder}
+            if backend == 'local':
+                _storage = LocalStorage(folders)
+            elif backend == 's3':
+                if not bucket:
+                    raise ValueError('STORAGE_BACKEND=s3 needs S3_BUCKET')
+                _storage = S3Storage(folders, bucket, endpoint_url or None, region or None, max_connections)
+            else:
+                raise ValueError(f"Unknown STORAGE_BACKEND '{backend}'. Expected 'local' or 's3'")
+            _storage_config = settings
+        return _storage
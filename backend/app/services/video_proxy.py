@@ -0,0 +1,187 @@
+import os
+import json
+import cv2
+import numpy as np
+
+from app.services.face_verification import detect_faces_in_frames, MAX_SAMPLED_FRAMES, FRAME_SAMPLE_STRIDE
+
+# Bump whenever the sampling or encoding of proxies changes
+VIDEO_PROXY_VERSION = 1
+
+VIDEO_PROXY_DIR = 'proxies'
+
+# Browser WebM recordings have no cues index, so every seek decodes from the
+# start. At upload the video is decoded once and every PROXY_FRAME_STRIDE-th
+# frame is kept as a downscaled JPEG, with the offsets of all of them, so any
+# sample can be read later without decoding the video.
+PROXY_FRAME_STRIDE = FRAME_SAMPLE_STRIDE
+PROXY_MAX_DIM = 640
+PROXY_JPEG_QUALITY = 90
+
+# Long videos keep every other sample (doubling the stride) beyond this many
+PROXY_MAX_FRAMES = 240
+
+def get_video_proxy_paths(video_folder, video_id):
+    """
+    Get the paths of the proxy of a video
+
+    Returns:
+        tuple: (frames_path, metadata_path)
+    """
+    base = os.path.join(video_folder, VIDEO_PROXY_DIR, video_id)
+    return f"{base}.frames", f"{base}.json"
+
+def build_video_proxy(video_path, video_folder, video_id):
+    """
+    Decode a video once and store its frame samples and metadata
+
+    The original video is not modified.
+
+    Args:
+        video_path (str): Path to the video file
+        video_folder (str): Folder where videos are stored
+        video_id (str): Unique identifier of the video
+
+    Returns:
+        dict: Metadata as returned by load_video_proxy, or None if no frame could be read
+    """
+    cap = cv2.VideoCapture(video_path)
+    try:
+        samples = []
+        stride = PROXY_FRAME_STRIDE
+        frame_index = 0
+        timestamp = 0.0
+        width = height = None
+
+        while True:
+            if frame_index % stride:
+                # Skipped frames still have to be decoded, but not converted
+                if not cap.grab():
+                    break
+            else:
+                ok, frame = cap.read()
+                if not ok:
+                    break
+                height, width = frame.shape[:2]
+                scale = min(1.0, PROXY_MAX_DIM / max(width, height))
+                if scale < 1.0:
+                    frame = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+                encoded = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, PROXY_JPEG_QUALITY])[1].tobytes()
+                samples.append((frame_index, cap.get(cv2.CAP_PROP_POS_MSEC), encoded))
+
+                if len(samples) > PROXY_MAX_FRAMES:
+                    samples = samples[::2]
+                    stride *= 2
+
+            timestamp = cap.get(cv2.CAP_PROP_POS_MSEC)
+            frame_index += 1
+    finally:
+        cap.release()
+
+    if not samples:
+        return None
+
+    # The container's frame count is unreliable for MediaRecorder files, so
+    # the rate comes from the frames actually decoded
+    if frame_index > 1 and timestamp > 0:
+        fps = (frame_index - 1) / (timestamp / 1000.0)
+    else:
+        fps = 0.0
+    duration = frame_index / fps if fps else 0.0
+
+    frames_path, metadata_path = get_video_proxy_paths(video_folder, video_id)
+    os.makedirs(os.path.dirname(frames_path), exist_ok=True)
+
+    offsets = []
+    offset = 0
+    with open(f"{frames_path}.tmp", 'wb') as f:
+        for index, sample_timestamp, encoded in samples:
+            f.write(encoded)
+            offsets.append({'frame': index, 'timestamp': round(sample_timestamp / 1000.0, 3),
+                            'offset': offset, 'length': len(encoded)})
+            offset += len(encoded)
+    os.replace(f"{frames_path}.tmp", frames_path)
+
+    metadata = {
+        'version': VIDEO_PROXY_VERSION,
+        'duration': round(duration, 3),
+        'fps': round(fps, 3),
+        'frame_count': frame_index,
+        'width': width,
+        'height': height,
+        'stride': stride,
+        'samples': offsets
+    }
+    # The metadata is written last, so a proxy is only used once complete
+    with open(f"{metadata_path}.tmp", 'w') as f:
+        json.dump(metadata, f)
+    os.replace(f"{metadata_path}.tmp", metadata_path)
+
+    return metadata
+
+def load_video_proxy(video_folder, video_id):
+    """
+    Get the metadata of the proxy of a video
+
+    Returns:
+        dict: 'duration' (seconds), 'fps', 'frame_count', 'width', 'height'
+              of the original, 'stride' between samples and 'samples' with
+              the 'frame' index and 'timestamp' of each; None without a proxy
+    """
+    _, metadata_path = get_video_proxy_paths(video_folder, video_id)
+    try:
+        with open(metadata_path) as f:
+            metadata = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if metadata.get('version') != VIDEO_PROXY_VERSION:
+        return None
+    return metadata
+
+def read_proxy_frame(video_folder, video_id, sample, metadata=None):
+    """
+    Read one frame sample of a video without decoding the video
+
+    Args:
+        video_folder (str): Folder where videos are stored
+        video_id (str): Unique identifier of the video
+        sample (int): Position in metadata['samples']
+        metadata (dict): Output of load_video_proxy, if already loaded
+
+    Returns:
+        numpy.ndarray: BGR frame, or None if there is no such sample
+    """
+    metadata = metadata or load_video_proxy(video_folder, video_id)
+    if metadata is None or not 0 <= sample < len(metadata['samples']):
+        return None
+
+    entry = metadata['samples'][sample]
+    frames_path, _ = get_video_proxy_paths(video_folder, video_id)
+    with open(frames_path, 'rb') as f:
+        f.seek(entry['offset'])
+        data = f.read(entry['length'])
+    return cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+
+def extract_face_data_from_proxy(video_folder, video_id, max_frames=MAX_SAMPLED_FRAMES):
+    """
+    Like extract_face_data, reading the sampled frames from the proxy
+
+    Returns:
+        dict: Face data as returned by extract_face_data, or None without a proxy
+    """
+    metadata = load_video_proxy(video_folder, video_id)
+    if metadata is None:
+        return None
+
+    # Proxy samples are the same frames extract_face_data samples, unless a
+    # long video had its stride widened
+    frames = (read_proxy_frame(video_folder, video_id, sample, metadata)
+              for sample in range(min(max_frames, len(metadata['samples']))))
+    return detect_faces_in_frames(frame for frame in frames if frame is not None)
+
+def delete_video_proxy(video_folder, video_id):
+    """Remove the proxy of a video, if any"""
+    for path in get_video_proxy_paths(video_folder, video_id):
+        if os.path.exists(path):
+            os.unlink(path)
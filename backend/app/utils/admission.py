@@ -0,0 +1,371 @@
+import os
+import math
+import time
+import uuid
+import functools
+import threading
+import contextlib
+
+from flask import request, current_app, jsonify
+
+from app.db import connect
+
+# pyjwt is optional; without it every request is queued under its client IP
+try:
+    import jwt
+    JWT_AVAILABLE = True
+except Exception as e:
+    print(f"Warning: pyjwt import failed: {e}")
+    print("Admission tenants will be taken from client IPs only.")
+    JWT_AVAILABLE = False
+
+# How often a queued request checks whether it may start
+POLL_INTERVAL_SECONDS = 0.1
+
+# Queued requests refresh their ticket on every poll; a ticket that stops
+# being refreshed belongs to a request that is gone
+QUEUED_LEASE_SECONDS = 10
+
+# A thread of each process renews the running tickets it holds this often,
+# so a run can take as long as it needs
+RUNNING_HEARTBEAT_SECONDS = 15
+
+# A running ticket not renewed for this long belongs to a worker that was killed
+RUNNING_LEASE_SECONDS = 60
+
+# Running tickets of this process, by database, renewed by the heartbeat thread
+_held_tickets = {}
+_held_tickets_lock = threading.Lock()
+_heartbeat_pid = None
+
+class AdmissionRejected(Exception):
+    """Raised when a workload's queue is full or the wait took too long"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+def _get_limits(workload):
+    """Get the concurrency and queue limits of a workload from the config"""
+    return current_app.config['ADMISSION_LIMITS'][workload]
+
+def connect_admission_db():
+    """Open a connection in autocommit mode so BEGIN IMMEDIATE can be used"""
+    db = connect(current_app.config['DATABASE'])
+    db.isolation_level = None
+    return db
+
+def _renew_held_tickets():
+    """Heartbeat thread: keep the running tickets of this process from going stale"""
+    while True:
+        time.sleep(RUNNING_HEARTBEAT_SECONDS)
+        with _held_tickets_lock:
+            held = {database: list(tickets) for database, tickets in _held_tickets.items() if tickets}
+
+        for database, tickets in held.items():
+            try:
+                db = connect(database)
+                try:
+                    db.execute(
+                        f"UPDATE admission_tickets SET heartbeat_at = ? WHERE ticket IN ({', '.join('?' * len(tickets))})",
+                        [time.time(), *tickets]
+                    )
+                    db.commit()
+                finally:
+                    db.close()
+            except Exception as e:
+                print(f"Error renewing admission tickets: {e}")
+
+def _hold(ticket):
+    """Renew a running ticket until it is released"""
+    global _heartbeat_pid
+    with _held_tickets_lock:
+        # A forked worker doesn't inherit the thread, nor the tickets of its parent
+        if _heartbeat_pid != os.getpid():
+            _held_tickets.clear()
+            threading.Thread(target=_renew_held_tickets, name='admission-heartbeat', daemon=True).start()
+            _heartbeat_pid = os.getpid()
+        _held_tickets.setdefault(current_app.config['DATABASE'], set()).add(ticket)
+
+def _unhold(ticket):
+    """Stop renewing a released ticket"""
+    with _held_tickets_lock:
+        for tickets in _held_tickets.values():
+            tickets.discard(ticket)
+
+def _update_stats(db, workload, **increments):
+    """Add to the counters of a workload"""
+    db.execute('INSERT OR IGNORE INTO admission_stats (workload) VALUES (?)', (workload,))
+    for column, value in increments.items():
+        if column == 'max_wait':
+            db.execute('UPDATE admission_stats SET max_wait = MAX(max_wait, ?) WHERE workload = ?', (value, workload))
+        else:
+            db.execute(f'UPDATE admission_stats SET {column} = {column} + ? WHERE workload = ?', (value, workload))
+
+def _retry_after(db, workload, queued, concurrency):
+    """Estimate in seconds when a rejected request could be admitted"""
+    row = db.execute('SELECT completed, total_run FROM admission_stats WHERE workload = ?', (workload,)).fetchone()
+    mean_run = row['total_run'] / row['completed'] if row and row['completed'] else 1.0
+    return max(1, math.ceil(mean_run * (queued + 1) / concurrency))
+
+def _purge_stale(db, workload, now):
+    """Drop tickets of requests that are gone"""
+    db.execute(
+        'DELETE FROM admission_tickets WHERE workload = ? AND ('
+        '(state = \'queued\' AND heartbeat_at < ?) OR (state = \'running\' AND heartbeat_at < ?))',
+        (workload, now - QUEUED_LEASE_SECONDS, now - RUNNING_LEASE_SECONDS)
+    )
+
+def _count(db, workload, state, tenant=None):
+    """Count the tickets of a workload in a state, optionally for one tenant"""
+    query = 'SELECT COUNT(*) FROM admission_tickets WHERE workload = ? AND state = ?'
+    params = [workload, state]
+    if tenant is not None:
+        query += ' AND tenant = ?'
+        params.append(tenant)
+    return db.execute(query, params).fetchone()[0]
+
+def _next_ticket(db, workload):
+    """
+    Pick the queued ticket to start next
+
+    Tenants with the fewest running requests go first, then first come
+    first served, so one busy client can't starve the others.
+    """
+    row = db.execute(
+        'SELECT q.ticket FROM admission_tickets q WHERE q.workload = ? AND q.state = \'queued\''
+        ' ORDER BY (SELECT COUNT(*) FROM admission_tickets r WHERE r.workload = q.workload'
+        ' AND r.state = \'running\' AND r.tenant = q.tenant), q.enqueued_at LIMIT 1',
+        (workload,)
+    ).fetchone()
+    return row['ticket'] if row else None
+
+def acquire(db, workload, tenant):
+    """
+    Wait for a slot to run a workload
+
+    Args:
+        db (sqlite3.Connection): Connection in autocommit mode
+        workload (str): Workload name, a key of ADMISSION_LIMITS
+        tenant (str): Tenant the request is queued under
+
+    Returns:
+        str: Ticket to pass to release
+
+    Raises:
+        AdmissionRejected: If the queue is full or the wait timed out
+    """
+    limits = _get_limits(workload)
+    ticket = str(uuid.uuid4())
+    enqueued_at = time.time()
+
+    db.execute('BEGIN IMMEDIATE')
+    try:
+        _purge_stale(db, workload, enqueued_at)
+        running = _count(db, workload, 'running')
+        queued = _count(db, workload, 'queued')
+
+        # Fast path: a free slot and nobody waiting for it
+        if running < limits['concurrency'] and queued == 0:
+            db.execute(
+                'INSERT INTO admission_tickets (ticket, workload, tenant, state, enqueued_at, started_at, heartbeat_at)'
+                ' VALUES (?, ?, ?, \'running\', ?, ?, ?)',
+                (ticket, workload, tenant, enqueued_at, enqueued_at, enqueued_at)
+            )
+            _update_stats(db, workload, admitted=1)
+            db.execute('COMMIT')
+            _hold(ticket)
+            return ticket
+
+        if queued >= limits['queue_size'] or _count(db, workload, 'queued', tenant) >= limits['tenant_queue_size']:
+            _update_stats(db, workload, rejected=1)
+            retry_after = _retry_after(db, workload, queued, limits['concurrency'])
+            db.execute('COMMIT')
+            raise AdmissionRejected(f'Too many {workload} requests queued', retry_after)
+
+        db.execute(
+            'INSERT INTO admission_tickets (ticket, workload, tenant, state, enqueued_at, heartbeat_at)'
+            ' VALUES (?, ?, ?, \'queued\', ?, ?)',
+            (ticket, workload, tenant, enqueued_at, enqueued_at)
+        )
+        db.execute('COMMIT')
+    except AdmissionRejected:
+        raise
+    except Exception:
+        db.execute('ROLLBACK')
+        raise
+
+    deadline = enqueued_at + limits['max_wait']
+    while True:
+        time.sleep(POLL_INTERVAL_SECONDS)
+        now = time.time()
+
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            _purge_stale(db, workload, now)
+            db.execute('UPDATE admission_tickets SET heartbeat_at = ? WHERE ticket = ?', (now, ticket))
+
+            if _count(db, workload, 'running') < limits['concurrency'] and _next_ticket(db, workload) == ticket:
+                db.execute(
+                    'UPDATE admission_tickets SET state = \'running\', started_at = ? WHERE ticket = ?',
+                    (now, ticket)
+                )
+                _update_stats(db, workload, admitted=1, total_wait=now - enqueued_at, max_wait=now - enqueued_at)
+                db.execute('COMMIT')
+                _hold(ticket)
+                return ticket
+
+            if now >= deadline:
+                db.execute('DELETE FROM admission_tickets WHERE ticket = ?', (ticket,))
+                _update_stats(db, workload, rejected=1)
+                retry_after = _retry_after(db, workload, _count(db, workload, 'queued'), limits['concurrency'])
+                db.execute('COMMIT')
+                raise AdmissionRejected(f'Timed out waiting for a {workload} slot', retry_after)
+
+            db.execute('COMMIT')
+        except AdmissionRejected:
+            raise
+        except Exception:
+            db.execute('ROLLBACK')
+            raise
+
+def release(db, workload, ticket):
+    """Free the slot taken by acquire"""
+    _unhold(ticket)
+    now = time.time()
+    db.execute('BEGIN IMMEDIATE')
+    row = db.execute('SELECT started_at FROM admission_tickets WHERE ticket = ?', (ticket,)).fetchone()
+    db.execute('DELETE FROM admission_tickets WHERE ticket = ?', (ticket,))
+    if row is not None:
+        _update_stats(db, workload, completed=1, total_run=now - row['started_at'])
+    db.execute('COMMIT')
+
+@contextlib.contextmanager
+def admission_ticket(workload, tenant, db=None):
+    """
+    Hold a slot of a workload for the duration of a with block
+
+    For work that isn't a whole request, like pipeline nodes run on a pool
+    or the frames of a WebSocket session. Needs an app context.
+
+    Args:
+        workload (str): Workload name, a key of ADMISSION_LIMITS
+        tenant (str): Tenant the work is queued under
+        db (sqlite3.Connection): Connection from connect_admission_db to
+                                 reuse across tickets (optional)
+
+    Raises:
+        AdmissionRejected: If the queue is full or the wait timed out
+    """
+    own_db = db is None
+    if own_db:
+        db = connect_admission_db()
+    try:
+        ticket = acquire(db, workload, tenant)
+        try:
+            yield
+        finally:
+            release(db, workload, ticket)
+    finally:
+        if own_db:
+            db.close()
+
+def get_admission_status(db):
+    """
+    Current load and counters of every workload
+
+    Args:
+        db (sqlite3.Connection): Database connection
+
+    Returns:
+        dict: Per workload: limits, 'running', 'queued', 'oldest_wait' (seconds
+              the oldest queued request has waited), 'admitted', 'rejected',
+              'mean_wait', 'longest_wait' and 'mean_run' (seconds)
+    """
+    now = time.time()
+    status = {}
+    for workload, limits in current_app.config['ADMISSION_LIMITS'].items():
+        oldest = db.execute(
+            'SELECT MIN(enqueued_at) FROM admission_tickets WHERE workload = ? AND state = \'queued\''
+            ' AND heartbeat_at >= ?',
+            (workload, now - QUEUED_LEASE_SECONDS)
+        ).fetchone()[0]
+        stats = db.execute('SELECT * FROM admission_stats WHERE workload = ?', (workload,)).fetchone()
+        admitted = stats['admitted'] if stats else 0
+        completed = stats['completed'] if stats else 0
+
+        status[workload] = {
+            **limits,
+            'running': _count(db, workload, 'running'),
+            'queued': _count(db, workload, 'queued'),
+            'oldest_wait': round(now - oldest, 3) if oldest else 0,
+            'admitted': admitted,
+            'rejected': stats['rejected'] if stats else 0,
+            'mean_wait': round(stats['total_wait'] / admitted, 3) if admitted else 0,
+            'longest_wait': round(stats['max_wait'], 3) if stats else 0,
+            'mean_run': round(stats['total_run'] / completed, 3) if completed else 0
+        }
+    return status
+
+def _token_subject():
+    """Subject of the request's bearer token, or None without a valid one"""
+    secret = current_app.config['JWT_SECRET_KEY']
+    authorization = request.headers.get('Authorization', '')
+    if not JWT_AVAILABLE or not secret or not authorization.startswith('Bearer '):
+        return None
+
+    try:
+        claims = jwt.decode(authorization[len('Bearer '):], secret,
+                            algorithms=current_app.config['JWT_ALGORITHMS'])
+    except jwt.PyJWTError:
+        return None
+    return str(claims['sub']) if claims.get('sub') is not None else None
+
+def get_tenant():
+    """
+    Tenant of the current request: the subject of its bearer token, or the client IP
+
+    Only verified identities count, so a client can't spread its requests
+    over several tenants to get past tenant_queue_size.
+    """
+    subject = _token_subject()
+    if subject is not None:
+        return f"user:{subject}"
+    return f"ip:{request.remote_addr or 'unknown'}"
+
+def admission_controlled(workload):
+    """
+    Limit how many requests of a workload run at once across all workers
+
+    Requests over the concurrency limit wait in a bounded queue. When the
+    queue is full, or the wait exceeds the workload's max_wait, the route
+    answers 503 with a Retry-After estimate right away instead of running.
+
+    Args:
+        workload (str): Workload name, a key of ADMISSION_LIMITS
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method == 'OPTIONS':
+                return view(*args, **kwargs)
+
+            db = connect_admission_db()
+            try:
+                try:
+                    ticket = acquire(db, workload, get_tenant())
+                except AdmissionRejected as e:
+                    return jsonify({
+                        'error': str(e),
+                        'status': 'error',
+                        'retry_after': e.retry_after
+                    }), 503, {'Retry-After': str(e.retry_after)}
+
+                try:
+                    return view(*args, **kwargs)
+                finally:
+                    release(db, workload, ticket)
+            finally:
+                db.close()
+        return wrapper
+    return decorator
@@ -0,0 +1,53 @@
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, wait
+
+def bounded_map(executor, func, items, max_in_flight):
+    """
+    Like executor.map, but only keeps a bounded number of tasks queued so
+    that large or lazy inputs are streamed instead of submitted all at once
+    
+    Args:
+        executor (concurrent.futures.Executor): Pool to run the tasks on
+        func (callable): Function applied to every item
+        items (iterable): Items, consumed lazily
+        max_in_flight (int): Maximum number of submitted, unfinished tasks
+        
+    Yields:
+        Results of func, in completion order
+    """
+    pending = set()
+    for item in items:
+        pending.add(executor.submit(func, item))
+        if len(pending) >= max_in_flight:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+    
+    for future in wait(pending).done:
+        yield future.result()
+
+def ordered_map(executor, func, items, max_in_flight):
+    """
+    Like bounded_map, but yields results in input order
+
+    Tasks are submitted in order and the oldest one is waited for before
+    more than max_in_flight are submitted, so at most that many results are
+    held at once, even when a slow task holds up the ones after it.
+
+    Args:
+        executor (concurrent.futures.Executor): Pool to run the tasks on
+        func (callable): Function applied to every item
+        items (iterable): Items, consumed lazily
+        max_in_flight (int): Maximum number of submitted tasks not yet yielded
+
+    Yields:
+        Results of func, in input order
+    """
+    pending = deque()
+    for item in items:
+        if len(pending) >= max_in_flight:
+            yield pending.popleft().result()
+        pending.append(executor.submit(func, item))
+
+    while pending:
+        yield pending.popleft().result()
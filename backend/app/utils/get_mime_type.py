@@ -23,5 +23,9 @@ def get_mime_type(file_content):
     elif header.startswith(b'GIF87a') or header.startswith(b'GIF89a'):  # GIF
         return 'image/gif'
     
+    # Check for document signatures
+    if header.startswith(b'%PDF-'):  # PDF
+        return 'application/pdf'
+    
     # Default to octet-stream if can't determine
     return 'application/octet-stream' 
\ No newline at end of file
@@ -0,0 +1,176 @@
+import json
+import time
+import hashlib
+import functools
+
+from flask import request, current_app, jsonify
+
+from app.db import get_db
+from app.utils.admission import get_tenant
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+
+MAX_KEY_LENGTH = 255
+
+# A request holding a key for longer than this is assumed to have died
+# (e.g. its worker was killed) and a retry may take the key over
+LOCK_TIMEOUT_SECONDS = 300
+
+# How often a duplicate request checks whether the first one has finished
+POLL_INTERVAL_SECONDS = 0.2
+
+CHUNK_SIZE = 1024 * 1024
+
+def _fingerprint():
+    """
+    Hash what the current request sends: its form fields and files, or its body
+
+    A retry sends the same request again; a key reused for a different
+    request must not get the response of the first one.
+    """
+    digest = hashlib.sha256()
+    if request.form or request.files:
+        digest.update(json.dumps(sorted(request.form.items(multi=True))).encode('utf-8'))
+        for field, upload in sorted(request.files.items(multi=True), key=lambda item: item[0]):
+            digest.update(json.dumps([field, upload.filename]).encode('utf-8'))
+            upload.stream.seek(0)
+            for chunk in iter(lambda: upload.stream.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+            upload.stream.seek(0)
+    else:
+        digest.update(request.get_data())
+    return digest.hexdigest()
+
+def _claim_key(db, scope, tenant, key, fingerprint, ttl):
+    """
+    Claim a key for this request, or get the stored state of an earlier one
+
+    Returns:
+        sqlite3.Row: None if this request now owns the key, otherwise the stored row
+    """
+    now = time.time()
+    db.execute('DELETE FROM idempotent_requests WHERE expires_at < ?', (now,))
+
+    cursor = db.execute(
+        'INSERT INTO idempotent_requests (scope, tenant, idempotency_key, fingerprint, status, locked_at, expires_at)'
+        ' VALUES (?, ?, ?, ?, \'pending\', ?, ?) ON CONFLICT DO NOTHING',
+        (scope, tenant, key, fingerprint, now, now + ttl)
+    )
+    db.commit()
+    if cursor.rowcount == 1:
+        return None
+
+    row = db.execute(
+        'SELECT * FROM idempotent_requests WHERE scope = ? AND tenant = ? AND idempotency_key = ?',
+        (scope, tenant, key)
+    ).fetchone()
+    if row is None:
+        # Expired between the insert and the select; try again
+        return _claim_key(db, scope, tenant, key, fingerprint, ttl)
+
+    if row['status'] == 'pending' and row['fingerprint'] == fingerprint and \
+            row['locked_at'] < now - LOCK_TIMEOUT_SECONDS:
+        cursor = db.execute(
+            'UPDATE idempotent_requests SET locked_at = ?, expires_at = ?'
+            ' WHERE scope = ? AND tenant = ? AND idempotency_key = ? AND status = \'pending\' AND locked_at = ?',
+            (now, now + ttl, scope, tenant, key, row['locked_at'])
+        )
+        db.commit()
+        if cursor.rowcount == 1:
+            return None
+
+    return row
+
+def _store_response(db, scope, tenant, key, response):
+    """Save a finished response so retries with the same key get it back"""
+    headers = [(name, value) for name, value in response.headers.items() if name.lower() != 'content-length']
+    db.execute(
+        'UPDATE idempotent_requests SET status = \'done\', status_code = ?, headers = ?, body = ?'
+        ' WHERE scope = ? AND tenant = ? AND idempotency_key = ?',
+        (response.status_code, json.dumps(headers), response.get_data(), scope, tenant, key)
+    )
+    db.commit()
+
+def _release_key(db, scope, tenant, key):
+    """Forget a key whose request failed, so a retry runs it again"""
+    db.execute(
+        'DELETE FROM idempotent_requests WHERE scope = ? AND tenant = ? AND idempotency_key = ?'
+        ' AND status = \'pending\'',
+        (scope, tenant, key)
+    )
+    db.commit()
+
+def _replay(row):
+    """Build the response stored for a key"""
+    response = current_app.response_class(row['body'], status=row['status_code'])
+    response.headers.clear()
+    for name, value in json.loads(row['headers']):
+        response.headers.add(name, value)
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+def idempotent(scope):
+    """
+    Make a POST route replay its response for a repeated Idempotency-Key
+
+    The first request with a key runs the route and stores its response.
+    Later requests with the same key get the stored response without the
+    route running again; requests arriving while the first one is still
+    running wait for it. Server errors (5xx) are not stored, so a retry
+    after one runs the route again. Requests without the header are not
+    affected.
+
+    Keys are separate per tenant (see admission.get_tenant), and a key
+    reused with different form fields or files is answered with 422.
+
+    Args:
+        scope (str): Name separating the keys of different routes
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            key = request.headers.get(IDEMPOTENCY_HEADER)
+            if request.method != 'POST' or not key:
+                return view(*args, **kwargs)
+
+            if len(key) > MAX_KEY_LENGTH:
+                return jsonify({'error': f'{IDEMPOTENCY_HEADER} must be at most {MAX_KEY_LENGTH} characters'}), 400
+
+            db = get_db()
+            tenant = get_tenant()
+            fingerprint = _fingerprint()
+            ttl = current_app.config['IDEMPOTENCY_TTL_SECONDS']
+            deadline = time.time() + current_app.config['IDEMPOTENCY_WAIT_SECONDS']
+
+            # Wait for a concurrent request with the same key to finish
+            while True:
+                row = _claim_key(db, scope, tenant, key, fingerprint, ttl)
+                if row is None:
+                    break
+                if row['fingerprint'] != fingerprint:
+                    return jsonify({
+                        'error': f'{IDEMPOTENCY_HEADER} was already used for a different request',
+                        'status': 'error'
+                    }), 422
+                if row['status'] == 'done':
+                    return _replay(row)
+                if time.time() >= deadline:
+                    return jsonify({
+                        'error': 'A request with this Idempotency-Key is still being processed',
+                        'status': 'error'
+                    }), 409, {'Retry-After': '5'}
+                time.sleep(POLL_INTERVAL_SECONDS)
+
+            try:
+                response = current_app.make_response(view(*args, **kwargs))
+            except Exception:
+                _release_key(db, scope, tenant, key)
+                raise
+
+            if response.status_code >= 500:
+                _release_key(db, scope, tenant, key)
+            else:
+                _store_response(db, scope, tenant, key, response)
+            return response
+        return wrapper
+    return decorator
@@ -1,20 +1,251 @@
 import cv2
 import numpy as np
 from PIL import Image
+import pytesseract
+
+# Skew angles outside this range are more likely a misdetection than a
+# tilted photo, so they are left alone
+MAX_SKEW_ANGLE = 15.0
+MIN_SKEW_ANGLE = 0.5
+
+# Without Tesseract, a page is only turned on its side when its vertical
+# text lines are this many times longer in total than its horizontal ones
+ORIENTATION_MARGIN = 2.0
+
+# Blobs of merged characters count as text lines when their long side is
+# this many times their short side
+TEXT_LINE_MIN_ASPECT = 3
+
+# Images are analysed for orientation and skew at this size
+ANALYSIS_MAX_DIM = 1000
+
+# Documents are looked for on a copy this small; the corners found there
+# are scaled back to the full image before warping
+DETECTION_MAX_DIM = 320
+
+# A document outline must cover this much of the image
+MIN_DOCUMENT_AREA_RATIO = 0.2
+
+# Rectified cards get the ID-1 size (85.60 x 53.98 mm, as Aadhaar and PAN
+# cards) at about 300 dpi, lying horizontally
+CARD_SIZE = (1012, 638)
+
+# Outlines whose long side isn't this many times their short side aren't cards
+CARD_ASPECT_RANGE = (1.3, 1.9)
+
+def read_image(image_path):
+    """
+    Read an image from disk, or pass an already loaded image through
+    
+    Args:
+        image_path (str or numpy.ndarray): Path to the image file or a BGR image
+        
+    Returns:
+        numpy.ndarray: BGR image, or None if it could not be read
+    """
+    if isinstance(image_path, np.ndarray):
+        return image_path
+    return cv2.imread(image_path)
+
+def measure_text_lines(gray):
+    """
+    Total length of the horizontal and of the vertical text lines of an image
+    
+    Character-sized blobs are merged into lines, and the direction of each
+    elongated line is measured with a minimum-area rectangle, so pages
+    tilted by up to 45 degrees still count as horizontal.
+    
+    Args:
+        gray (numpy.ndarray): Grayscale image
+        
+    Returns:
+        tuple: (horizontal, vertical) lengths in pixels at ANALYSIS_MAX_DIM
+    """
+    # Work at a fixed size, stretched to full contrast, so the thresholds
+    # below hold for thumbnails and faded scans alike
+    scale = ANALYSIS_MAX_DIM / max(gray.shape[0], gray.shape[1])
+    gray = cv2.resize(gray, None, fx=scale, fy=scale,
+                      interpolation=cv2.INTER_AREA if scale < 1 else cv2.INTER_CUBIC)
+    low, high = np.percentile(gray, (1, 99))
+    gray = cv2.convertScaleAbs(gray, alpha=255 / max(high - low, 1), beta=-low * 255 / max(high - low, 1))
+    
+    binary = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY_INV,
+                                   ANALYSIS_MAX_DIM // 40 | 1, 20)
+    count, labels, stats, _ = cv2.connectedComponentsWithStats(binary, connectivity=8)
+    sizes = np.maximum(stats[1:, cv2.CC_STAT_WIDTH], stats[1:, cv2.CC_STAT_HEIGHT])
+    
+    # Specks, photos and rules aren't characters
+    glyphs = (sizes >= 4) & (sizes <= ANALYSIS_MAX_DIM // 10)
+    if glyphs.sum() < 10:
+        return 0.0, 0.0
+    char_size = float(np.median(sizes[glyphs]))
+    
+    # Close the gaps between the characters of a line, not between lines
+    keep = np.zeros(count, np.uint8)
+    keep[np.flatnonzero(glyphs) + 1] = 255
+    size = max(3, int(round(char_size * 0.4)))
+    lines = cv2.dilate(keep[labels], cv2.getStructuringElement(cv2.MORPH_RECT, (size, size)))
+    contours, _ = cv2.findContours(lines, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    
+    horizontal = vertical = 0.0
+    for contour in contours:
+        _, (w, h), angle = cv2.minAreaRect(contour)
+        length, thickness = max(w, h), min(w, h)
+        # Dotted rules and borders are thinner than a line of characters
+        if length < TEXT_LINE_MIN_ASPECT * thickness or length < 3 * char_size or thickness < 0.6 * char_size:
+            continue
+        
+        # Angle of the long side from horizontal, in [0, 90]
+        if h > w:
+            angle += 90
+        if abs((angle + 90) % 180 - 90) < 45:
+            horizontal += length
+        else:
+            vertical += length
+    return horizontal, vertical
+
+def detect_orientation(gray):
+    """
+    Detect how far a document image is rotated from upright
+    
+    Uses Tesseract's orientation and script detection when available, which
+    also tells 90 from 270 and 0 from 180 degrees. Otherwise falls back to
+    the direction of the text lines, which can only tell whether the page
+    is on its side, and only turns it when the lines clearly run vertically.
+    
+    Args:
+        gray (numpy.ndarray): Grayscale image
+        
+    Returns:
+        tuple: (rotation, source) where rotation is the clockwise rotation in
+               degrees (0, 90, 180 or 270) that makes the image upright and
+               source is 'osd' or 'text_lines'
+    """
+    try:
+        osd = pytesseract.image_to_osd(gray, output_type=pytesseract.Output.DICT)
+        if float(osd.get('orientation_conf', 0)) >= 1.0:
+            return int(osd['rotate']) % 360, 'osd'
+    except Exception as e:
+        print(f"Orientation detection with Tesseract failed: {e}")
+    
+    horizontal, vertical = measure_text_lines(gray)
+    return (90 if vertical > ORIENTATION_MARGIN * horizontal else 0), 'text_lines'
+
+def estimate_skew(gray):
+    """
+    Estimate the skew of the text lines in a document image
+    
+    Characters are merged into line blobs and the angle of each elongated
+    blob is measured with a minimum-area rectangle.
+    
+    Args:
+        gray (numpy.ndarray): Grayscale image of an upright (but possibly tilted) page
+        
+    Returns:
+        float: Angle in degrees (counter-clockwise positive) to rotate the
+               image by to straighten it, 0 if no reliable skew was found
+    """
+    _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (max(9, gray.shape[1] // 50), 3))
+    lines = cv2.dilate(binary, kernel)
+    contours, _ = cv2.findContours(lines, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    
+    angles = []
+    lengths = []
+    for contour in contours:
+        _, (w, h), angle = cv2.minAreaRect(contour)
+        if w < h:
+            w, h = h, w
+            angle -= 90
+        
+        # Only long, thin blobs are text lines
+        if w < 3 * h or w < gray.shape[1] * 0.1:
+            continue
+        
+        # Bring the angle into [-45, 45)
+        angle = (angle + 45) % 90 - 45
+        angles.append(angle)
+        lengths.append(w)
+    
+    if not angles:
+        return 0.0
+    
+    # Length-weighted median, so a few stray blobs don't pull the estimate
+    order = np.argsort(angles)
+    cumulative = np.cumsum(np.array(lengths)[order])
+    angle = float(np.array(angles)[order][np.searchsorted(cumulative, cumulative[-1] / 2)])
+    
+    if abs(angle) < MIN_SKEW_ANGLE or abs(angle) > MAX_SKEW_ANGLE:
+        return 0.0
+    return angle
+
+def normalize_document_image(image_path):
+    """
+    Rotate a document image upright and straighten skewed text
+    
+    Meant to run once per document, before any OCR attempt.
+    
+    Args:
+        image_path (str or numpy.ndarray): Path to the image file, or an already loaded BGR image
+        
+    Returns:
+        tuple: (image, info) where image is the normalized BGR image (None if
+               it could not be read) and info has 'rotation', 'orientation_source'
+               and 'skew'
+    """
+    info = {'rotation': 0, 'orientation_source': None, 'skew': 0.0}
+    
+    img = read_image(image_path)
+    if img is None:
+        return None, info
+    
+    try:
+        # Analyse a downscaled copy, then apply the result to the full image
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        max_dim = max(gray.shape[0], gray.shape[1])
+        if max_dim > ANALYSIS_MAX_DIM:
+            scale = ANALYSIS_MAX_DIM / max_dim
+            gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        
+        rotation, source = detect_orientation(gray)
+        info['rotation'] = rotation
+        info['orientation_source'] = source
+        
+        rotate_codes = {
+            90: cv2.ROTATE_90_CLOCKWISE,
+            180: cv2.ROTATE_180,
+            270: cv2.ROTATE_90_COUNTERCLOCKWISE,
+        }
+        if rotation in rotate_codes:
+            img = cv2.rotate(img, rotate_codes[rotation])
+            gray = cv2.rotate(gray, rotate_codes[rotation])
+        
+        skew = estimate_skew(gray)
+        info['skew'] = skew
+        if skew:
+            h, w = img.shape[:2]
+            matrix = cv2.getRotationMatrix2D((w / 2, h / 2), skew, 1.0)
+            img = cv2.warpAffine(img, matrix, (w, h), flags=cv2.INTER_CUBIC, borderMode=cv2.BORDER_REPLICATE)
+        
+        return img, info
+    except Exception as e:
+        print(f"Error normalizing image orientation: {e}")
+        return img, info
 
 def preprocess_image(image_path):
     """
     Preprocess image for better OCR results
     
     Args:
-        image_path (str): Path to the image file
+        image_path (str or numpy.ndarray): Path to the image file, or an already loaded BGR image
         
     Returns:
         PIL.Image: Preprocessed image ready for OCR
     """
     try:
         # Read the image
-        img = cv2.imread(image_path)
+        img = read_image(image_path)
         
         # If image is not readable, return a blank image
         if img is None:
@@ -60,14 +291,14 @@ def enhance_document_image(image_path):
     Apply advanced image enhancement for document images
     
     Args:
-        image_path (str): Path to the image file
+        image_path (str or numpy.ndarray): Path to the image file, or an already loaded BGR image
         
     Returns:
         PIL.Image: Enhanced image
     """
     try:
         # Read the image
-        img = cv2.imread(image_path)
+        img = read_image(image_path)
         
         # If image is not readable, return a blank image
         if img is None:
@@ -116,20 +347,114 @@ def enhance_document_image(image_path):
         blank_img.fill(255)  # White background
         return Image.fromarray(blank_img)
 
+def _order_corners(corners):
+    """Order four points as top-left, top-right, bottom-right, bottom-left"""
+    sums = corners.sum(axis=1)
+    diffs = np.diff(corners, axis=1).ravel()
+    return np.array([
+        corners[np.argmin(sums)],
+        corners[np.argmin(diffs)],
+        corners[np.argmax(sums)],
+        corners[np.argmax(diffs)]
+    ], dtype=np.float32)
+
+def detect_document_quad(img):
+    """
+    Find the outline of a document, e.g. a card photographed on a table
+    
+    Edges are only searched on a copy of at most DETECTION_MAX_DIM pixels,
+    which takes a few milliseconds whatever the size of the photo.
+    
+    Args:
+        img (numpy.ndarray): BGR image
+        
+    Returns:
+        numpy.ndarray: 4 x 2 corners in full image coordinates, ordered
+                       top-left, top-right, bottom-right, bottom-left, or
+                       None if no large enough quadrilateral was found
+    """
+    max_dim = max(img.shape[0], img.shape[1])
+    scale = min(1.0, DETECTION_MAX_DIM / max_dim)
+    small = img
+    if scale < 1.0:
+        # Skip pixels first while the copy stays twice the target size, so
+        # area averaging only runs on a fraction of a large photo
+        step = max(1, int(max_dim / (2 * DETECTION_MAX_DIM)))
+        small = cv2.resize(img[::step, ::step], None, fx=scale * step, fy=scale * step,
+                           interpolation=cv2.INTER_AREA)
+        scale = small.shape[1] / img.shape[1]
+    
+    gray = cv2.GaussianBlur(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY), (5, 5), 0)
+    
+    # Thresholds around the median brightness hold up under most lighting
+    median = float(np.median(gray))
+    edges = cv2.Canny(gray, int(max(0, 0.66 * median)), int(min(255, 1.33 * median)))
+    
+    # Only outer outlines: the text inside a card can't be its border
+    contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    
+    min_area = MIN_DOCUMENT_AREA_RATIO * small.shape[0] * small.shape[1]
+    best, best_area = None, min_area
+    for cnt in contours:
+        # The hull closes outlines broken by glare or fingers over the edge
+        hull = cv2.convexHull(cnt)
+        area = cv2.contourArea(hull)
+        if area < best_area:
+            continue
+        approx = cv2.approxPolyDP(hull, 0.02 * cv2.arcLength(hull, True), True)
+        if len(approx) == 4:
+            best, best_area = approx, area
+    
+    if best is None:
+        return None
+    return _order_corners(best.reshape(4, 2).astype(np.float32) / scale)
+
+def rectify_card(image_path):
+    """
+    Find a card in a photo and warp it to a flat, upright CARD_SIZE image
+    
+    Args:
+        image_path (str or numpy.ndarray): Path to the image file, or an already loaded BGR image
+        
+    Returns:
+        numpy.ndarray: Rectified BGR card, or None if no card was found
+    """
+    img = read_image(image_path)
+    if img is None:
+        return None
+    
+    corners = detect_document_quad(img)
+    if corners is None:
+        return None
+    
+    top_left, top_right, bottom_right, bottom_left = corners
+    width = max(np.linalg.norm(top_right - top_left), np.linalg.norm(bottom_right - bottom_left))
+    height = max(np.linalg.norm(bottom_left - top_left), np.linalg.norm(bottom_right - top_right))
+    aspect = max(width, height) / max(1.0, min(width, height))
+    if not CARD_ASPECT_RANGE[0] <= aspect <= CARD_ASPECT_RANGE[1]:
+        return None
+    
+    # Cards standing up keep their orientation; normalize_document_image turns them
+    size = CARD_SIZE if width >= height else CARD_SIZE[::-1]
+    target = np.array([[0, 0], [size[0] - 1, 0], [size[0] - 1, size[1] - 1], [0, size[1] - 1]], dtype=np.float32)
+    matrix = cv2.getPerspectiveTransform(corners, target)
+    return cv2.warpPerspective(img, matrix, size, flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+
 def crop_document_region(image_path, region='auto'):
     """
     Detect and crop the document region from an image
     
     Args:
-        image_path (str): Path to the image file
-        region (str): 'auto' for automatic detection or 'center' for center crop
+        image_path (str or numpy.ndarray): Path to the image file, or an already loaded BGR image
+        region (str): 'auto' for automatic detection, 'card' for a card
+            rectified to CARD_SIZE (see rectify_card) or 'center' for center crop
         
     Returns:
         PIL.Image: Cropped document image
     """
     try:
         # Read the image
-        img = cv2.imread(image_path)
+        img = read_image(image_path)
         
         # If image is not readable, return a blank image
         if img is None:
@@ -137,6 +462,12 @@ def crop_document_region(image_path, region='auto'):
             blank_img.fill(255)  # White background
             return Image.fromarray(blank_img)
         
+        if region == 'card':
+            # Warped straight from the full resolution image
+            card = rectify_card(img)
+            if card is not None:
+                return Image.fromarray(cv2.cvtColor(card, cv2.COLOR_BGR2RGB))
+        
         # Resize if needed (same as in preprocess_image)
         max_dim = max(img.shape[0], img.shape[1])
         scale_factor = 1.0
@@ -187,7 +518,7 @@ def crop_document_region(image_path, region='auto'):
                         pil_img = Image.fromarray(cv2.cvtColor(cropped, cv2.COLOR_BGR2RGB))
                         return pil_img
         
-        # Fallback to center crop if no suitable contour found or if region='center'
+        # Fallback to center crop if no suitable contour or card found or if region='center'
         h, w = img.shape[:2]
         crop_w = int(w * 0.8)
         crop_h = int(h * 0.8)
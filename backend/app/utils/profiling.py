@@ -0,0 +1,179 @@
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import threading
+import datetime
+
+from flask import request, current_app, g
+
+# Header that profiles a single request; its value must be PROFILE_TOKEN
+PROFILE_HEADER = 'X-Profile'
+
+# Oldest captures are deleted beyond this many
+MAX_PROFILES = 200
+
+class StackSampler:
+    """
+    Sample the stack of one thread at a fixed interval
+
+    Stacks are counted in collapsed form ('outer;inner;leaf'), the input
+    format of flamegraph.pl and speedscope. The profiled thread only pays
+    for the GIL switches, unlike cProfile which hooks every call.
+    """
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts = {}
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                break
+
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            collapsed = ';'.join(reversed(stack))
+            self.counts[collapsed] = self.counts.get(collapsed, 0) + 1
+            self.samples += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+def add_profile_tags(**tags):
+    """
+    Attach tags (e.g. doc_type, ocr_attempts) to the profile of the current request
+
+    Cheap enough to call whether or not the request is being profiled.
+    """
+    g.setdefault('profile_tags', {}).update(tags)
+
+def get_profile_folder():
+    """Folder where captures of the current app are written"""
+    return current_app.config['PROFILE_FOLDER']
+
+def _should_profile():
+    """Profile when asked for with the token, or for a sample of requests"""
+    token = current_app.config['PROFILE_TOKEN']
+    if token and request.headers.get(PROFILE_HEADER) == token:
+        return True, True
+    rate = current_app.config['PROFILE_SAMPLE_RATE']
+    return rate > 0 and random.random() < rate, False
+
+def _start_profile():
+    profile, forced = _should_profile()
+    if not profile:
+        return
+    sampler = StackSampler(threading.get_ident(), current_app.config['PROFILE_INTERVAL_MS'] / 1000)
+    sampler.start()
+    g.profile = {'sampler': sampler, 'forced': forced, 'started_at': time.perf_counter()}
+
+def _record_status(response):
+    if 'profile' in g:
+        g.profile['status_code'] = response.status_code
+    return response
+
+def _finish_profile(e=None):
+    profile = g.pop('profile', None)
+    if profile is None:
+        return
+
+    profile['sampler'].stop()
+    duration = time.perf_counter() - profile['started_at']
+
+    # Sampled requests are only kept when slow; requested ones always are
+    if not profile['forced'] and duration < current_app.config['PROFILE_SLOW_SECONDS']:
+        return
+
+    try:
+        save_profile(profile['sampler'], {
+            'method': request.method,
+            'path': request.path,
+            'endpoint': request.endpoint,
+            'status_code': profile.get('status_code', 500),
+            'duration': round(duration, 3),
+            'forced': profile['forced'],
+            'error': str(e) if e is not None else None,
+            'tags': g.get('profile_tags', {})
+        })
+    except Exception as error:
+        print(f"Error saving request profile: {error}")
+
+def save_profile(sampler, metadata):
+    """
+    Write the collapsed stacks of a request next to its metadata
+
+    Args:
+        sampler (StackSampler): Stopped sampler of the request
+        metadata (dict): Request details and tags
+
+    Returns:
+        str: Identifier of the capture
+    """
+    folder = get_profile_folder()
+    os.makedirs(folder, exist_ok=True)
+
+    profile_id = f"{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+    with open(os.path.join(folder, f'{profile_id}.collapsed'), 'w') as f:
+        for stack, count in sorted(sampler.counts.items()):
+            f.write(f'{stack} {count}\n')
+
+    metadata = dict(metadata, id=profile_id, samples=sampler.samples,
+                    interval_ms=sampler.interval * 1000, created_at=datetime.datetime.now().isoformat())
+    # The metadata file is written last, so listed captures are complete
+    with open(os.path.join(folder, f'{profile_id}.json.tmp'), 'w') as f:
+        json.dump(metadata, f)
+    os.replace(os.path.join(folder, f'{profile_id}.json.tmp'), os.path.join(folder, f'{profile_id}.json'))
+
+    _prune_profiles(folder)
+    return profile_id
+
+def _prune_profiles(folder):
+    """Keep the newest MAX_PROFILES captures"""
+    ids = sorted(name[:-len('.json')] for name in os.listdir(folder) if name.endswith('.json'))
+    for profile_id in ids[:-MAX_PROFILES]:
+        for extension in ('.json', '.collapsed'):
+            try:
+                os.unlink(os.path.join(folder, profile_id + extension))
+            except FileNotFoundError:
+                pass
+
+def list_profiles(folder):
+    """
+    List captures, newest first
+
+    Returns:
+        list: Metadata of each capture
+    """
+    if not os.path.isdir(folder):
+        return []
+
+    profiles = []
+    for name in sorted(os.listdir(folder), reverse=True):
+        if name.endswith('.json'):
+            try:
+                with open(os.path.join(folder, name)) as f:
+                    profiles.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+    return profiles
+
+def init_app(app):
+    """Register request profiling with the app"""
+    app.before_request(_start_profile)
+    app.after_request(_record_status)
+    app.teardown_request(_finish_profile)
@@ -0,0 +1,157 @@
+import os
+import time
+import uuid
+import tempfile
+import threading
+import numpy as np
+from PIL import Image
+
+# Published images are memory-mapped .npy files. /dev/shm keeps them in RAM
+# on Linux; elsewhere the temporary directory is used.
+SHARED_IMAGE_DIR = os.environ.get('SHARED_IMAGE_DIR') or (
+    '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+)
+SHARED_IMAGE_PREFIX = 'loanly-image-'
+
+# References held in this process, by path. Only the publishing process
+# counts references; workers just attach to the file.
+_refcounts = {}
+_refcounts_lock = threading.Lock()
+
+def publish_array(array):
+    """
+    Copy an array into shared memory once, so that worker processes can read
+    it without it being pickled
+
+    Args:
+        array (numpy.ndarray or PIL.Image): Image or other array to publish
+
+    Returns:
+        dict: Handle with 'path', 'shape', 'dtype' and 'mode' (PIL mode, or
+              None for arrays). Small enough to send to workers. It holds one
+              reference, to be given back with release.
+    """
+    mode = None
+    if isinstance(array, Image.Image):
+        mode = array.mode
+        array = np.asarray(array)
+    array = np.ascontiguousarray(array)
+
+    path = os.path.join(SHARED_IMAGE_DIR, f'{SHARED_IMAGE_PREFIX}{os.getpid()}-{uuid.uuid4().hex}.npy')
+    temp_path = path + '.tmp'
+    mapped = np.lib.format.open_memmap(temp_path, mode='w+', dtype=array.dtype, shape=array.shape)
+    try:
+        mapped[...] = array
+        mapped.flush()
+    finally:
+        del mapped
+    # Workers only ever see complete files
+    os.replace(temp_path, path)
+
+    with _refcounts_lock:
+        _refcounts[path] = 1
+    return {'path': path, 'shape': tuple(array.shape), 'dtype': str(array.dtype), 'mode': mode}
+
+def attach_array(handle):
+    """
+    Map a published array read-only, without copying it
+
+    Args:
+        handle (dict): Handle returned by publish_array
+
+    Returns:
+        numpy.ndarray: Read-only view of the shared data
+    """
+    array = np.load(handle['path'], mmap_mode='r')
+    if array.shape != tuple(handle['shape']) or str(array.dtype) != handle['dtype']:
+        raise ValueError(f"Shared image {handle['path']} does not match its handle")
+    return array
+
+def attach_image(handle):
+    """
+    Like attach_array, as a PIL image when a PIL image was published
+
+    Returns:
+        PIL.Image or numpy.ndarray: Image backed by the shared data
+    """
+    array = attach_array(handle)
+    if handle.get('mode') is None:
+        return array
+    return Image.fromarray(array, mode=handle['mode'])
+
+def retain(handle):
+    """Take another reference to a published array"""
+    with _refcounts_lock:
+        if handle['path'] not in _refcounts:
+            raise ValueError(f"Shared image {handle['path']} was already released")
+        _refcounts[handle['path']] += 1
+
+def release(handle):
+    """
+    Give back a reference to a published array, removing it with the last one
+
+    Workers that still have the file mapped keep reading it; the memory is
+    freed once they unmap it.
+    """
+    with _refcounts_lock:
+        count = _refcounts.get(handle['path'], 0) - 1
+        if count > 0:
+            _refcounts[handle['path']] = count
+            return
+        _refcounts.pop(handle['path'], None)
+
+    try:
+        os.unlink(handle['path'])
+    except FileNotFoundError:
+        pass
+
+def submit_with_images(executor, handles, func, *args):
+    """
+    Submit a task that reads published arrays, keeping them alive until it is done
+
+    Args:
+        executor (concurrent.futures.Executor): Pool to run the task on
+        handles (list): Handles the task attaches to
+        func (callable): Task function; it is given args, which should contain the handles
+        *args: Arguments of func
+
+    Returns:
+        concurrent.futures.Future: Future of the task
+    """
+    for handle in handles:
+        retain(handle)
+
+    def release_all(future):
+        for handle in handles:
+            release(handle)
+
+    try:
+        future = executor.submit(func, *args)
+    except Exception:
+        release_all(None)
+        raise
+    future.add_done_callback(release_all)
+    return future
+
+def sweep_shared_images(max_age_seconds=3600):
+    """
+    Remove published arrays left behind by processes that were killed
+
+    Args:
+        max_age_seconds (float): Only files older than this are removed
+
+    Returns:
+        int: Number of files removed
+    """
+    removed = 0
+    cutoff = time.time() - max_age_seconds
+    for entry in os.scandir(SHARED_IMAGE_DIR):
+        if not entry.name.startswith(SHARED_IMAGE_PREFIX):
+            continue
+        try:
+            if entry.stat().st_mtime < cutoff:
+                os.unlink(entry.path)
+                removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
@@ -1,5 +1,78 @@
 import re
 
+# Verhoeff checksum tables (dihedral group D5 multiplication, permutation)
+VERHOEFF_MULTIPLICATION = [
+    [0, 1, 2, 3, 4, 5, 6, 7, 8, 9],
+    [1, 2, 3, 4, 0, 6, 7, 8, 9, 5],
+    [2, 3, 4, 0, 1, 7, 8, 9, 5, 6],
+    [3, 4, 0, 1, 2, 8, 9, 5, 6, 7],
+    [4, 0, 1, 2, 3, 9, 5, 6, 7, 8],
+    [5, 9, 8, 7, 6, 0, 4, 3, 2, 1],
+    [6, 5, 9, 8, 7, 1, 0, 4, 3, 2],
+    [7, 6, 5, 9, 8, 2, 1, 0, 4, 3],
+    [8, 7, 6, 5, 9, 3, 2, 1, 0, 4],
+    [9, 8, 7, 6, 5, 4, 3, 2, 1, 0],
+]
+VERHOEFF_PERMUTATION = [
+    [0, 1, 2, 3, 4, 5, 6, 7, 8, 9],
+    [1, 5, 7, 6, 2, 8, 3, 0, 9, 4],
+    [5, 8, 0, 3, 7, 9, 6, 1, 4, 2],
+    [8, 9, 1, 6, 0, 4, 3, 5, 2, 7],
+    [9, 4, 5, 3, 1, 2, 6, 8, 7, 0],
+    [4, 2, 8, 6, 5, 7, 3, 9, 0, 1],
+    [2, 7, 9, 3, 8, 0, 6, 4, 1, 5],
+    [7, 0, 4, 6, 9, 1, 3, 2, 5, 8],
+]
+
+# 4th character of a PAN identifies the kind of holder: Association of
+# persons, Body of individuals, Company, Firm, Government, HUF, Local
+# authority, artificial Juridical person, Person or Trust
+PAN_ENTITY_CODES = 'ABCFGHLJPT'
+
+def verhoeff_checksum_valid(number):
+    """
+    Check the Verhoeff checksum of a number (used by Aadhaar)
+    
+    Args:
+        number (str): Digits, with the check digit last
+        
+    Returns:
+        bool: True if the checksum is valid
+    """
+    checksum = 0
+    for i, digit in enumerate(reversed(number)):
+        checksum = VERHOEFF_MULTIPLICATION[checksum][VERHOEFF_PERMUTATION[i % 8][int(digit)]]
+    return checksum == 0
+
+def is_valid_aadhaar_number(aadhaar):
+    """
+    Check that an Aadhaar number is structurally valid
+    
+    Aadhaar numbers are 12 digits, never start with 0 or 1, and end with
+    a Verhoeff check digit.
+    
+    Args:
+        aadhaar (str): Aadhaar number without spaces
+        
+    Returns:
+        bool: True if valid, False otherwise
+    """
+    aadhaar = str(aadhaar or '')
+    return bool(re.match(r'^[2-9]\d{11}$', aadhaar)) and verhoeff_checksum_valid(aadhaar)
+
+def is_valid_pan_number(pan):
+    """
+    Check that a PAN is structurally valid
+    
+    Args:
+        pan (str): PAN such as ABCPE1234F
+        
+    Returns:
+        bool: True if valid, False otherwise
+    """
+    pan = str(pan or '')
+    return bool(re.match(r'^[A-Z]{5}[0-9]{4}[A-Z]{1}$', pan)) and pan[3] in PAN_ENTITY_CODES
+
 def validate_aadhaar(text, data):
     """
     Validate Aadhaar card data - simplified to just require aadhaar number
@@ -15,9 +88,8 @@ def validate_aadhaar(text, data):
     if 'aadhaar_number' not in data:
         return False
     
-    # Basic Aadhaar validation (12 digits)
-    aadhaar = data['aadhaar_number']
-    if not re.match(r'^\d{12}$', aadhaar):
+    # 12 digits with a valid Verhoeff check digit
+    if not is_valid_aadhaar_number(data['aadhaar_number']):
         return False
     
     # We've simplified - if we have an Aadhaar number, it's considered valid
@@ -39,8 +111,8 @@ def validate_pan(text, data):
         return False
     
     # Validate PAN format (5 uppercase letters + 4 digits + 1 uppercase letter)
-    pan = data['pan_number']
-    if not re.match(r'^[A-Z]{5}[0-9]{4}[A-Z]{1}$', pan):
+    # and the holder type in the 4th character
+    if not is_valid_pan_number(data['pan_number']):
         return False
     
     # PAN card is considered valid if we have the number
@@ -70,6 +142,9 @@ def validate_document_data(doc_type, data):
         elif not re.match(r'^\d{12}$', str(data.get('aadhaar_number', ''))):
             result['valid'] = False
             result['errors'].append('Invalid Aadhaar number format')
+        elif not is_valid_aadhaar_number(data['aadhaar_number']):
+            result['valid'] = False
+            result['errors'].append('Invalid Aadhaar number checksum')
             
         if not data.get('name'):
             result['warnings'].append('Name not found in document')
@@ -81,6 +156,9 @@ def validate_document_data(doc_type, data):
         elif not re.match(r'^[A-Z]{5}[0-9]{4}[A-Z]{1}$', str(data.get('pan_number', ''))):
             result['valid'] = False
             result['errors'].append('Invalid PAN number format')
+        elif not is_valid_pan_number(data['pan_number']):
+            result['valid'] = False
+            result['errors'].append('Invalid PAN holder type')
             
         if not data.get('name'):
             result['warnings'].append('Name not found in document')
@@ -95,5 +173,13 @@ def validate_document_data(doc_type, data):
             
         if not data.get('pan') and not re.match(r'^[A-Z]{5}[0-9]{4}[A-Z]{1}$', str(data.get('pan', ''))):
             result['warnings'].append('Valid PAN number not found in tax document')
+    
+    elif 'bank' in doc_type:
+        if not data.get('account_number'):
+            result['valid'] = False
+            result['errors'].append('Account number not found')
+        
+        if not data.get('ifsc'):
+            result['warnings'].append('IFSC code not found')
             
     return result 
\ No newline at end of file
@@ -0,0 +1,78 @@
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+import app.services.face_verification as face_verification
+from app import create_app
+from app.db import connect
+
+STATIC_FOLDER = os.path.join(os.path.dirname(__file__), '..', 'static')
+SAMPLE_VIDEO = '1104d154-6a02-49de-ac21-8f95413955e6_20250319_121623_verification-video.webm'
+
+@pytest.fixture
+def app(tmp_path):
+    """App with its database and upload folders in a temporary directory"""
+    upload_folder = tmp_path / 'uploads'
+    video_folder = tmp_path / 'videos'
+    os.makedirs(upload_folder)
+    os.makedirs(video_folder)
+    return create_app({
+        'TESTING': True,
+        'DATABASE': str(tmp_path / 'loanly.sqlite'),
+        'UPLOAD_FOLDER': str(upload_folder),
+        'VIDEO_FOLDER': str(video_folder),
+    })
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+@pytest.fixture
+def db(app):
+    """Connection to the app's database, outside of any request"""
+    db = connect(app.config['DATABASE'])
+    yield db
+    db.close()
+
+@pytest.fixture
+def sample_video_path():
+    """Path of a recorded verification video shipped with the repo"""
+    return os.path.join(STATIC_FOLDER, 'videos', SAMPLE_VIDEO)
+
+@pytest.fixture
+def sample_video(sample_video_path):
+    """Bytes of the sample video"""
+    with open(sample_video_path, 'rb') as f:
+        return f.read()
+
+class StubRecognizer:
+    """Stand-in for cv2.FaceRecognizerSF: the embedding is a thumbnail of the face"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def feature(self, face):
+        self.calls += 1
+        size = (16, face_verification.EMBEDDING_DIM // 16)
+        thumbnail = cv2.resize(cv2.cvtColor(face, cv2.COLOR_BGR2GRAY), size).astype(np.float32)
+        return (thumbnail - thumbnail.mean()).reshape(1, -1)
+
+def _use_recognizer(monkeypatch, recognizer):
+    """Make get_face_recognizer return a recognizer, and DeepFace unavailable"""
+    monkeypatch.setattr(face_verification, '_face_recognizer', recognizer)
+    monkeypatch.setattr(face_verification, '_face_recognizer_loaded', True)
+    monkeypatch.setattr(face_verification, 'get_deepface', lambda: None)
+
+@pytest.fixture
+def recognizer(monkeypatch):
+    """Stub embedding model in place of the SFace model"""
+    recognizer = StubRecognizer()
+    _use_recognizer(monkeypatch, recognizer)
+    return recognizer
+
+@pytest.fixture
+def no_recognizer(monkeypatch):
+    """Neither DeepFace nor the embedding model is available"""
+    _use_recognizer(monkeypatch, None)
@@ -0,0 +1,79 @@
+import time
+
+import pytest
+
+import app.utils.admission as admission
+from app.utils.admission import acquire, release, connect_admission_db, get_tenant
+
+jwt = pytest.importorskip('jwt')
+
+SECRET = 'test-secret'
+
+@pytest.fixture
+def app_context(app):
+    app.config['JWT_SECRET_KEY'] = SECRET
+    app.config['ADMISSION_LIMITS']['ocr'] = {'concurrency': 2, 'queue_size': 0,
+                                             'tenant_queue_size': 0, 'max_wait': 1}
+    with app.app_context():
+        yield
+
+def _tenant(app, headers=None, client_ip='10.0.0.1'):
+    with app.test_request_context('/', headers=headers or {}, environ_base={'REMOTE_ADDR': client_ip}):
+        return get_tenant()
+
+def _bearer(subject, secret=SECRET):
+    return {'Authorization': f"Bearer {jwt.encode({'sub': subject}, secret, algorithm='HS256')}"}
+
+def test_tenant_header_is_ignored(app, app_context):
+    assert _tenant(app, {'X-Tenant-ID': 'a'}) == _tenant(app, {'X-Tenant-ID': 'b'}) == 'ip:10.0.0.1'
+
+def test_tenant_is_the_token_subject(app, app_context):
+    assert _tenant(app, _bearer('user-1')) == 'user:user-1'
+    assert _tenant(app, _bearer('user-1'), client_ip='10.0.0.2') == 'user:user-1'
+
+def test_unverified_token_falls_back_to_the_client_ip(app, app_context):
+    assert _tenant(app, _bearer('user-1', secret='forged')) == 'ip:10.0.0.1'
+    assert _tenant(app, {'Authorization': 'Bearer not-a-token'}) == 'ip:10.0.0.1'
+
+def test_forwarded_ip_is_used_behind_trusted_proxies(tmp_path):
+    from app import create_app
+    app = create_app({'TESTING': True, 'DATABASE': str(tmp_path / 'loanly.sqlite'), 'TRUSTED_PROXY_COUNT': 1})
+    app.add_url_rule('/tenant', 'tenant', get_tenant)
+
+    response = app.test_client().get('/tenant', headers={'X-Forwarded-For': '203.0.113.7'})
+
+    assert response.get_data(as_text=True) == 'ip:203.0.113.7'
+
+def test_held_ticket_is_renewed(app, app_context, monkeypatch):
+    monkeypatch.setattr(admission, 'RUNNING_HEARTBEAT_SECONDS', 0.05)
+    monkeypatch.setattr(admission, '_heartbeat_pid', None)
+    db = connect_admission_db()
+    ticket = acquire(db, 'ocr', 'ip:10.0.0.1')
+    stale = time.time() - admission.RUNNING_LEASE_SECONDS - 1
+    db.execute('UPDATE admission_tickets SET heartbeat_at = ? WHERE ticket = ?', (stale, ticket))
+
+    deadline = time.time() + 5
+    while db.execute('SELECT heartbeat_at FROM admission_tickets WHERE ticket = ?', (ticket,)).fetchone()[0] == stale:
+        assert time.time() < deadline, 'ticket was not renewed'
+        time.sleep(0.05)
+
+    # A long run keeps its slot: the stale-ticket purge leaves it alone
+    other = acquire(db, 'ocr', 'ip:10.0.0.2')
+    assert db.execute('SELECT COUNT(*) FROM admission_tickets').fetchone()[0] == 2
+    release(db, 'ocr', other)
+    release(db, 'ocr', ticket)
+    db.close()
+
+def test_ticket_of_a_killed_worker_is_purged(app, app_context):
+    db = connect_admission_db()
+    ticket = acquire(db, 'ocr', 'ip:10.0.0.1')
+    # Released without going through release, like a worker that died
+    admission._unhold(ticket)
+    db.execute('UPDATE admission_tickets SET heartbeat_at = ? WHERE ticket = ?',
+               (time.time() - admission.RUNNING_LEASE_SECONDS - 1, ticket))
+
+    other = acquire(db, 'ocr', 'ip:10.0.0.2')
+
+    assert [row[0] for row in db.execute('SELECT ticket FROM admission_tickets')] == [other]
+    release(db, 'ocr', other)
+    db.close()
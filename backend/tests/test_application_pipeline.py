@@ -0,0 +1,116 @@
+import functools
+
+import pytest
+
+from app.services.application_pipeline import run_graph
+from app.utils.admission import acquire, release, connect_admission_db
+
+TENANT = 'tests'
+
+def _node(name, deps, key, run, workload=None):
+    return {'name': name, 'deps': deps, 'key': key, 'workload': workload, 'run': run}
+
+def _build(calls, a_key, b_key):
+    """
+    a and b have no dependencies, c reads a and d reads c and b; b runs on
+    the node pool like the OCR nodes
+    """
+    def node_run(name, compute, results):
+        calls.append(name)
+        return compute(results)
+
+    return [
+        _node('a', [], [a_key], functools.partial(node_run, 'a', lambda results: {'value': a_key})),
+        _node('b', [], [b_key], functools.partial(node_run, 'b', lambda results: {'value': b_key}), 'ocr'),
+        _node('c', ['a'], [], functools.partial(node_run, 'c', lambda results: {'odd': results['a']['value'] % 2})),
+        _node('d', ['c', 'b'], [], functools.partial(
+            node_run, 'd', lambda results: {'total': results['c']['odd'] + results['b']['value']})),
+    ]
+
+def _run(db, nodes):
+    return {event['node']: event for event in run_graph(db, 'app-1', nodes, TENANT)}
+
+@pytest.fixture
+def app_context(app):
+    with app.app_context():
+        yield
+
+def test_first_run_computes_every_node(app_context, db):
+    calls = []
+    events = _run(db, _build(calls, 1, 10))
+
+    assert sorted(calls) == ['a', 'b', 'c', 'd']
+    assert {name: event['status'] for name, event in events.items()} == \
+        {'a': 'done', 'b': 'done', 'c': 'done', 'd': 'done'}
+    assert events['d']['result'] == {'total': 11}
+
+def test_unchanged_inputs_are_served_from_memo(app_context, db):
+    _run(db, _build([], 1, 10))
+
+    calls = []
+    events = _run(db, _build(calls, 1, 10))
+
+    assert calls == []
+    assert all(event['status'] == 'cached' for event in events.values())
+    assert events['d']['result'] == {'total': 11}
+
+def test_only_dependents_recompute(app_context, db):
+    _run(db, _build([], 1, 10))
+
+    calls = []
+    events = _run(db, _build(calls, 2, 10))
+
+    assert sorted(calls) == ['a', 'c', 'd']
+    assert events['b']['status'] == 'cached'
+    assert events['d']['result'] == {'total': 10}
+
+def test_unchanged_result_stops_recomputation(app_context, db):
+    _run(db, _build([], 1, 10))
+
+    # c gives the same result for 3 as for 1, so d is not run again
+    calls = []
+    events = _run(db, _build(calls, 3, 10))
+
+    assert sorted(calls) == ['a', 'c']
+    assert events['d']['status'] == 'cached'
+
+def test_pooled_nodes_take_an_admission_ticket(app, app_context, db):
+    _run(db, _build([], 1, 10))
+
+    stats = db.execute('SELECT admitted, completed FROM admission_stats WHERE workload = ?', ('ocr',)).fetchone()
+    assert (stats['admitted'], stats['completed']) == (1, 1)
+
+def test_node_not_admitted_is_retried_on_next_run(app, app_context, db):
+    app.config['ADMISSION_LIMITS']['ocr'] = {'concurrency': 1, 'queue_size': 0,
+                                             'tenant_queue_size': 0, 'max_wait': 1}
+    admission_db = connect_admission_db()
+    ticket = acquire(admission_db, 'ocr', 'other-tenant')
+    try:
+        calls = []
+        events = _run(db, _build(calls, 1, 10))
+    finally:
+        release(admission_db, 'ocr', ticket)
+        admission_db.close()
+
+    assert 'b' not in calls
+    assert events['b']['status'] == 'error'
+    assert events['b']['result']['retry_after'] >= 1
+    assert events['d']['status'] == 'skipped'
+
+    calls = []
+    events = _run(db, _build(calls, 1, 10))
+
+    assert sorted(calls) == ['b', 'd']
+    assert events['d']['result'] == {'total': 11}
+
+@pytest.mark.parametrize('terms', [
+    {'tenure_months': -12},
+    {'tenure_months': 12.5},
+    {'credit_score': 1000},
+    {'loan_amount': 0},
+    {'annual_rate': 'NaN'},
+])
+def test_pipeline_rejects_out_of_range_terms(client, terms):
+    response = client.post('/api/applications/app-1/pipeline', json=terms)
+
+    assert response.status_code == 400
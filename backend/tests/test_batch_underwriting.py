@@ -0,0 +1,36 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.services.batch_underwriting import underwrite_frame
+
+def _applications(tenures):
+    return pd.DataFrame({
+        'loan_amount': ['500000'] * len(tenures),
+        'monthly_income': ['90000'] * len(tenures),
+        'credit_score': ['760'] * len(tenures),
+        'tenure_months': tenures,
+    })
+
+@pytest.mark.parametrize('tenure, error', [
+    ('0', 'tenure_months must be between 1 and 360'),
+    ('-12', 'tenure_months must be between 1 and 360'),
+    ('361', 'tenure_months must be between 1 and 360'),
+    ('12.5', 'tenure_months must be a whole number'),
+    ('twelve', 'tenure_months must be a number'),
+])
+def test_invalid_tenure_is_refused(tenure, error):
+    result = underwrite_frame(_applications([tenure, '48']))
+
+    refused, scored = result.iloc[0], result.iloc[1]
+    assert refused['input_errors'] == error
+    assert refused['status'] == 'more_info'
+    assert np.isnan(refused['emi']) and np.isnan(refused['max_eligible_amount']) and np.isnan(refused['foir'])
+    assert scored['input_errors'] == '' and scored['status'] == 'approved'
+    assert np.isfinite(scored['emi'])
+
+def test_blank_tenure_takes_the_default():
+    result = underwrite_frame(_applications(['', '36']))
+
+    assert list(result['input_errors']) == ['', '']
+    assert result['emi'].iloc[0] == result['emi'].iloc[1]
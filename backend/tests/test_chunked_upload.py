@@ -0,0 +1,71 @@
+import io
+
+import pytest
+
+import app.routes.video_routes as video_routes
+
+def _upload(client, content):
+    """Start an upload and send all of its bytes"""
+    response = client.post('/api/video/uploads', json={'filename': 'video.webm', 'length': len(content)})
+    upload_id = response.json['upload_id']
+    response = client.patch(f'/api/video/uploads/{upload_id}', data=content, headers={'Upload-Offset': '0'})
+    assert response.status_code == 200
+    return upload_id
+
+def test_finalize_is_retried_after_a_failure(client, sample_video, monkeypatch):
+    upload_id = _upload(client, sample_video)
+
+    def fail(*args, **kwargs):
+        raise RuntimeError('proxy failed')
+    build_video_proxy = video_routes.build_video_proxy
+    monkeypatch.setattr(video_routes, 'build_video_proxy', fail)
+    with pytest.raises(RuntimeError):
+        client.post(f'/api/video/uploads/{upload_id}/finalize')
+
+    # The video is stored by now; the retry must not store it again
+    monkeypatch.setattr(video_routes, 'build_video_proxy', build_video_proxy)
+    response = client.post(f'/api/video/uploads/{upload_id}/finalize')
+
+    assert response.status_code == 201
+    assert response.json['video_id'] == upload_id
+    assert client.get(f'/api/video/uploads/{upload_id}').json['status'] == 'complete'
+
+def test_finalize_repeats_its_result(client, sample_video):
+    upload_id = _upload(client, sample_video)
+
+    first = client.post(f'/api/video/uploads/{upload_id}/finalize')
+    again = client.post(f'/api/video/uploads/{upload_id}/finalize')
+
+    assert first.status_code == again.status_code == 201
+    assert first.json == again.json
+
+def _stored_blobs(app):
+    with app.app_context():
+        from app.db import get_db
+        return get_db().execute('SELECT COUNT(*) FROM blobs').fetchone()[0]
+
+def test_verify_with_an_unknown_baseline_stores_nothing(app, client, sample_video):
+    response = client.post('/api/video/verify', data={'video': (io.BytesIO(sample_video), 'video.webm'),
+                                                      'baseline_video_id': 'unknown'})
+
+    assert response.status_code == 404
+    assert _stored_blobs(app) == 0
+
+def test_finalize_with_an_expired_baseline_stores_nothing(app, client, sample_video):
+    baseline_id = _upload(client, sample_video)
+    assert client.post(f'/api/video/uploads/{baseline_id}/finalize').status_code == 201
+    response = client.post('/api/video/uploads', json={'filename': 'video.webm', 'length': len(sample_video),
+                                                       'baseline_video_id': baseline_id})
+    upload_id = response.json['upload_id']
+    client.patch(f'/api/video/uploads/{upload_id}', data=sample_video, headers={'Upload-Offset': '0'})
+    with app.app_context():
+        from app.db import get_db
+        db = get_db()
+        db.execute('DELETE FROM blob_refs WHERE ref_id LIKE ?', (f'%{baseline_id}%',))
+        db.commit()
+
+    response = client.post(f'/api/video/uploads/{upload_id}/finalize')
+
+    assert response.status_code == 404
+    assert _stored_blobs(app) == 1
+    assert client.get(f'/api/video/uploads/{upload_id}').json['status'] == 'open'
@@ -0,0 +1,31 @@
+import os
+import subprocess
+import sys
+
+import pandas as pd
+
+def test_underwrite_writes_chunks_in_input_order(app, tmp_path):
+    input_path = tmp_path / 'applications.csv'
+    output_path = tmp_path / 'results.csv'
+    pd.DataFrame({
+        'application_id': [f'A{index}' for index in range(23)],
+        'loan_amount': [500000 + index * 1000 for index in range(23)],
+        'monthly_income': [90000] * 23,
+        'existing_emis': [5000] * 23,
+        'credit_score': [760 - index * 20 for index in range(23)],
+    }).to_csv(input_path, index=False)
+
+    result = app.test_cli_runner().invoke(args=['underwrite', str(input_path), str(output_path),
+                                                '--chunk-size', '4', '--workers', '2'])
+
+    assert result.exit_code == 0, result.output
+    assert 'Done: 23 applications' in result.output
+    written = pd.read_csv(output_path)
+    assert list(written['application_id']) == [f'A{index}' for index in range(23)]
+
+def test_cli_does_not_import_boto3():
+    # boto3 takes long to import and is only needed by the S3 backend
+    code = 'import sys, app.cli; sys.exit("boto3" in sys.modules)'
+    result = subprocess.run([sys.executable, '-c', code], cwd=os.path.dirname(os.path.dirname(__file__)))
+
+    assert result.returncode == 0
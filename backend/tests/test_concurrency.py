@@ -0,0 +1,38 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from app.utils.concurrency import bounded_map, ordered_map
+
+def _slow_first(item):
+    # The first items finish last
+    time.sleep(0.01 * max(0, 5 - item))
+    return item * 2
+
+def test_ordered_map_keeps_input_order():
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        assert list(ordered_map(executor, _slow_first, range(20), 4)) == [item * 2 for item in range(20)]
+
+def test_ordered_map_bounds_results_held():
+    lock = threading.Lock()
+    submitted = [0]
+    yielded = 0
+    most_held = 0
+
+    def items():
+        for item in range(50):
+            with lock:
+                submitted[0] += 1
+            yield item
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        for _ in ordered_map(executor, _slow_first, items(), 6):
+            yielded += 1
+            most_held = max(most_held, submitted[0] - yielded)
+
+    assert yielded == 50
+    assert most_held <= 6
+
+def test_bounded_map_returns_every_result():
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        assert sorted(bounded_map(executor, _slow_first, range(20), 4)) == [item * 2 for item in range(20)]
@@ -0,0 +1,50 @@
+import pytest
+
+import app.services.consistency_checker as consistency_checker
+from app.services.consistency_checker import check_application_consistency, CONSISTENCY_CHECKS
+
+DOCUMENTS = {
+    'aadhaar-front': {'name': 'Ravi Kumar', 'dob': '01/02/1990'},
+    'pan-front': {'name': 'RAVI KUMAR', 'dob': '01/02/1990', 'pan_number': 'ABCPE1234F'},
+}
+
+@pytest.fixture
+def runs(monkeypatch):
+    """Names of the checks actually run"""
+    runs = []
+    run_check = consistency_checker.run_check
+
+    def counting_run_check(check, documents):
+        runs.append(check['name'])
+        return run_check(check, documents)
+
+    monkeypatch.setattr(consistency_checker, 'run_check', counting_run_check)
+    return runs
+
+def test_unchanged_inputs_reuse_results(db, runs):
+    first = check_application_consistency(db, 'app-1', DOCUMENTS)
+    runs.clear()
+
+    again = check_application_consistency(db, 'app-1', DOCUMENTS)
+
+    assert runs == [] and again['recomputed_checks'] == 0
+    assert again['checks'] == first['checks']
+
+def test_new_check_version_recomputes_results(db, runs, monkeypatch):
+    check_application_consistency(db, 'app-1', DOCUMENTS)
+    runs.clear()
+    monkeypatch.setattr(consistency_checker, 'CONSISTENCY_CHECK_VERSION',
+                        consistency_checker.CONSISTENCY_CHECK_VERSION + 1)
+
+    check_application_consistency(db, 'app-1', DOCUMENTS)
+
+    assert runs == [check['name'] for check in CONSISTENCY_CHECKS]
+
+def test_new_threshold_recomputes_fuzzy_checks(db, runs, monkeypatch):
+    check_application_consistency(db, 'app-1', DOCUMENTS)
+    runs.clear()
+    monkeypatch.setattr(consistency_checker, 'NAME_MATCH_THRESHOLD', 0.99)
+
+    check_application_consistency(db, 'app-1', DOCUMENTS)
+
+    assert runs == [check['name'] for check in CONSISTENCY_CHECKS if check['kind'] == 'fuzzy']
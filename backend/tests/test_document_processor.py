@@ -0,0 +1,34 @@
+import pytest
+
+from app.services.document_processor import select_ocr_result
+
+AADHAAR_TEXT = 'Name: RAVI KUMAR\nAadhaar 2341 2341 2346'
+PAN_TEXT = 'Name: RAVI KUMAR\nPermanent Account Number ABCPE1234F'
+
+def _attempts(texts, consumed):
+    """Attempts as iter_ocr_attempts yields them, recording which were run"""
+    for text in texts:
+        consumed.append(text)
+        yield {'text': text, 'words': []}
+
+@pytest.mark.parametrize('doc_type, text, field, value', [
+    ('aadhaar-front', AADHAAR_TEXT, 'aadhaar_number', '234123412346'),
+    ('pan-front', PAN_TEXT, 'pan_number', 'ABCPE1234F'),
+])
+def test_valid_first_attempt_stops_ocr(doc_type, text, field, value):
+    consumed = []
+
+    result_text, extracted_data = select_ocr_result(_attempts([text, 'second', 'third'], consumed), doc_type)
+
+    assert consumed == [text]
+    assert result_text == text
+    assert extracted_data[field] == value
+
+def test_invalid_checksum_runs_the_next_attempt():
+    consumed = []
+    bad_read = 'Name: RAVI KUMAR\nAadhaar 2341 2341 2347'
+
+    _, extracted_data = select_ocr_result(_attempts([bad_read, AADHAAR_TEXT, 'third'], consumed), 'aadhaar-front')
+
+    assert consumed == [bad_read, AADHAAR_TEXT]
+    assert extracted_data['aadhaar_number'] == '234123412346'
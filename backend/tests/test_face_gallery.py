@@ -0,0 +1,90 @@
+import numpy as np
+import pytest
+
+import app.services.face_gallery as face_gallery
+from app.services.face_gallery import FaceGallery, EMBEDDING_DIM, GALLERY_DIR, enroll_faces, get_enrolled_embeddings
+from app.services.face_verification import extract_face_data, compute_face_embeddings
+
+def _embeddings(seed, count):
+    return np.random.default_rng(seed).random((count, EMBEDDING_DIM), dtype=np.float32)
+
+@pytest.fixture
+def gallery(tmp_path):
+    return FaceGallery(str(tmp_path / 'gallery'))
+
+def test_get_returns_the_rows_of_a_video(gallery):
+    videos = {f'video-{index}': _embeddings(index, index + 1) for index in range(5)}
+    for video_id, embeddings in videos.items():
+        gallery.add(video_id, embeddings)
+
+    for video_id, embeddings in videos.items():
+        np.testing.assert_array_equal(gallery.get(video_id), embeddings)
+    assert gallery.get('video-unknown') is None
+
+def test_index_follows_appends_of_other_processes(tmp_path):
+    reader = FaceGallery(str(tmp_path / 'gallery'))
+    writer = FaceGallery(str(tmp_path / 'gallery'))
+    writer.add('video-1', _embeddings(1, 3))
+    assert reader.get('video-1') is not None
+
+    writer.add('video-2', _embeddings(2, 2))
+    # Enrolled again later: the video has two ranges of rows
+    writer.add('video-1', _embeddings(3, 1))
+
+    np.testing.assert_array_equal(reader.get('video-2'), _embeddings(2, 2))
+    np.testing.assert_array_equal(reader.get('video-1'), np.concatenate([_embeddings(1, 3), _embeddings(3, 1)]))
+    assert reader.refresh()['index'][b'video-1'] == ((0, 3), (5, 6))
+
+def test_index_spans_batches(gallery, monkeypatch):
+    monkeypatch.setattr(face_gallery, 'INDEX_BATCH_ROWS', 2)
+    gallery.add('video-1', _embeddings(1, 5))
+    gallery.add('video-2', _embeddings(2, 3))
+
+    assert gallery.refresh()['index'] == {b'video-1': ((0, 5),), b'video-2': ((5, 8),)}
+
+def test_get_does_not_scan_the_ids(gallery, monkeypatch):
+    gallery.add('video-1', _embeddings(1, 3))
+    gallery.refresh()
+
+    def scan(*args, **kwargs):
+        raise AssertionError('ids were indexed again')
+    monkeypatch.setattr(face_gallery, '_index_rows', scan)
+
+    np.testing.assert_array_equal(gallery.get('video-1'), _embeddings(1, 3))
+
+def test_remove_and_compact(gallery):
+    gallery.add('video-1', _embeddings(1, 3))
+    gallery.add('video-2', _embeddings(2, 2))
+    gallery.remove(['video-1', 'video-unknown'])
+
+    assert gallery.get('video-1') is None
+    assert gallery.stats() == {'generation': 0, 'rows': 5, 'deleted_rows': 3}
+
+    assert gallery.compact() == 3
+    assert gallery.stats() == {'generation': 1, 'rows': 2, 'deleted_rows': 0}
+    np.testing.assert_array_equal(gallery.get('video-2'), _embeddings(2, 2))
+    assert gallery.refresh()['index'] == {b'video-2': ((0, 2),)}
+
+def test_manifest_of_another_model_starts_a_new_generation(gallery, monkeypatch):
+    gallery.add('video-1', _embeddings(1, 3))
+
+    monkeypatch.setattr(face_gallery, 'FACE_EMBEDDING_MODEL', '/models/other.onnx')
+    gallery.add('video-2', _embeddings(2, 2))
+
+    assert gallery.get('video-1') is None
+    assert gallery.stats() == {'generation': 1, 'rows': 2, 'deleted_rows': 0}
+
+def test_enroll_stores_the_embeddings_verification_uses(tmp_path, sample_video_path, recognizer):
+    faces = extract_face_data(sample_video_path)
+
+    assert enroll_faces(str(tmp_path), 'video-1', faces)
+
+    np.testing.assert_array_equal(get_enrolled_embeddings(str(tmp_path), 'video-1'),
+                                  compute_face_embeddings(faces['crops']))
+
+def test_without_the_model_the_gallery_is_not_used(tmp_path, sample_video_path, no_recognizer):
+    faces = extract_face_data(sample_video_path)
+
+    assert not enroll_faces(str(tmp_path), 'video-1', faces)
+    assert get_enrolled_embeddings(str(tmp_path), 'video-1') is None
+    assert not (tmp_path / GALLERY_DIR).exists()
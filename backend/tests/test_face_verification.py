@@ -0,0 +1,89 @@
+import types
+
+import numpy as np
+import pytest
+
+import app.services.face_verification as face_verification
+from app.services.face_verification import verify_faces, extract_face_data, compute_face_embeddings, EMBEDDING_DIM
+from app.services.application_pipeline import _run_decision_node
+
+TERMS = {'loan_amount': 500000, 'credit_score': 760, 'monthly_income': 90000}
+
+@pytest.fixture
+def faces(sample_video_path):
+    faces = extract_face_data(sample_video_path)
+    assert len(faces['crops'])
+    return faces
+
+def _deepface(verified):
+    return types.SimpleNamespace(verify=lambda **kwargs: {'verified': verified})
+
+def test_without_a_model_the_video_needs_review(sample_video_path, faces, no_recognizer):
+    result = verify_faces(sample_video_path, sample_video_path, baseline_faces=faces, new_faces=faces)
+
+    assert result == {'is_same_person': None, 'needs_review': True, 'method': None, 'similarity': None}
+
+def test_embeddings_match_the_same_face(sample_video_path, faces, recognizer):
+    result = verify_faces(sample_video_path, sample_video_path, baseline_faces=faces, new_faces=faces)
+
+    assert result['is_same_person'] is True and result['needs_review'] is False
+    assert result['method'] == 'embedding'
+    assert result['similarity'] == pytest.approx(1.0)
+
+def test_embeddings_reject_another_face(sample_video_path, faces, recognizer):
+    other = dict(faces, crops=255 - faces['crops'])
+
+    result = verify_faces(sample_video_path, sample_video_path, baseline_faces=faces, new_faces=other)
+
+    assert result['is_same_person'] is False and result['needs_review'] is False
+    assert result['similarity'] < face_verification.FACE_EMBEDDING_THRESHOLD
+
+def test_given_baseline_embeddings_are_not_recomputed(sample_video_path, faces, recognizer):
+    baseline_embeddings = compute_face_embeddings(faces['crops'])
+    recognizer.calls = 0
+
+    result = verify_faces(sample_video_path, sample_video_path, baseline_faces=faces, new_faces=faces,
+                          baseline_embeddings=baseline_embeddings)
+
+    assert result['is_same_person'] is True
+    assert recognizer.calls == len(faces['crops'])
+
+def test_embeddings_have_unit_norm(faces, recognizer):
+    embeddings = compute_face_embeddings(faces['crops'])
+
+    assert embeddings.shape == (len(faces['crops']), EMBEDDING_DIM)
+    np.testing.assert_allclose(np.linalg.norm(embeddings, axis=1), 1.0, rtol=1e-5)
+
+def test_no_face_to_compare_needs_review(sample_video_path, faces, recognizer):
+    no_face = dict(faces, crops=faces['crops'][:0])
+
+    result = verify_faces(sample_video_path, sample_video_path, baseline_faces=faces, new_faces=no_face)
+
+    assert result['needs_review'] is True
+    assert recognizer.calls == 0
+
+@pytest.mark.parametrize('verified', [True, False])
+def test_deepface_decides(sample_video_path, faces, monkeypatch, verified):
+    monkeypatch.setattr(face_verification, 'get_deepface', lambda: _deepface(verified))
+
+    result = verify_faces(sample_video_path, sample_video_path, baseline_faces=faces, new_faces=faces)
+
+    assert result['is_same_person'] is verified
+    assert result['method'] == 'deepface' and result['needs_review'] is False
+
+def test_unverified_face_holds_the_decision_for_review():
+    result = _run_decision_node(TERMS, {'face': {'is_same_person': None, 'needs_review': True}})
+
+    assert result['decision']['status'] == 'more_info'
+    assert 'Face verification needs manual review' in result['decision']['reasons']
+
+def test_failed_face_verification_holds_the_decision():
+    result = _run_decision_node(TERMS, {'face': {'is_same_person': False, 'needs_review': False}})
+
+    assert result['decision']['status'] == 'more_info'
+    assert 'Face verification failed' in result['decision']['reasons']
+
+def test_verified_face_keeps_the_decision():
+    result = _run_decision_node(TERMS, {'face': {'is_same_person': True, 'needs_review': False}})
+
+    assert result['decision']['status'] == 'approved'
@@ -0,0 +1,62 @@
+import io
+
+import pytest
+from flask import request, jsonify
+
+from app.utils.idempotency import idempotent
+
+@pytest.fixture
+def calls(app):
+    """Count the runs of an idempotent upload route added to the app"""
+    calls = []
+
+    def upload():
+        calls.append(request.form.get('type'))
+        if request.form.get('type') == 'fail':
+            return jsonify({'error': 'failed'}), 500
+        return jsonify({'run': len(calls)}), 201
+
+    app.add_url_rule('/test/upload', 'test_upload', idempotent('test-upload')(upload), methods=['POST'])
+    return calls
+
+def _post(client, key, content=b'document', doc_type='pan-front', client_ip='10.0.0.1'):
+    return client.post('/test/upload', data={'document': (io.BytesIO(content), 'doc.png'), 'type': doc_type},
+                       headers={'Idempotency-Key': key}, environ_base={'REMOTE_ADDR': client_ip})
+
+def test_retry_replays_the_response(client, calls):
+    first = _post(client, 'key-1')
+    retry = _post(client, 'key-1')
+
+    assert len(calls) == 1
+    assert retry.status_code == first.status_code == 201
+    assert retry.json == first.json
+    assert retry.headers['Idempotent-Replayed'] == 'true'
+
+def test_key_reused_for_another_file_is_rejected(client, calls):
+    _post(client, 'key-1')
+    response = _post(client, 'key-1', content=b'another document')
+
+    assert response.status_code == 422
+    assert len(calls) == 1
+
+def test_key_reused_for_other_fields_is_rejected(client, calls):
+    _post(client, 'key-1')
+    response = _post(client, 'key-1', doc_type='aadhaar-front')
+
+    assert response.status_code == 422
+
+def test_keys_are_separate_per_tenant(client, calls):
+    first = _post(client, 'key-1', client_ip='10.0.0.1')
+    other = _post(client, 'key-1', content=b'another document', client_ip='10.0.0.2')
+
+    assert len(calls) == 2
+    assert other.status_code == 201
+    assert 'Idempotent-Replayed' not in other.headers
+    assert first.json != other.json
+
+def test_server_errors_are_not_stored(client, calls):
+    _post(client, 'key-1', doc_type='fail')
+    response = _post(client, 'key-1', doc_type='fail')
+
+    assert response.status_code == 500
+    assert len(calls) == 2
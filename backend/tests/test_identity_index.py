@@ -0,0 +1,47 @@
+import json
+
+import app.services.document_processor as document_processor
+from app.services.identity_index import find_duplicates, record_identifiers
+from app.services.ocr_store import save_ocr_record
+
+KEY = 'test-key'
+AADHAAR = {'aadhaar_number': '234123412346'}
+PAN = {'pan_number': 'ABCPE1234F'}
+
+def test_duplicates_are_other_applications(db):
+    record_identifiers(db, KEY, AADHAAR, 'doc-1', 'app-1')
+    record_identifiers(db, KEY, AADHAAR, 'doc-2', 'app-2')
+    record_identifiers(db, KEY, AADHAAR, 'doc-3')
+
+    assert find_duplicates(db, KEY, AADHAAR, 'app-1') == {'aadhaar': ['app-2']}
+    assert find_duplicates(db, KEY, AADHAAR, 'app-3') == {'aadhaar': ['app-1', 'app-2']}
+
+def test_documents_without_an_application_are_not_checked(db):
+    record_identifiers(db, KEY, AADHAAR, 'doc-1')
+    record_identifiers(db, KEY, AADHAAR, 'doc-2', 'app-1')
+
+    assert find_duplicates(db, KEY, AADHAAR) == {}
+
+def _store_document(db, document_id, doc_type, extracted_data, is_valid=True, application_id=None):
+    ocr_record = {'attempts': [], 'source': 'image', 'pipeline_version': document_processor.OCR_PIPELINE_VERSION}
+    save_ocr_record(db, document_id, doc_type, ocr_record, 'text', is_valid, extracted_data)
+    if application_id:
+        db.execute('INSERT INTO application_documents (application_id, doc_type, document_id, extracted_data)'
+                   ' VALUES (?, ?, ?, ?)', (application_id, doc_type, document_id, json.dumps(extracted_data)))
+        db.commit()
+
+def test_rebuild_indexes_stored_documents_without_ocr(app, db, monkeypatch):
+    def no_ocr(*args, **kwargs):
+        raise AssertionError('stored documents must not be OCRed again')
+    monkeypatch.setattr(document_processor, 'run_ocr', no_ocr)
+    _store_document(db, 'doc-1', 'aadhaar-front', AADHAAR, application_id='app-1')
+    _store_document(db, 'doc-2', 'pan-front', PAN)
+    _store_document(db, 'doc-3', 'pan-front', {'pan_number': 'ABCPE1234G'}, is_valid=False)
+    app.config['IDENTITY_HMAC_KEY'] = KEY
+
+    result = app.test_cli_runner().invoke(args=['rebuild-identity-index', '--workers', '1'])
+
+    assert result.exit_code == 0, result.output
+    rows = db.execute('SELECT identifier_type, document_id, application_id FROM identity_index'
+                      ' ORDER BY document_id').fetchall()
+    assert [tuple(row) for row in rows] == [('aadhaar', 'doc-1', 'app-1'), ('pan', 'doc-2', None)]
@@ -0,0 +1,85 @@
+import os
+
+import cv2
+import numpy as np
+import pytest
+import pytesseract
+
+from app.utils.image_processing import detect_orientation, normalize_document_image, measure_text_lines
+
+UPLOADS = os.path.join(os.path.dirname(__file__), '..', 'static', 'uploads')
+SAMPLES = {
+    'card-photo': '4018416e-0899-4598-bbda-8b531b9ff4d6_20250319_121639_IMG_2245.png',
+    'card-scan': '0bdaeb93-92db-44e4-96fc-2a11e29a7da2_20250319_113439_WhatsApp_Image_2025-03-18_at_22.26.29.png',
+    'tax-form': '13d91967-98e4-4771-864e-bfcbe00d1b5f_20250319_115325_Screenshot_2025-03-19_at_10.22.29_AM.png',
+}
+TILTS = [0, 3, -3, 7, -7, 10, -10]
+SIDEWAYS = {90: cv2.ROTATE_90_CLOCKWISE, 270: cv2.ROTATE_90_COUNTERCLOCKWISE}
+
+@pytest.fixture(autouse=True)
+def without_osd(monkeypatch):
+    """Tesseract's orientation detection is not installed everywhere; test the fallback"""
+    def fail(*args, **kwargs):
+        raise pytesseract.TesseractNotFoundError()
+    monkeypatch.setattr(pytesseract, 'image_to_osd', fail)
+
+def _text_page():
+    """A page of printed lines"""
+    page = np.full((1100, 850), 255, np.uint8)
+    words = 'Income tax return acknowledgement assessment year total income PAN'.split()
+    for line, y in enumerate(range(80, 1050, 38)):
+        x = 60
+        for word in words[line % 3:] + words[:line % 3]:
+            if x > 700:
+                break
+            cv2.putText(page, word, (x, y), cv2.FONT_HERSHEY_SIMPLEX, 0.8, 0, 2)
+            x += len(word) * 17 + 18
+    return page
+
+def _load(name):
+    if name == 'page':
+        return _text_page()
+    return cv2.cvtColor(cv2.imread(os.path.join(UPLOADS, SAMPLES[name])), cv2.COLOR_BGR2GRAY)
+
+def _tilt(gray, angle):
+    h, w = gray.shape
+    matrix = cv2.getRotationMatrix2D((w / 2, h / 2), angle, 1.0)
+    return cv2.warpAffine(gray, matrix, (w, h), borderMode=cv2.BORDER_REPLICATE)
+
+@pytest.mark.parametrize('name', ['page', 'card-photo', 'card-scan', 'tax-form'])
+@pytest.mark.parametrize('tilt', TILTS)
+def test_upright_pages_are_not_turned(name, tilt):
+    assert detect_orientation(_tilt(_load(name), tilt)) == (0, 'text_lines')
+
+@pytest.mark.parametrize('name', ['page', 'card-photo', 'card-scan', 'tax-form'])
+@pytest.mark.parametrize('tilt', TILTS)
+@pytest.mark.parametrize('turn', [90, 270])
+def test_pages_on_their_side_are_detected(name, tilt, turn):
+    # Without OSD, 90 and 270 can't be told apart; the OCR attempts also try the other way up
+    rotation, _ = detect_orientation(cv2.rotate(_tilt(_load(name), tilt), SIDEWAYS[turn]))
+
+    assert rotation == 90
+
+@pytest.mark.parametrize('scale', [0.25, 0.5, 2])
+def test_orientation_holds_at_other_sizes(scale):
+    card = cv2.resize(_load('card-scan'), None, fx=scale, fy=scale)
+
+    assert detect_orientation(card)[0] == 0
+    assert detect_orientation(cv2.rotate(card, cv2.ROTATE_90_CLOCKWISE))[0] == 90
+
+def test_blank_page_is_left_alone():
+    assert measure_text_lines(np.full((600, 400), 255, np.uint8)) == (0.0, 0.0)
+    assert detect_orientation(np.full((600, 400), 255, np.uint8))[0] == 0
+
+def test_normalize_turns_a_sideways_card_upright():
+    card = cv2.imread(os.path.join(UPLOADS, SAMPLES['card-photo']))
+    image, info = normalize_document_image(cv2.rotate(card, cv2.ROTATE_90_COUNTERCLOCKWISE))
+
+    assert info['rotation'] == 90 and info['orientation_source'] == 'text_lines'
+    assert image.shape[1] > image.shape[0]
+
+def test_normalize_straightens_a_tilted_page():
+    image, info = normalize_document_image(cv2.cvtColor(_tilt(_text_page(), 5), cv2.COLOR_GRAY2BGR))
+
+    assert info['rotation'] == 0
+    assert info['skew'] == pytest.approx(-5, abs=1)
@@ -0,0 +1,115 @@
+import io
+import json
+
+import cv2
+import pytest
+
+from app.routes.video_routes import live_verification
+from app.utils.admission import acquire, release, connect_admission_db
+
+class FakeWebSocket:
+    """Stand-in for a flask-sock connection: plays messages, records what is sent"""
+
+    def __init__(self, messages, on_receive=None):
+        self.messages = list(messages)
+        self.sent = []
+        self.on_receive = on_receive
+
+    def receive(self, timeout=None):
+        if self.on_receive is not None:
+            self.on_receive()
+        return self.messages.pop(0) if self.messages else None
+
+    def send(self, message):
+        self.sent.append(json.loads(message))
+
+@pytest.fixture
+def frames(sample_video_path):
+    """JPEG frames of the sample video"""
+    capture = cv2.VideoCapture(sample_video_path)
+    frames = []
+    while len(frames) < 10:
+        ok, frame = capture.read()
+        if not ok:
+            break
+        frames.append(cv2.imencode('.jpg', frame)[1].tobytes())
+    capture.release()
+    return frames
+
+def _run(app, ws, query=''):
+    with app.test_request_context(f'/api/video/live{query}'):
+        live_verification(ws)
+    return ws.sent
+
+def _face_stats():
+    admission_db = connect_admission_db()
+    stats = admission_db.execute('SELECT admitted, completed FROM admission_stats WHERE workload = ?',
+                                 ('face',)).fetchone()
+    admission_db.close()
+    return stats['admitted'], stats['completed']
+
+@pytest.fixture
+def baseline_video_id(client, sample_video):
+    response = client.post('/api/video/upload', data={'video': (io.BytesIO(sample_video), 'baseline.webm')},
+                           content_type='multipart/form-data')
+    assert response.status_code == 201
+    return response.json['video_id']
+
+def test_verdict_without_the_model_reports_presence_only(app, frames, no_recognizer):
+    verdict = _run(app, FakeWebSocket(frames))[-1]
+
+    assert verdict['type'] == 'verdict'
+    assert verdict['face_present'] is True
+    assert verdict['is_same_person'] is None and verdict['similarity'] is None
+
+def test_verdict_matches_the_baseline(app, frames, recognizer, baseline_video_id):
+    sent = _run(app, FakeWebSocket(frames), f'?baseline_video_id={baseline_video_id}')
+
+    assert all(message['type'] == 'frame' for message in sent[:-1])
+    assert all(message['similarity'] is not None for message in sent[:-1] if message['good'])
+    verdict = sent[-1]
+    assert verdict['face_present'] is True
+    assert verdict['is_same_person'] is True
+    assert verdict['similarity'] > 0.9
+
+def test_unknown_baseline_is_refused(app, frames, recognizer):
+    sent = _run(app, FakeWebSocket(frames), '?baseline_video_id=unknown')
+
+    assert sent == [{'type': 'error', 'error': 'Baseline video not found'}]
+
+def test_each_frame_takes_a_face_slot(app, frames):
+    sent = _run(app, FakeWebSocket(frames))
+
+    with app.app_context():
+        assert _face_stats() == (len(sent) - 1, len(sent) - 1)
+
+def test_idle_socket_holds_no_slot(app, frames):
+    running = []
+
+    def count_running():
+        with app.app_context():
+            admission_db = connect_admission_db()
+            running.append(admission_db.execute('SELECT COUNT(*) FROM admission_tickets').fetchone()[0])
+            admission_db.close()
+
+    _run(app, FakeWebSocket(frames, count_running))
+
+    assert running and set(running) == {0}
+
+def test_frames_without_a_face_slot_are_dropped(app, frames):
+    app.config['ADMISSION_LIMITS']['face'] = {'concurrency': 1, 'queue_size': 0,
+                                              'tenant_queue_size': 0, 'max_wait': 1}
+    ws = FakeWebSocket(frames)
+    with app.test_request_context('/api/video/live'):
+        admission_db = connect_admission_db()
+        ticket = acquire(admission_db, 'face', 'other-tenant')
+        try:
+            live_verification(ws)
+        finally:
+            release(admission_db, 'face', ticket)
+            admission_db.close()
+
+    errors, verdict = ws.sent[:-1], ws.sent[-1]
+    assert len(errors) == len(frames)
+    assert all(message['type'] == 'error' and message['retry_after'] >= 1 for message in errors)
+    assert verdict['face_present'] is False and verdict['good_frames'] == 0
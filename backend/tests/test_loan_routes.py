@@ -0,0 +1,46 @@
+import pytest
+
+APPLICANT = {'monthly_income': 90000, 'existing_emis': 5000, 'credit_score': 760}
+
+def test_decision(client):
+    response = client.post('/api/loan/decision', json={**APPLICANT, 'loan_amount': 500000, 'tenure_months': 36})
+
+    assert response.status_code == 200
+    assert response.json['decision']['status'] == 'approved'
+    assert response.json['decision']['tenureMonths'] == 36
+
+@pytest.mark.parametrize('fields', [
+    {'monthly_income': 0},
+    {'monthly_income': -1},
+    {'tenure_months': 12.5},
+    {'tenure_months': 0},
+    {'credit_score': 'Infinity'},
+])
+def test_decision_rejects_invalid_terms(client, fields):
+    response = client.post('/api/loan/decision', json={**APPLICANT, 'loan_amount': 500000, **fields})
+
+    assert response.status_code == 400
+
+def test_scenarios(client):
+    response = client.post('/api/loan/scenarios', json={**APPLICANT, 'amounts': [100000, 500000],
+                                                        'tenures': [12, 36], 'rates': [10, 12]})
+
+    assert response.status_code == 200
+    assert len(response.json['scenarios']) == 8
+    assert 'Infinity' not in response.get_data(as_text=True)
+    assert all(scenario['tenure_months'] in (12, 36) for scenario in response.json['scenarios'])
+
+@pytest.mark.parametrize('fields', [
+    {'monthly_income': 0},
+    {'tenures': [12, 18.5]},
+    {'tenures': []},
+])
+def test_scenarios_reject_invalid_inputs(client, fields):
+    response = client.post('/api/loan/scenarios', json={**APPLICANT, 'amounts': [100000], 'tenures': [12], **fields})
+
+    assert response.status_code == 400
+
+def test_emi_rejects_fractional_tenure(client):
+    response = client.post('/api/loan/emi', json={'principal': 100000, 'annual_rate': 10, 'tenure_months': 6.5})
+
+    assert response.status_code == 400
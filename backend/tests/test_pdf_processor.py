@@ -0,0 +1,84 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import app.services.document_processor as document_processor
+import app.services.pdf_processor as pdf_processor
+from app.services.pdf_processor import extract_pdf_text
+
+pytest.importorskip('pypdfium2')
+
+def _write_pdf(path, pages):
+    """
+    Write a PDF with a text layer page for each string in pages, and a blank
+    (scanned) page for each int, that int being the page width in points
+    """
+    objects = ['<< /Type /Catalog /Pages 2 0 R >>', None,
+               '<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>']
+    page_ids = []
+    for page in pages:
+        if isinstance(page, str):
+            stream = f'BT /F1 12 Tf 72 720 Td ({page}) Tj ET'
+            width = 612
+        else:
+            stream, width = '', page
+        objects.append(f'<< /Length {len(stream)} >>\nstream\n{stream}\nendstream')
+        objects.append(f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {width} 792] '
+                       f'/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>')
+        page_ids.append(len(objects))
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(f'{i} 0 R' for i in page_ids)}] /Count {len(page_ids)} >>"
+
+    content = b'%PDF-1.4\n'
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(content))
+        content += f'{number} 0 obj\n{body}\nendobj\n'.encode('latin-1')
+    xref = len(content)
+    content += f'xref\n0 {len(objects) + 1}\n0000000000 65535 f \n'.encode('latin-1')
+    content += ''.join(f'{offset:010d} 00000 n \n' for offset in offsets).encode('latin-1')
+    content += f'trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n'.encode('latin-1')
+    path.write_bytes(content)
+    return str(path)
+
+@pytest.fixture
+def ocr_calls(monkeypatch):
+    """OCR in threads, reading each scanned page as its width in pixels"""
+    calls = []
+
+    def run_ocr(image):
+        calls.append(image.shape[1])
+        return f'scanned page {image.shape[1]} wide', None
+
+    monkeypatch.setattr(document_processor, 'run_ocr', run_ocr)
+    monkeypatch.setattr(pdf_processor, '_get_page_pool', lambda: ThreadPoolExecutor(max_workers=2))
+    return calls
+
+TEXT = 'A page with a text layer of its own, number {}'
+
+def test_pages_are_merged_in_order(tmp_path, ocr_calls):
+    path = _write_pdf(tmp_path / 'mixed.pdf', [TEXT.format(1), 300, TEXT.format(3), 400, 500])
+
+    text, info = extract_pdf_text(path, dpi=72)
+
+    assert text.split('\n\n') == [TEXT.format(1), 'scanned page 300 wide', TEXT.format(3),
+                                  'scanned page 400 wide', 'scanned page 500 wide']
+    assert info == {'pages': 5, 'text_layer_pages': 2, 'ocr_pages': 3, 'truncated': False}
+    assert sorted(ocr_calls) == [300, 400, 500]
+
+def test_text_layer_pages_skip_ocr(tmp_path, ocr_calls):
+    path = _write_pdf(tmp_path / 'digital.pdf', [TEXT.format(1), TEXT.format(2)])
+
+    text, info = extract_pdf_text(path, dpi=72)
+
+    assert text == f'{TEXT.format(1)}\n\n{TEXT.format(2)}'
+    assert info['ocr_pages'] == 0 and ocr_calls == []
+
+def test_pages_past_the_limit_are_truncated(tmp_path, ocr_calls, monkeypatch):
+    monkeypatch.setattr(pdf_processor, 'MAX_PDF_PAGES', 2)
+    path = _write_pdf(tmp_path / 'long.pdf', [300, TEXT.format(2), 400])
+
+    text, info = extract_pdf_text(path, dpi=72)
+
+    assert text == f'scanned page 300 wide\n\n{TEXT.format(2)}'
+    assert info == {'pages': 2, 'text_layer_pages': 1, 'ocr_pages': 1, 'truncated': True}
+    assert ocr_calls == [300]
@@ -0,0 +1,167 @@
+import io
+import os
+import shutil
+
+import pytest
+
+boto3 = pytest.importorskip('boto3')
+from botocore.exceptions import ClientError
+
+from app.db import connect
+from app.services.storage import S3Storage, UPLOADS, VIDEOS
+from app.services.blob_store import store_blob, store_blob_file, resolve_upload, expire_references, collect_garbage
+
+CONTENT = b'%PDF-1.4 stored content'
+
+class StubS3Client:
+    """In-memory stand-in for the boto3 S3 client, with the calls S3Storage makes"""
+
+    def __init__(self):
+        self.objects = {}
+        self.uploads = []
+
+    def _missing(self, operation):
+        return ClientError({'Error': {'Code': '404', 'Message': 'Not Found'}}, operation)
+
+    def head_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise self._missing('HeadObject')
+        return {'ContentLength': len(self.objects[Key])}
+
+    def upload_file(self, path, Bucket, Key, Config=None):
+        with open(path, 'rb') as f:
+            self.objects[Key] = f.read()
+        self.uploads.append(Key)
+
+    def download_file(self, Bucket, Key, path, Config=None):
+        if Key not in self.objects:
+            raise self._missing('GetObject')
+        with open(path, 'wb') as f:
+            f.write(self.objects[Key])
+
+    def put_object(self, Bucket, Key, Body):
+        self.objects[Key] = Body
+
+    def get_object(self, Bucket, Key, Range=None):
+        if Key not in self.objects:
+            raise self._missing('GetObject')
+        if Range is None:
+            return {'Body': io.BytesIO(self.objects[Key])}
+        start, end = map(int, Range[len('bytes='):].split('-'))
+        return {'Body': io.BytesIO(self.objects[Key][start:end + 1])}
+
+    def list_objects_v2(self, Bucket, Prefix, MaxKeys=1000):
+        keys = sorted(key for key in self.objects if key.startswith(Prefix))[:MaxKeys]
+        return {'Contents': [{'Key': key} for key in keys]} if keys else {}
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop(Key, None)
+
+@pytest.fixture
+def client():
+    return StubS3Client()
+
+@pytest.fixture
+def other_db(tmp_path):
+    """Database of a second node"""
+    db = connect(str(tmp_path / 'other.sqlite'))
+    yield db
+    db.close()
+
+def _node(tmp_path, name, client):
+    """Storage of one node: its own cache folders, the shared bucket"""
+    folders = {UPLOADS: str(tmp_path / name / 'uploads'), VIDEOS: str(tmp_path / name / 'videos')}
+    storage = S3Storage(folders, 'loanly', region='us-east-1')
+    storage.client = client
+    return storage
+
+def _expire(db, storage):
+    """Expire every reference of a node"""
+    db.execute('UPDATE blob_refs SET created_at = \'2000-01-01\'')
+    db.commit()
+    return expire_references(db, storage, 1)
+
+def _collect(db, storage, key):
+    """Drop every reference of a node and collect a blob"""
+    _expire(db, storage)
+    db.execute('UPDATE blobs SET last_referenced_at = \'2000-01-01\' WHERE path = ?', (key,))
+    db.commit()
+    return collect_garbage(db, storage, grace_seconds=0)
+
+def test_exists_asks_the_bucket(tmp_path, client):
+    storage = _node(tmp_path, 'a', client)
+    os.makedirs(os.path.join(storage.folders[UPLOADS], 'blobs'))
+    with open(storage.local_file('uploads/blobs/cached.pdf'), 'wb') as f:
+        f.write(CONTENT)
+
+    assert storage.is_cached('uploads/blobs/cached.pdf')
+    assert not storage.exists('uploads/blobs/cached.pdf')
+
+def test_same_content_is_uploaded_once(tmp_path, client, db):
+    node_a, node_b = _node(tmp_path, 'a', client), _node(tmp_path, 'b', client)
+
+    key, existed = store_blob(db, node_a, UPLOADS, 'doc-1', 'a.pdf', io.BytesIO(CONTENT))
+    assert not existed
+    key_b, existed = store_blob(db, node_b, UPLOADS, 'doc-2', 'b.pdf', io.BytesIO(CONTENT))
+
+    assert existed and key_b == key
+    assert client.uploads == [key]
+
+def test_stale_cache_does_not_skip_upload(tmp_path, client, db):
+    node_a, node_b = _node(tmp_path, 'a', client), _node(tmp_path, 'b', client)
+    key, _ = store_blob(db, node_a, UPLOADS, 'doc-1', 'a.pdf', io.BytesIO(CONTENT))
+
+    # Collected by another node: the object is gone, node a still has its copy
+    assert _collect(db, node_b, key) == (1, len(CONTENT))
+    assert key not in client.objects and node_a.is_cached(key)
+
+    key_again, existed = store_blob(db, node_a, UPLOADS, 'doc-2', 'a.pdf', io.BytesIO(CONTENT))
+
+    assert key_again == key and not existed
+    assert client.objects[key] == CONTENT
+    assert node_b.read_range(key, 0, 4) == b'%PDF'
+
+def test_stale_cache_does_not_skip_file_upload(tmp_path, client, db):
+    node_a, node_b = _node(tmp_path, 'a', client), _node(tmp_path, 'b', client)
+    key, _ = store_blob(db, node_a, VIDEOS, 'video-1', 'a.webm', io.BytesIO(CONTENT))
+    _collect(db, node_b, key)
+
+    source = tmp_path / 'a' / 'videos' / 'upload.partial'
+    source.write_bytes(CONTENT)
+    _, existed = store_blob_file(db, node_a, VIDEOS, 'video-2', 'a.webm', str(source))
+
+    assert not existed
+    assert client.objects[key] == CONTENT
+    assert not source.exists()
+
+def test_local_path_downloads_once(tmp_path, client, db):
+    node_a, node_b = _node(tmp_path, 'a', client), _node(tmp_path, 'b', client)
+    key, _ = store_blob(db, node_a, UPLOADS, 'doc-1', 'a.pdf', io.BytesIO(CONTENT))
+    shutil.rmtree(node_b.folders[UPLOADS], ignore_errors=True)
+
+    path = node_b.local_path(key)
+    with open(path, 'rb') as f:
+        assert f.read() == CONTENT
+    assert node_b.is_cached(key)
+
+def test_upload_resolves_on_another_node(tmp_path, client, db, other_db):
+    node_a, node_b = _node(tmp_path, 'a', client), _node(tmp_path, 'b', client)
+    key, _ = store_blob(db, node_a, UPLOADS, 'doc-1', 'a.pdf', io.BytesIO(CONTENT))
+
+    assert resolve_upload(other_db, node_b, UPLOADS, 'doc-1') == key
+    assert resolve_upload(other_db, node_b, UPLOADS, 'doc-unknown') is None
+
+def test_content_referenced_by_another_node_is_kept(tmp_path, client, db, other_db):
+    node_a, node_b = _node(tmp_path, 'a', client), _node(tmp_path, 'b', client)
+    key, _ = store_blob(db, node_a, UPLOADS, 'doc-1', 'a.pdf', io.BytesIO(CONTENT))
+    store_blob(other_db, node_b, UPLOADS, 'doc-2', 'b.pdf', io.BytesIO(CONTENT))
+
+    assert _expire(db, node_a) == ['doc-1']
+    assert _collect(db, node_a, key) == (0, 0)
+    assert resolve_upload(db, node_a, UPLOADS, 'doc-1') is None
+    assert resolve_upload(db, node_a, UPLOADS, 'doc-2') == key
+
+    assert _expire(other_db, node_b) == ['doc-2']
+    assert _collect(other_db, node_b, key) == (1, len(CONTENT))
+    assert key not in client.objects
+    assert not [name for name in client.objects if '/refs/' in name]
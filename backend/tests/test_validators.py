@@ -0,0 +1,75 @@
+import pandas as pd
+import pytest
+
+from app.utils.validators import (
+    verhoeff_checksum_valid, is_valid_aadhaar_number, is_valid_pan_number, validate_document_data
+)
+from app.services.batch_underwriting import verhoeff_valid
+
+VALID_AADHAAR = ['234123412346', '499118665246', '999941057058']
+INVALID_AADHAAR = [
+    '234123412347',   # wrong check digit
+    '234123412364',   # last two digits swapped
+    '123412341234',   # starts with 1
+    '034123412346',   # starts with 0
+    '23412341234',    # 11 digits
+    '2341 2341 2346', # not stripped
+    '23412341234A',
+    '',
+    None,
+]
+
+VALID_PAN = ['ABCPE1234F', 'AAACB1234C', 'AAATT0001Z']
+INVALID_PAN = [
+    'ABCXE1234F',     # X is not a holder type
+    'abcpe1234f',
+    'ABCPE1234',
+    'ABCP01234F',
+    'ABCPE12345',
+    '',
+    None,
+]
+
+@pytest.mark.parametrize('number, valid', [('2363', True), ('2364', False), ('123451', True), ('123456', False)])
+def test_verhoeff_reference_vectors(number, valid):
+    assert verhoeff_checksum_valid(number) is valid
+
+@pytest.mark.parametrize('aadhaar', VALID_AADHAAR)
+def test_valid_aadhaar_numbers(aadhaar):
+    assert is_valid_aadhaar_number(aadhaar)
+
+@pytest.mark.parametrize('aadhaar', INVALID_AADHAAR)
+def test_invalid_aadhaar_numbers(aadhaar):
+    assert not is_valid_aadhaar_number(aadhaar)
+
+def test_every_single_digit_error_is_caught():
+    number = VALID_AADHAAR[0]
+    for position in range(1, 12):
+        for digit in '0123456789':
+            if digit != number[position]:
+                assert not is_valid_aadhaar_number(number[:position] + digit + number[position + 1:])
+
+def test_batch_checksum_matches_the_single_one():
+    numbers = pd.Series(VALID_AADHAAR + ['234123412347', '234123412364'])
+
+    assert list(verhoeff_valid(numbers)) == [verhoeff_checksum_valid(number) for number in numbers]
+
+@pytest.mark.parametrize('pan', VALID_PAN)
+def test_valid_pan_numbers(pan):
+    assert is_valid_pan_number(pan)
+
+@pytest.mark.parametrize('pan', INVALID_PAN)
+def test_invalid_pan_numbers(pan):
+    assert not is_valid_pan_number(pan)
+
+def test_document_validation_reports_a_bad_checksum():
+    result = validate_document_data('aadhaar', {'aadhaar_number': '234123412347', 'name': 'RAVI KUMAR'})
+
+    assert result['valid'] is False
+    assert result['errors'] == ['Invalid Aadhaar number checksum']
+
+def test_document_validation_reports_a_bad_holder_type():
+    result = validate_document_data('pan', {'pan_number': 'ABCXE1234F', 'name': 'RAVI KUMAR'})
+
+    assert result['valid'] is False
+    assert result['errors'] == ['Invalid PAN holder type']